@@ -0,0 +1,116 @@
+"""
+Generates synthetic dialer exports shaped like the ones the IVR Data Cleaner receives.
+
+The first line is a report title, the header sits on the second line, and
+answered calls carry one 'FlowNo_N=M' field per answered question after
+'UserKeyPress', so rows are ragged. Calls nobody picked up leave 'UserKeyPress'
+empty, and some numbers are dialed more than once.
+
+Usage:
+    python benchmarks/ivr_data_generator.py --rows 1000000 --output ivr_1m.csv
+"""
+import argparse
+import re
+
+import numpy as np
+import pandas as pd
+
+HEADER = ['No', 'PhoneNo', 'CallDate', 'CallTime', 'Duration', 'Status', 'UserKeyPress']
+
+# Rows generated and written at a time, so 10M-row exports fit in memory.
+GENERATE_CHUNK_ROWS = 200_000
+
+def generate_script_text(questions=10, answers_per_question=5):
+    """
+    Generates a questionnaire script in the text format the pages parse.
+
+    Parameters:
+    - questions (int): Number of questions.
+    - answers_per_question (int): Number of answers per question.
+
+    Returns:
+    - str: The script, with answers of question N decoding 'FlowNo_{N+1}=M'.
+    """
+    lines = []
+    for q in range(1, questions + 1):
+        lines.append(f"{q}. Question {q}?")
+        lines.extend(f"   - Answer {q}.{a}" for a in range(1, answers_per_question + 1))
+    return "\n".join(lines) + "\n"
+
+def _generate_chunk(rng, start, rows, questions, answers_per_question, pickup_rate, complete_rate, redial_rate, phone_pool):
+    phones = 60100000000 + rng.integers(0, phone_pool, rows)
+    # Redials reuse a number dialed earlier in the chunk
+    redials = rng.random(rows) < redial_rate
+    phones[redials] = phones[rng.integers(0, rows, int(redials.sum()))]
+
+    picked_up = rng.random(rows) < pickup_rate
+    completed = picked_up & (rng.random(rows) < complete_rate)
+    answered = np.where(completed, questions, np.where(picked_up, rng.integers(1, max(questions, 2), rows), 0))
+
+    fields = {
+        'No': np.arange(start + 1, start + rows + 1),
+        'PhoneNo': phones,
+        'CallDate': '2024-01-01',
+        'CallTime': '19:00:00',
+        'Duration': rng.integers(0, 300, rows),
+        'Status': np.where(picked_up, 'Answered', 'NoAnswer'),
+    }
+    for q in range(questions):
+        # Index 0 stands for an unanswered question
+        tokens = np.array([''] + [f'FlowNo_{q + 2}={a}' for a in range(1, answers_per_question + 1)], dtype=object)
+        codes = np.where(answered > q, rng.integers(1, answers_per_question + 1, rows), 0)
+        fields[f'Q{q}'] = tokens[codes]
+
+    text = pd.DataFrame(fields).to_csv(index=False, header=False, lineterminator='\n')
+    # Dialer exports end a row after its last answer rather than padding it
+    return re.sub(r',+$', '', text, flags=re.MULTILINE)
+
+def generate_ivr_export(path, rows, questions=10, answers_per_question=5, pickup_rate=0.4,
+                        complete_rate=0.6, redial_rate=0.05, seed=0):
+    """
+    Writes a synthetic dialer export.
+
+    Parameters:
+    - path (str): Where to write the CSV file.
+    - rows (int): Number of calls.
+    - questions (int): Number of questions in the survey.
+    - answers_per_question (int): Number of answers per question.
+    - pickup_rate (float): Fraction of calls with at least one keypress.
+    - complete_rate (float): Fraction of picked up calls that answer every question.
+    - redial_rate (float): Fraction of calls to a number already dialed.
+    - seed (int): Seed of the random generator; the same arguments give the same file.
+
+    Returns:
+    - str: The path of the written file.
+    """
+    rng = np.random.default_rng(seed)
+    phone_pool = max(rows * 2, 1)
+    with open(path, 'w', newline='') as f:
+        f.write("Broadcast List Report for SYNTHETIC BENCHMARK CAMPAIGN" + "," * (len(HEADER) - 1) + "\n")
+        f.write(",".join(HEADER) + "\n")
+        for start in range(0, rows, GENERATE_CHUNK_ROWS):
+            f.write(_generate_chunk(rng, start, min(GENERATE_CHUNK_ROWS, rows - start), questions,
+                                    answers_per_question, pickup_rate, complete_rate, redial_rate, phone_pool))
+    return path
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument('--rows', type=int, default=10_000)
+    parser.add_argument('--questions', type=int, default=10)
+    parser.add_argument('--answers-per-question', type=int, default=5)
+    parser.add_argument('--pickup-rate', type=float, default=0.4)
+    parser.add_argument('--complete-rate', type=float, default=0.6)
+    parser.add_argument('--redial-rate', type=float, default=0.05)
+    parser.add_argument('--seed', type=int, default=0)
+    parser.add_argument('--output', required=True)
+    parser.add_argument('--script-output', help="Also write the matching questionnaire script here.")
+    args = parser.parse_args()
+
+    generate_ivr_export(args.output, args.rows, args.questions, args.answers_per_question,
+                        args.pickup_rate, args.complete_rate, args.redial_rate, args.seed)
+    if args.script_output:
+        with open(args.script_output, 'w') as f:
+            f.write(generate_script_text(args.questions, args.answers_per_question))
+
+if __name__ == '__main__':
+    main()
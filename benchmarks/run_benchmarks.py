@@ -0,0 +1,200 @@
+"""
+Times and memory-profiles the cleaning and decoding pipeline of the Streamlit app
+on synthetic dialer exports, and writes the results as JSON.
+
+Every scenario is timed over --repeat runs, then run once more under
+tracemalloc to record its peak Python/NumPy allocation. Generated exports are
+kept in --data-dir, so later runs with the same parameters reuse them.
+
+Usage:
+    python benchmarks/run_benchmarks.py --sizes 10000 100000 1000000 --output results.json
+"""
+import argparse
+import gc
+import json
+import os
+import platform
+import statistics
+import subprocess
+import sys
+import tempfile
+import time
+import tracemalloc
+from datetime import datetime
+
+import numpy as np
+import pandas as pd
+
+try:
+    import resource
+except ImportError:  # Windows
+    resource = None
+
+REPO_ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, os.path.join(REPO_ROOT, 'mainapp'))
+sys.path.insert(0, os.path.dirname(os.path.abspath(__file__)))
+
+from ivr_data_generator import generate_ivr_export, generate_script_text
+from modules.data_cleaner_utils_page1 import CHUNK_SIZE, process_file, read_ivr_csv, merger
+from modules.validation_utils import validate_ivr_results
+from modules.questionnaire_utils_page2 import rename_columns
+from modules.keypress_decoder_utils_page3 import parse_text_to_json, custom_sort, flatten_json_structure, decode_keypresses, drop_duplicates_from_dataframe, profile_columns
+
+# Number of exports merged in the merger scenario, as in a multi-file upload.
+MERGE_FILE_COUNT = 4
+
+def measure(func, repeat):
+    """
+    Times a function and records its peak traced allocation.
+
+    Parameters:
+    - func (callable): The scenario, called without arguments.
+    - repeat (int): Number of timed runs.
+
+    Returns:
+    - dict: The run times in seconds, their minimum and median, and the peak traced memory in MB.
+    """
+    times = []
+    for _ in range(repeat):
+        gc.collect()
+        start = time.perf_counter()
+        func()
+        times.append(time.perf_counter() - start)
+
+    gc.collect()
+    tracemalloc.start()
+    try:
+        func()
+        _, peak = tracemalloc.get_traced_memory()
+    finally:
+        tracemalloc.stop()
+
+    return {
+        'times_s': [round(t, 6) for t in times],
+        'min_s': round(min(times), 6),
+        'median_s': round(statistics.median(times), 6),
+        'peak_traced_mb': round(peak / 2**20, 3),
+    }
+
+def build_scenarios(export_path, questions, answers_per_question):
+    """
+    Prepares the inputs of every scenario from one export, outside of the timings.
+
+    Parameters:
+    - export_path (str): Path of a synthetic dialer export.
+    - questions (int): Number of questions in the export.
+    - answers_per_question (int): Number of answers per question.
+
+    Returns:
+    - dict: {scenario name: (callable, number of input rows)}.
+    """
+    df_complete, phonenum_list, _, _, _, _ = process_file(export_path)
+    df_results = read_ivr_csv(export_path).drop_duplicates(subset=['PhoneNo'])
+    new_column_names = ['phonenum'] + [f'Question {q}' for q in range(1, len(df_complete.columns) - 1)] + ['Set']
+    renamed = rename_columns(df_complete, new_column_names)
+
+    simple_mappings = flatten_json_structure(parse_text_to_json(generate_script_text(questions, answers_per_question)))
+    question_columns = list(renamed.columns[1:-1])
+    keypress_mappings = {col: simple_mappings for col in question_columns}
+    # Drop the last answer of the first question, as surveys do for screening questions
+    excluded_flow_nos = {question_columns[0]: [f'FlowNo_2={answers_per_question}']} if question_columns else {}
+    flow_labels = [f'FlowNo_{q + 2}={a}' for q in range(questions) for a in range(1, answers_per_question + 1)]
+    flow_labels = list(np.random.default_rng(0).permutation(flow_labels)) * 100
+
+    def order_columns():
+        sorted(renamed.columns, key=custom_sort)
+        sorted(flow_labels, key=custom_sort)
+
+    def decode():
+        drop_duplicates_from_dataframe(decode_keypresses(renamed, keypress_mappings, excluded_flow_nos))
+
+    decoded = decode_keypresses(renamed, keypress_mappings, excluded_flow_nos)
+
+    return {
+        'process_file': (lambda: process_file(export_path), None),
+        'process_file_chunked': (lambda: process_file(export_path, chunksize=CHUNK_SIZE), None),
+        'validate_ivr_results': (lambda: validate_ivr_results(df_results), len(df_results)),
+        'merger': (lambda: merger([df_complete] * MERGE_FILE_COUNT, [phonenum_list] * MERGE_FILE_COUNT), MERGE_FILE_COUNT * len(df_complete)),
+        'rename_columns': (lambda: rename_columns(df_complete, new_column_names), len(df_complete)),
+        'custom_sort_ordering': (order_columns, len(flow_labels)),
+        'decode_keypresses': (decode, len(renamed)),
+        'profile_columns': (lambda: profile_columns(decoded), len(decoded)),
+    }
+
+def export_for(data_dir, rows, args):
+    """Returns the path of the export for these parameters, generating it if needed."""
+    name = (f"ivr_{rows}_q{args.questions}_a{args.answers_per_question}_p{args.pickup_rate}"
+            f"_c{args.complete_rate}_r{args.redial_rate}_s{args.seed}.csv")
+    path = os.path.join(data_dir, name)
+    if not os.path.exists(path):
+        generate_ivr_export(path, rows, args.questions, args.answers_per_question, args.pickup_rate,
+                            args.complete_rate, args.redial_rate, args.seed)
+    return path
+
+def peak_rss_mb():
+    """Returns the peak resident memory of the whole run in MB, or None where it is not available."""
+    if resource is None:
+        return None
+    # ru_maxrss is in KB on Linux and in bytes on macOS
+    return round(resource.getrusage(resource.RUSAGE_SELF).ru_maxrss / (2**20 if sys.platform == 'darwin' else 2**10), 1)
+
+def environment():
+    """Describes the code and machine the results were measured on."""
+    try:
+        commit = subprocess.run(['git', 'rev-parse', 'HEAD'], cwd=REPO_ROOT, capture_output=True, text=True, check=True).stdout.strip()
+    except (OSError, subprocess.CalledProcessError):
+        commit = None
+    return {
+        'commit': commit,
+        'timestamp': datetime.now().isoformat(timespec='seconds'),
+        'python': platform.python_version(),
+        'pandas': pd.__version__,
+        'numpy': np.__version__,
+        'platform': platform.platform(),
+        'cpu_count': os.cpu_count(),
+    }
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument('--sizes', type=int, nargs='+', default=[10_000, 100_000])
+    parser.add_argument('--scenarios', nargs='+', help="Only run these scenarios.")
+    parser.add_argument('--repeat', type=int, default=3)
+    parser.add_argument('--questions', type=int, default=10)
+    parser.add_argument('--answers-per-question', type=int, default=5)
+    parser.add_argument('--pickup-rate', type=float, default=0.4)
+    parser.add_argument('--complete-rate', type=float, default=0.6)
+    parser.add_argument('--redial-rate', type=float, default=0.05)
+    parser.add_argument('--seed', type=int, default=0)
+    parser.add_argument('--data-dir', default=os.path.join(tempfile.gettempdir(), 'ivr_benchmark_data'))
+    parser.add_argument('--output', help="Write the JSON results here instead of to stdout.")
+    args = parser.parse_args()
+
+    os.makedirs(args.data_dir, exist_ok=True)
+    results = []
+    for rows in args.sizes:
+        export_path = export_for(args.data_dir, rows, args)
+        scenarios = build_scenarios(export_path, args.questions, args.answers_per_question)
+        for name, (func, input_rows) in scenarios.items():
+            if args.scenarios and name not in args.scenarios:
+                continue
+            print(f"{name} on {rows} rows...", file=sys.stderr)
+            result = {'scenario': name, 'rows': rows, 'input_rows': input_rows if input_rows is not None else rows}
+            result.update(measure(func, args.repeat))
+            result['rows_per_s'] = round(result['input_rows'] / result['min_s']) if result['min_s'] else None
+            results.append(result)
+
+    report = {
+        'environment': environment(),
+        'parameters': {key: value for key, value in vars(args).items() if key not in ('output', 'data_dir')},
+        'peak_rss_mb': peak_rss_mb(),
+        'results': results,
+    }
+    text = json.dumps(report, indent=2)
+    if args.output:
+        with open(args.output, 'w') as f:
+            f.write(text + "\n")
+    else:
+        print(text)
+
+if __name__ == '__main__':
+    main()
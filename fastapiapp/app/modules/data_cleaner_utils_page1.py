@@ -1,5 +1,181 @@
 import pandas as pd
 import numpy as np
+import csv
+import os
+from operator import methodcaller
+from app.modules.dispatch_utils import run_blocking_on_file
+from app.modules.perf_utils import stage
+from app.modules.validation_utils import validate_ivr_results, count_rejections
+
+# Block size used when scanning an upload for its widest row.
+SNIFF_BLOCK_SIZE = 1 << 20
+
+def _open_binary(uploaded_file):
+    """
+    Returns a binary file handle for the upload and whether the caller owns it.
+
+    Streamlit's UploadedFile and FastAPI's spooled files are used as-is; plain
+    paths are opened here and must be closed by the caller.
+    """
+    if hasattr(uploaded_file, 'read'):
+        return uploaded_file, False
+    return open(uploaded_file, 'rb'), True
+
+def _field_count(line):
+    """Counts the fields of a raw CSV line, ignoring trailing empty ones."""
+    line = line.rstrip(b'\r\n,')
+    if b'"' not in line:
+        return line.count(b',') + 1
+    # A quoted field may hold commas, which only the csv module skips
+    fields = next(csv.reader([line.decode('utf-8', errors='replace')]), [])
+    while fields and not fields[-1].strip():
+        fields.pop()
+    return max(len(fields), 1)
+
+def sniff_ivr_layout(uploaded_file):
+    """
+    Sniffs the layout of an IVR export without parsing it into a DataFrame.
+
+    The first line of a dialer export is junk and the real header sits on the
+    second line. Answered calls carry one extra field per question after
+    'UserKeyPress', so data rows are usually wider than the header; the whole
+    file is scanned once to find the widest row. Trailing empty fields are
+    ignored so that every column within the width holds data somewhere.
+    Commas are counted on the raw bytes, except on lines with quoted fields,
+    which are split by the csv module.
+
+    Parameters:
+    - uploaded_file: A path or a seekable binary file-like object.
+
+    Returns:
+    - header (list of str): The column names found on the second line.
+    - width (int): The number of fields in the widest line of the file.
+    """
+    handle, owned = _open_binary(uploaded_file)
+    try:
+        handle.seek(0)
+        handle.readline()  # Skip the junk first line
+        header_line = handle.readline().decode('utf-8-sig', errors='replace')
+        header = next(csv.reader([header_line]), [])
+        while header and not header[-1].strip():
+            header.pop()
+
+        width = len(header)
+        strip_trailing = methodcaller('rstrip', b'\r\n,')
+        tail = b''
+        while True:
+            block = handle.read(SNIFF_BLOCK_SIZE)
+            if not block:
+                break
+            lines = (tail + block).split(b'\n')
+            tail = lines.pop()  # The last line may continue in the next block
+            if not lines:
+                continue
+            if b'"' in block:
+                width = max(width, max(map(_field_count, lines)))
+            else:
+                width = max(width, max(line.count(b',') for line in map(strip_trailing, lines)) + 1)
+        if tail:
+            width = max(width, _field_count(tail))
+
+        handle.seek(0)
+    finally:
+        if owned:
+            handle.close()
+
+    return header, width
+
+def read_ivr_csv(uploaded_file):
+    """
+    Reads only the columns of an IVR export that the cleaner needs.
+
+    The header on the second line is sniffed first so that only 'PhoneNo' and
+    the 'UserKeyPress' onward columns are loaded, using the C engine and string
+    dtypes. Files given by path, as process workers get them, are memory-mapped
+    rather than read into a buffer. Trailing columns that have neither a header
+    name nor any data are dropped, mirroring the all-NA column drop of the
+    original reader.
+
+    Parameters:
+    - uploaded_file: A path or a seekable binary file-like object.
+
+    Returns:
+    - pd.DataFrame: 'PhoneNo', 'UserKeyPress' and the keypress columns that follow it.
+    """
+    with stage('header detection'):
+        header, width = sniff_ivr_layout(uploaded_file)
+
+    for required in ('PhoneNo', 'UserKeyPress'):
+        if required not in header:
+            raise ValueError(f"Column '{required}' was not found on the second line of the file.")
+    phone_idx = header.index('PhoneNo')
+    keypress_idx = header.index('UserKeyPress')
+    usecols = [phone_idx] + list(range(keypress_idx, width))
+    memory_map = isinstance(uploaded_file, (str, os.PathLike))
+
+    with stage('read') as record:
+        df = pd.read_csv(
+            uploaded_file,
+            skiprows=2,
+            header=None,
+            names=range(width),
+            usecols=usecols,
+            dtype=str,
+            engine='c',
+            memory_map=memory_map,
+        )
+        record['rows_out'] = len(df)
+
+    # Name columns from the header; the extra keypress fields keep their position
+    df.columns = [header[idx] if idx < len(header) and header[idx] else idx for idx in df.columns]
+    unnamed_empty = [col for col in df.columns if isinstance(col, int) and df[col].isna().all()]
+    return df.drop(columns=unnamed_empty)
+
+def merger(df_list, phonenum_list):
+    """
+    Concatenates lists of DataFrames and renames a column.
+
+    Parameters:
+    - df_list (list of pd.DataFrame): List of DataFrames to be concatenated vertically.
+    - phonenum_list (list of pd.DataFrame): List of phone number DataFrames to be concatenated vertically.
+
+    Returns:
+    - df_merge (pd.DataFrame): Concatenated DataFrame of df_list.
+    - phonenum_combined (pd.DataFrame): Concatenated DataFrame of phonenum_list with 'PhoneNo' column renamed to 'phonenum'.
+    """
+    with stage('merge', sum(len(df) for df in df_list)) as record:
+        df_merge = pd.concat(df_list, ignore_index=True) if df_list else pd.DataFrame()
+        record['rows_out'] = len(df_merge)
+    if phonenum_list:
+        phonenum_combined = pd.concat(phonenum_list, ignore_index=True).rename(columns={'PhoneNo': 'phonenum'})
+    else:
+        phonenum_combined = pd.DataFrame(columns=['phonenum'])
+    return df_merge, phonenum_combined
+
+def clean_file(uploaded_file):
+    """
+    Blocking core of process_file, meant to run in the worker pool.
+
+    Parameters:
+    - uploaded_file: A path or a seekable binary file-like object, e.g. the spooled
+                     temporary file behind a FastAPI UploadFile.
+
+    Returns:
+    - A tuple of (df_complete, phonenum_list, total_calls, total_pickup, rejections), see process_file.
+    """
+    df_results = read_ivr_csv(uploaded_file)
+    
+    total_calls = len(df_results)
+    reasons, phones = validate_ivr_results(df_results)
+    phonenum_list = df_results.loc[reasons != 'no_keypress', ['PhoneNo']]
+    total_pickup = int((~reasons.isin(['no_keypress', 'incomplete'])).sum())
+
+    valid = reasons.isna().to_numpy()
+    df_complete = df_results[valid].set_axis(np.arange(len(df_results.columns)), axis='columns')
+    df_complete[0] = phones[valid].astype(object)
+    df_complete['Set'] = 'IVR'
+
+    return df_complete, phonenum_list, total_calls, total_pickup, count_rejections(reasons)
 
 async def process_file(uploaded_file):
     """
@@ -7,54 +183,36 @@ async def process_file(uploaded_file):
     and user response data for analysis.
     
     The function performs several steps:
-    - Reads the CSV, skipping the first row and setting column names dynamically.
-    - Drops columns that are entirely NA.
-    - Extracts columns for phone numbers and user responses.
+    - Reads only the phone number and user response columns, using the header on the second line.
     - Identifies total number of calls and total pickups.
-    - Filters data to complete responses where a user key press is recorded.
+    - Validates every call (see validate_ivr_results), keeping complete responses with
+      well-formed keypresses and a valid phone number, normalized to 60XXXXXXXXX.
     - Adds a 'Set' column to indicate data belonging to the IVR set.
-    - Filters for records where the user key press response is exactly 10 characters long.
+
+    The parsing runs in the worker pool (see clean_file) so the event loop stays responsive.
 
     Parameters:
     - uploaded_file: A file-like object representing the uploaded CSV file.
                      This object must support file-like operations such as read.
 
     Returns:
-    - A tuple containing:
-        - df_complete: A pandas DataFrame of the processed data, with calls that have complete information.
-        - phonenum_list: A pandas DataFrame containing the list of phone numbers that have at least one user key press.
+    - A dict containing:
+        - df_complete: The processed data, with calls that have complete information, as a dict.
+        - phonenum_list: The phone numbers that have at least one user key press, as a dict.
         - total_calls: The total number of calls (rows) in the uploaded file.
         - total_pickup: The total number of calls where a user key press was recorded.
+        - rejections: The number of calls left out per rejection reason.
 
     Note:
     - The function assumes the uploaded CSV has specific columns of interest, notably 'PhoneNo' and 'UserKeyPress'.
     - It is assumed that the second row of the CSV provides the column names for the data.
     """
-    df = pd.read_csv(uploaded_file, skiprows=1, names=range(100), engine='python')
-    df.dropna(axis='columns', how='all', inplace=True)
-    df.columns = df.iloc[0]
-    df_phonenum = df[['PhoneNo']]
-    df_response = df.loc[:, 'UserKeyPress':]
-    df_results = pd.concat([df_phonenum, df_response], axis='columns')
-    
-    total_calls = len(df_results)
-    phonenum_recycle = df_results.dropna(subset=['UserKeyPress'])
-    phonenum_list = phonenum_recycle[['PhoneNo']]
-    
-    df_complete = df_results.dropna(axis='index')
-    total_pickup = len(df_complete)
-
-    df_complete.columns = np.arange(len(df_complete.columns))
-    df_complete['Set'] = 'IVR'
-    df_complete = df_complete.loc[:, :'Set']
-    df_complete = df_complete.loc[(df_complete.iloc[:, 2].str.len() == 10)]
+    df_complete, phonenum_list, total_calls, total_pickup, rejections = await run_blocking_on_file(clean_file, uploaded_file)
     
     return {
         "df_complete": df_complete.to_dict(),
         "phonenum_list": phonenum_list.to_dict(),
         "total_calls": total_calls,
-        "total_pickup": total_pickup
+        "total_pickup": total_pickup,
+        "rejections": rejections,
     }
-
-
-
@@ -0,0 +1,101 @@
+import json
+import os
+from functools import lru_cache
+
+import numpy as np
+import pandas as pd
+
+from app.modules.perf_utils import stage
+
+# Optional JSON file with more derived columns, or replacements for the default ones,
+# in the same {source column: {"column": derived column, "values": {answer: derived value},
+# "default": derived value of other answers (optional)}} form.
+DERIVED_COLUMNS_PATH = os.environ.get('IVR_DERIVED_COLUMNS')
+
+# Columns derived from decoded answers. Each one is inserted right after its source
+# column; answers missing from its table get the default, or are left empty without one,
+# in which case the decoder drops their rows with the other incomplete ones.
+DERIVED_COLUMNS = {
+    'IncomeRange': {
+        'column': 'IncomeGroup',
+        'values': {
+            'RM4,850 & below': 'B40',
+            'RM4,851 to RM10,960': 'M40',
+            'RM10,961 to RM15,039': 'T20',
+            'RM15,040 & above': 'T20',
+        },
+    },
+    'State': {
+        'column': 'Region',
+        'values': {
+            'Perlis': 'Northern', 'Kedah': 'Northern', 'Pulau Pinang': 'Northern', 'Penang': 'Northern', 'Perak': 'Northern',
+            'Selangor': 'Central', 'Kuala Lumpur': 'Central', 'Putrajaya': 'Central', 'Negeri Sembilan': 'Central',
+            'Melaka': 'Southern', 'Malacca': 'Southern', 'Johor': 'Southern',
+            'Kelantan': 'East Coast', 'Terengganu': 'East Coast', 'Pahang': 'East Coast',
+            'Sabah': 'East Malaysia', 'Sarawak': 'East Malaysia', 'Labuan': 'East Malaysia',
+        },
+        'default': 'Other',
+    },
+}
+
+@lru_cache(maxsize=None)
+def load_derived_columns(path=DERIVED_COLUMNS_PATH):
+    """
+    Returns the derived column tables: the defaults, extended by the file at path if any.
+
+    The file is read once per path and the tables are shared by every caller,
+    so they must not be modified.
+
+    Parameters:
+    - path (str, optional): A JSON file in the form of DERIVED_COLUMNS.
+
+    Returns:
+    - dict: {source column: {'column': derived column, 'values': {answer: derived value}, 'default': ...}}.
+    """
+    derived_columns = dict(DERIVED_COLUMNS)
+    if path:
+        with open(path, encoding='utf-8') as f:
+            derived_columns.update(json.load(f))
+    return derived_columns
+
+def derive_values(values, lookup, default=None):
+    """
+    Maps answers to derived values through the categories of the answers, so
+    the lookup runs once per distinct answer rather than once per row.
+
+    Parameters:
+    - values (pd.Series): The answers, plain or categorical.
+    - lookup (dict): {answer: derived value}.
+    - default (optional): The derived value of answers missing from lookup.
+
+    Returns:
+    - pd.Categorical: The derived values, empty where an answer is empty or has none.
+    """
+    values = pd.Categorical(values)
+    derived = np.array([lookup.get(category, default) for category in values.categories], dtype=object)
+    # Several answers may share a derived value, so factorize the derived categories again
+    derived_codes, derived_categories = pd.factorize(derived)
+    codes = np.where(values.codes >= 0, derived_codes[values.codes] if len(derived_codes) else -1, -1)
+    return pd.Categorical.from_codes(codes, categories=derived_categories)
+
+def add_derived_columns(df, derived_columns=None):
+    """
+    Inserts the derived columns of every source column present in the data.
+
+    Derived columns that already exist are left as they are.
+
+    Parameters:
+    - df (pd.DataFrame): Decoded data; modified in place.
+    - derived_columns (dict, optional): Tables as returned by load_derived_columns, which is used by default.
+
+    Returns:
+    - pd.DataFrame: The same DataFrame, with the derived columns.
+    """
+    derived_columns = load_derived_columns() if derived_columns is None else derived_columns
+    with stage('derive', len(df)) as record:
+        for source, rule in derived_columns.items():
+            if source not in df.columns or rule['column'] in df.columns:
+                continue
+            df.insert(df.columns.get_loc(source) + 1, rule['column'], derive_values(df[source], rule['values'], rule.get('default')))
+        record['rows_out'] = len(df)
+    return df
@@ -0,0 +1,149 @@
+import asyncio
+import contextvars
+import os
+import shutil
+import tempfile
+import threading
+from concurrent.futures import ProcessPoolExecutor, ThreadPoolExecutor
+from multiprocessing import get_context
+
+from fastapi import HTTPException
+from fastapi.concurrency import run_in_threadpool
+
+from app.modules.perf_utils import add_records, call_recorded
+
+# Pool running the blocking pandas and parsing work: 'thread' or 'process'.
+EXECUTOR_KIND = os.environ.get('IVR_API_EXECUTOR', 'thread')
+# Number of workers in the pool.
+MAX_WORKERS = int(os.environ.get('IVR_API_MAX_WORKERS', os.cpu_count() or 1))
+# Jobs allowed to run or wait for a worker before new ones are refused with 429.
+MAX_PENDING = int(os.environ.get('IVR_API_MAX_PENDING', 4 * MAX_WORKERS))
+# Seconds a request waits for its job before it is answered with 504.
+REQUEST_TIMEOUT = float(os.environ.get('IVR_API_TIMEOUT', 300))
+# Seconds clients are asked to wait before retrying a refused request.
+RETRY_AFTER_SECONDS = 5
+
+_executor = None
+_pending = 0
+_lock = threading.Lock()
+
+def get_executor():
+    """
+    Returns the shared worker pool, creating it on first use.
+
+    Process workers are spawned rather than forked, so they do not inherit the
+    state of the server's event loop threads.
+
+    Returns:
+    - concurrent.futures.Executor: The pool configured by IVR_API_EXECUTOR and IVR_API_MAX_WORKERS.
+    """
+    global _executor
+    with _lock:
+        if _executor is None:
+            if EXECUTOR_KIND == 'process':
+                _executor = ProcessPoolExecutor(max_workers=MAX_WORKERS, mp_context=get_context('spawn'))
+            else:
+                _executor = ThreadPoolExecutor(max_workers=MAX_WORKERS, thread_name_prefix='ivr-worker')
+        return _executor
+
+def shutdown_executor():
+    """Shuts the worker pool down, waiting for running jobs; called when the app stops."""
+    global _executor
+    with _lock:
+        executor, _executor = _executor, None
+    if executor is not None:
+        executor.shutdown(wait=True, cancel_futures=True)
+
+def pending_jobs():
+    """Returns the number of jobs currently running or waiting for a worker."""
+    return _pending
+
+def _release_slot(_future):
+    global _pending
+    with _lock:
+        _pending -= 1
+
+async def run_blocking(func, *args, timeout=None, **kwargs):
+    """
+    Runs a blocking function in the worker pool without blocking the event loop.
+
+    A slot is taken for every job and only given back when the job really
+    finishes, so a job that timed out keeps counting against MAX_PENDING until
+    its worker is free again. The stages the job records (see perf_utils) are
+    added to the caller's recording, also when they ran in a worker process.
+
+    Parameters:
+    - func (callable): The blocking function; it and its arguments must be picklable
+                       when the pool uses processes.
+    - *args, **kwargs: Arguments passed to func.
+    - timeout (float, optional): Seconds to wait for the result, REQUEST_TIMEOUT by default.
+
+    Returns:
+    - The return value of func.
+
+    Raises:
+    - HTTPException: 429 when MAX_PENDING jobs are already queued, 504 when the job times out.
+    """
+    global _pending
+    executor = get_executor()
+    with _lock:
+        if _pending >= MAX_PENDING:
+            raise HTTPException(
+                status_code=429,
+                detail="The server is busy processing other files. Please retry shortly.",
+                headers={'Retry-After': str(RETRY_AFTER_SECONDS)},
+            )
+        _pending += 1
+
+    try:
+        if EXECUTOR_KIND == 'process':
+            future = executor.submit(call_recorded, func, *args, **kwargs)
+        else:
+            future = executor.submit(contextvars.copy_context().run, func, *args, **kwargs)
+    except BaseException:
+        _release_slot(None)
+        raise
+    future.add_done_callback(_release_slot)
+
+    try:
+        result = await asyncio.wait_for(asyncio.wrap_future(future), timeout or REQUEST_TIMEOUT)
+    except asyncio.TimeoutError:
+        # Drop the job if it has not started yet; a running one is left to finish
+        future.cancel()
+        raise HTTPException(status_code=504, detail="Processing took too long and was abandoned.")
+
+    if EXECUTOR_KIND == 'process':
+        result, records = result
+        add_records(records)
+    return result
+
+def _spool_to_path(file):
+    file.seek(0)
+    with tempfile.NamedTemporaryFile(suffix='.upload', delete=False) as spooled:
+        shutil.copyfileobj(file, spooled)
+    return spooled.name
+
+async def run_blocking_on_file(func, file, *args, **kwargs):
+    """
+    Runs a blocking function that reads an uploaded file in the worker pool.
+
+    Thread workers read the upload's spooled file directly. Open files cannot
+    be sent to process workers, so the upload is then copied to a named
+    temporary file whose path is passed instead, and removed afterwards.
+
+    Parameters:
+    - func (callable): The blocking function, taking the file or a path as first argument.
+    - file: The binary file-like object behind a FastAPI UploadFile.
+    - *args, **kwargs: Further arguments passed to func and run_blocking.
+
+    Returns:
+    - The return value of func.
+    """
+    if EXECUTOR_KIND != 'process':
+        return await run_blocking(func, file, *args, **kwargs)
+
+    path = await run_in_threadpool(_spool_to_path, file)
+    try:
+        return await run_blocking(func, path, *args, **kwargs)
+    finally:
+        os.remove(path)
@@ -0,0 +1,161 @@
+import io
+import tempfile
+
+import pyarrow as pa
+from fastapi import HTTPException
+from fastapi.responses import StreamingResponse
+
+from app.modules.perf_utils import timed_pieces
+
+# Response formats offered by the endpoints: media type and file extension.
+RESPONSE_FORMATS = {
+    'csv': ('text/csv', '.csv'),
+    'parquet': ('application/vnd.apache.parquet', '.parquet'),
+    'arrow': ('application/vnd.apache.arrow.stream', '.arrows'),
+    'ndjson': ('application/x-ndjson', '.ndjson'),
+}
+
+# Rows serialized per CSV, NDJSON or Arrow piece and bytes per Parquet piece of a streamed response.
+STREAM_CHUNK_ROWS = 50_000
+STREAM_BLOCK_SIZE = 1 << 20
+
+def encode_answer_columns(df):
+    """
+    Prepares a DataFrame for columnar export.
+
+    Column names become strings, as Parquet requires, and every text column
+    except the first (the phone numbers) is stored as a categorical.
+
+    Parameters:
+    - df (pd.DataFrame): Cleaned or decoded data.
+
+    Returns:
+    - pd.DataFrame: A copy with string column names and categorical answer columns.
+    """
+    df = df.set_axis([str(col) for col in df.columns], axis='columns').reset_index(drop=True)
+    answer_columns = [col for col in df.columns[1:] if df[col].dtype == object]
+    return df.astype({col: 'category' for col in answer_columns})
+
+def iter_csv(df, chunk_rows=STREAM_CHUNK_ROWS):
+    """
+    Serializes a DataFrame to CSV piece by piece, so the whole text is never held at once.
+
+    Parameters:
+    - df (pd.DataFrame): The data to serialize.
+    - chunk_rows (int): Number of rows per piece.
+
+    Yields:
+    - bytes: UTF-8 encoded CSV, the header first.
+    """
+    yield df.iloc[:0].to_csv(index=False).encode('utf-8')
+    for start in range(0, len(df), chunk_rows):
+        yield df.iloc[start:start + chunk_rows].to_csv(index=False, header=False).encode('utf-8')
+
+def iter_parquet(df, block_size=STREAM_BLOCK_SIZE):
+    """
+    Serializes a DataFrame to Parquet through a spooled temporary file.
+
+    Parameters:
+    - df (pd.DataFrame): The data to serialize.
+    - block_size (int): Number of bytes per piece.
+
+    Yields:
+    - bytes: The Parquet file content.
+    """
+    with tempfile.SpooledTemporaryFile(max_size=64 * 1024 * 1024) as spool:
+        encode_answer_columns(df).to_parquet(spool, index=False)
+        spool.seek(0)
+        for block in iter(lambda: spool.read(block_size), b''):
+            yield block
+
+def iter_ndjson(df, chunk_rows=STREAM_CHUNK_ROWS):
+    """
+    Serializes a DataFrame to newline-delimited JSON, one object per row.
+
+    Parameters:
+    - df (pd.DataFrame): The data to serialize.
+    - chunk_rows (int): Number of rows per piece.
+
+    Yields:
+    - bytes: UTF-8 encoded JSON lines.
+    """
+    df = df.set_axis([str(col) for col in df.columns], axis='columns')
+    for start in range(0, len(df), chunk_rows):
+        # Older pandas versions leave out the final newline
+        lines = df.iloc[start:start + chunk_rows].to_json(orient='records', lines=True).rstrip('\n')
+        yield (lines + '\n').encode('utf-8')
+
+def iter_arrow(df, chunk_rows=STREAM_CHUNK_ROWS):
+    """
+    Serializes a DataFrame to the Arrow IPC streaming format, one record batch per piece.
+
+    Answer columns are sent dictionary encoded (see encode_answer_columns), and
+    numeric columns are handed to Arrow without copying.
+
+    Parameters:
+    - df (pd.DataFrame): The data to serialize.
+    - chunk_rows (int): Number of rows per record batch.
+
+    Yields:
+    - bytes: The schema first, then the record batches and the end-of-stream marker.
+    """
+    table = pa.Table.from_pandas(encode_answer_columns(df), preserve_index=False)
+    sink = io.BytesIO()
+    with pa.ipc.new_stream(sink, table.schema) as writer:
+        for batch in table.to_batches(max_chunksize=chunk_rows):
+            writer.write_batch(batch)
+            yield sink.getvalue()
+            sink.seek(0)
+            sink.truncate()
+    yield sink.getvalue()
+
+def format_from_accept(accept):
+    """
+    Picks the response format asked for in an Accept header.
+
+    Parameters:
+    - accept (str or None): The Accept header of the request.
+
+    Returns:
+    - str or None: The key of RESPONSE_FORMATS with the highest quality, or None when
+      the header names none of them.
+    """
+    formats_by_media_type = {media_type: key for key, (media_type, _) in RESPONSE_FORMATS.items()}
+    candidates = []
+    for position, media_range in enumerate((accept or '').split(',')):
+        media_type, *params = [part.strip() for part in media_range.split(';')]
+        if media_type not in formats_by_media_type:
+            continue
+        quality = 1.0
+        for param in params:
+            name, _, value = param.partition('=')
+            if name.strip() == 'q':
+                try:
+                    quality = float(value)
+                except ValueError:
+                    pass
+        if quality > 0:
+            candidates.append((-quality, position, formats_by_media_type[media_type]))
+    return min(candidates)[2] if candidates else None
+
+def dataframe_response(df, response_format, filename, headers=None):
+    """
+    Streams a DataFrame as a CSV, Parquet, Arrow IPC stream or NDJSON download.
+
+    Parameters:
+    - df (pd.DataFrame): The data to return.
+    - response_format (str): A key of RESPONSE_FORMATS.
+    - filename (str): The file name without extension.
+    - headers (dict, optional): Extra response headers, e.g. counters.
+
+    Returns:
+    - StreamingResponse: The response to return from the endpoint.
+    """
+    if response_format not in RESPONSE_FORMATS:
+        raise HTTPException(status_code=400, detail=f"Unknown response format: {response_format}")
+    media_type, extension = RESPONSE_FORMATS[response_format]
+    body = {'csv': iter_csv, 'parquet': iter_parquet, 'arrow': iter_arrow, 'ndjson': iter_ndjson}[response_format](df)
+    body = timed_pieces('export', body, len(df))
+    headers = dict(headers or {})
+    headers['Content-Disposition'] = f'attachment; filename="{filename}{extension}"'
+    return StreamingResponse(body, media_type=media_type, headers=headers)
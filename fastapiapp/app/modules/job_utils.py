@@ -0,0 +1,273 @@
+import asyncio
+import os
+import shutil
+import sqlite3
+import uuid
+from datetime import datetime
+
+import pandas as pd
+from fastapi import HTTPException
+from fastapi.concurrency import run_in_threadpool
+
+from app.modules.data_cleaner_utils_page1 import clean_file, merger
+from app.modules.dispatch_utils import RETRY_AFTER_SECONDS, run_blocking
+
+# Location of the job store and of the uploaded files and artifacts of every job.
+JOB_DIR = os.environ.get(
+    'IVR_JOB_DIR',
+    os.path.join(os.path.expanduser('~'), '.ivr_survey_automation', 'jobs'),
+)
+JOB_DB_PATH = os.environ.get('IVR_JOB_DB', os.path.join(JOB_DIR, 'jobs.db'))
+# Seconds a single file of a background job may take before it is marked as failed.
+JOB_FILE_TIMEOUT = float(os.environ.get('IVR_JOB_FILE_TIMEOUT', 3600))
+
+# Artifacts written when a job completes.
+CLEANED_ARTIFACT = 'IVR_Cleaned_Data.csv'
+PHONENUM_ARTIFACT = 'IVR_Dialed_Phonenum.csv'
+
+# Job states after which nothing changes any more.
+FINISHED_STATES = ('completed', 'failed')
+
+# Jobs being processed by this server, keyed by job id; keeps their tasks alive.
+_running_jobs = {}
+
+def connect_job_store(db_path=None):
+    """
+    Opens the job store, creating it if needed.
+
+    Parameters:
+    - db_path (str, optional): Path of the SQLite database, JOB_DB_PATH by default.
+
+    Returns:
+    - sqlite3.Connection: An open connection to the store.
+    """
+    db_path = db_path or JOB_DB_PATH
+    os.makedirs(os.path.dirname(os.path.abspath(db_path)), exist_ok=True)
+    conn = sqlite3.connect(db_path)
+    conn.row_factory = sqlite3.Row
+    conn.executescript(
+        "CREATE TABLE IF NOT EXISTS jobs ("
+        "job_id TEXT PRIMARY KEY, status TEXT, created_at TEXT, updated_at TEXT, error TEXT);"
+        "CREATE TABLE IF NOT EXISTS job_files ("
+        "job_id TEXT, position INTEGER, filename TEXT, status TEXT, "
+        "total_calls INTEGER, total_pickup INTEGER, error TEXT, "
+        "PRIMARY KEY (job_id, position));"
+    )
+    return conn
+
+def _now():
+    return datetime.now().isoformat(timespec='seconds')
+
+def job_path(job_id, *parts):
+    """Returns the path of a file in the directory of a job."""
+    return os.path.join(JOB_DIR, job_id, *parts)
+
+def _execute(query, params=()):
+    conn = connect_job_store()
+    try:
+        with conn:
+            conn.execute(query, params)
+    finally:
+        conn.close()
+
+def _set_job_status(job_id, status, error=None):
+    _execute("UPDATE jobs SET status = ?, error = ?, updated_at = ? WHERE job_id = ?", (status, error, _now(), job_id))
+
+def _set_file_result(job_id, position, status, total_calls=None, total_pickup=None, error=None):
+    _execute(
+        "UPDATE job_files SET status = ?, total_calls = ?, total_pickup = ?, error = ? WHERE job_id = ? AND position = ?",
+        (status, total_calls, total_pickup, error, job_id, position),
+    )
+    _execute("UPDATE jobs SET updated_at = ? WHERE job_id = ?", (_now(), job_id))
+
+def create_job(filenames):
+    """
+    Registers a new job for a batch of files, all of them still to be processed.
+
+    Parameters:
+    - filenames (list of str): The names of the uploaded files, in upload order.
+
+    Returns:
+    - str: The id of the new job.
+    """
+    job_id = uuid.uuid4().hex
+    os.makedirs(job_path(job_id, 'inputs'), exist_ok=True)
+    os.makedirs(job_path(job_id, 'parts'), exist_ok=True)
+    conn = connect_job_store()
+    try:
+        with conn:
+            conn.execute("INSERT INTO jobs VALUES (?, 'queued', ?, ?, NULL)", (job_id, _now(), _now()))
+            conn.executemany(
+                "INSERT INTO job_files (job_id, position, filename, status) VALUES (?, ?, ?, 'queued')",
+                ((job_id, position, filename) for position, filename in enumerate(filenames)),
+            )
+    finally:
+        conn.close()
+    return job_id
+
+def get_job(job_id):
+    """
+    Describes a job: its state, per-file progress, counters and artifacts.
+
+    Parameters:
+    - job_id (str): The id returned when the job was submitted.
+
+    Returns:
+    - dict or None: The job description, or None when there is no such job.
+    """
+    conn = connect_job_store()
+    try:
+        job = conn.execute("SELECT * FROM jobs WHERE job_id = ?", (job_id,)).fetchone()
+        if job is None:
+            return None
+        files = [dict(row) for row in conn.execute(
+            "SELECT position, filename, status, total_calls, total_pickup, error "
+            "FROM job_files WHERE job_id = ? ORDER BY position", (job_id,)
+        )]
+    finally:
+        conn.close()
+
+    done = [f for f in files if f['status'] == 'completed']
+    return {
+        'job_id': job['job_id'],
+        'status': job['status'],
+        'created_at': job['created_at'],
+        'updated_at': job['updated_at'],
+        'error': job['error'],
+        'file_count': len(files),
+        'files_done': sum(f['status'] in FINISHED_STATES for f in files),
+        'total_calls': sum(f['total_calls'] for f in done),
+        'total_pickup': sum(f['total_pickup'] for f in done),
+        'files': files,
+        'artifacts': [
+            f'/jobs/{job_id}/artifacts/{name}' for name in (CLEANED_ARTIFACT, PHONENUM_ARTIFACT)
+            if job['status'] == 'completed' and os.path.exists(job_path(job_id, name))
+        ],
+    }
+
+def clean_job_file(job_dir, position):
+    """
+    Cleans one stored file of a job and keeps its results as Parquet parts.
+
+    The job directory is passed explicitly rather than derived from JOB_DIR,
+    so the function behaves the same in a worker process.
+
+    Parameters:
+    - job_dir (str): The directory of the job.
+    - position (int): The position of the file in the batch.
+
+    Returns:
+    - tuple: The total number of calls and pickups of the file.
+    """
+    df_complete, phonenum_list, total_calls, total_pickup, _ = clean_file(os.path.join(job_dir, 'inputs', f'{position}.csv'))
+    df_complete.set_axis([str(col) for col in df_complete.columns], axis='columns').to_parquet(
+        os.path.join(job_dir, 'parts', f'{position}_cleaned.parquet'), index=False)
+    phonenum_list.to_parquet(os.path.join(job_dir, 'parts', f'{position}_phonenum.parquet'), index=False)
+    return total_calls, total_pickup
+
+def write_job_artifacts(job_dir, positions):
+    """
+    Merges the parts of the cleaned files of a job into its CSV artifacts.
+
+    Parameters:
+    - job_dir (str): The directory of the job.
+    - positions (list of int): The positions of the files that were cleaned.
+    """
+    parts_dir = os.path.join(job_dir, 'parts')
+    df_list = [pd.read_parquet(os.path.join(parts_dir, f'{position}_cleaned.parquet')) for position in positions]
+    phonenum_list = [pd.read_parquet(os.path.join(parts_dir, f'{position}_phonenum.parquet')) for position in positions]
+    df_merge, phonenum_combined = merger(df_list, phonenum_list)
+    df_merge.to_csv(os.path.join(job_dir, CLEANED_ARTIFACT), index=False)
+    phonenum_combined.drop_duplicates().to_csv(os.path.join(job_dir, PHONENUM_ARTIFACT), index=False)
+
+async def _run_in_pool(func, *args):
+    # Background jobs wait for a free slot instead of giving up on a busy pool
+    while True:
+        try:
+            return await run_blocking(func, *args, timeout=JOB_FILE_TIMEOUT)
+        except HTTPException as e:
+            if e.status_code != 429:
+                raise
+            await asyncio.sleep(RETRY_AFTER_SECONDS)
+
+async def run_job(job_id):
+    """
+    Processes the files of a job that are not completed yet, then writes its artifacts.
+
+    Files that fail are recorded as failed and the others are still processed;
+    the job fails only when no file could be cleaned. The job store is updated
+    from the thread pool, so its SQLite calls never block the event loop.
+
+    Parameters:
+    - job_id (str): The id of the job.
+    """
+    try:
+        await run_in_threadpool(_set_job_status, job_id, 'running')
+        job = await run_in_threadpool(get_job, job_id)
+        for file in job['files']:
+            if file['status'] in FINISHED_STATES:
+                continue
+            await run_in_threadpool(_set_file_result, job_id, file['position'], 'running')
+            try:
+                total_calls, total_pickup = await _run_in_pool(clean_job_file, job_path(job_id), file['position'])
+            except HTTPException as e:
+                await run_in_threadpool(_set_file_result, job_id, file['position'], 'failed', error=e.detail)
+            except Exception as e:
+                await run_in_threadpool(_set_file_result, job_id, file['position'], 'failed', error=str(e))
+            else:
+                await run_in_threadpool(_set_file_result, job_id, file['position'], 'completed', total_calls, total_pickup)
+
+        job = await run_in_threadpool(get_job, job_id)
+        positions = [f['position'] for f in job['files'] if f['status'] == 'completed']
+        if not positions:
+            await run_in_threadpool(_set_job_status, job_id, 'failed', "None of the files could be processed.")
+            return
+        await _run_in_pool(write_job_artifacts, job_path(job_id), positions)
+        await run_in_threadpool(_set_job_status, job_id, 'completed')
+    except Exception as e:
+        await run_in_threadpool(_set_job_status, job_id, 'failed', str(e))
+    finally:
+        _running_jobs.pop(job_id, None)
+
+def start_job(job_id):
+    """Schedules a job on the running event loop, unless this server already runs it."""
+    if job_id not in _running_jobs:
+        _running_jobs[job_id] = asyncio.create_task(run_job(job_id))
+
+def _store_uploads(job_id, files):
+    for position, upload_file in enumerate(files):
+        upload_file.file.seek(0)
+        with open(job_path(job_id, 'inputs', f'{position}.csv'), 'wb') as stored:
+            shutil.copyfileobj(upload_file.file, stored)
+
+async def submit_job(files):
+    """
+    Stores a batch of uploads and starts cleaning it in the background.
+
+    Parameters:
+    - files (list of UploadFile): The dialer CSV exports.
+
+    Returns:
+    - str: The id of the new job.
+    """
+    job_id = await run_in_threadpool(create_job, [upload_file.filename for upload_file in files])
+    await run_in_threadpool(_store_uploads, job_id, files)
+    start_job(job_id)
+    return job_id
+
+def resume_jobs():
+    """
+    Restarts the jobs that were queued or running when the server stopped.
+    Files completed before the restart are not processed again.
+
+    Returns:
+    - list of str: The ids of the resumed jobs.
+    """
+    conn = connect_job_store()
+    try:
+        job_ids = [row[0] for row in conn.execute("SELECT job_id FROM jobs WHERE status IN ('queued', 'running')")]
+    finally:
+        conn.close()
+    for job_id in job_ids:
+        start_job(job_id)
+    return job_ids
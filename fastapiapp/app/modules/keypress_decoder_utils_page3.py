@@ -1,69 +1,97 @@
 import re
 import json
+from functools import lru_cache
+import numpy as np
+import pandas as pd
+from fastapi import HTTPException
+from app.modules.dispatch_utils import run_blocking
+from app.modules.perf_utils import stage
+from app.modules.script_parser_utils import parse_text_to_json as _parse_text_to_json
+from app.modules.derived_column_utils import add_derived_columns, load_derived_columns
 
 async def parse_text_to_json(text_content):
-            """
-            Parses structured text containing survey questions and answers into a JSON-like dictionary.
-            Adjusts FlowNo to start from 2 for the first question as specified.
-            """
-
-            # Initialize variables
-            data = {}
-            current_question = None
-
-            # Regular expressions for identifying parts of the text
-            question_re = re.compile(r'^(\d+)\.\s+(.*)')
-            answer_re = re.compile(r'^\s+-\s+(.*)')
-
-            for line in text_content.splitlines():
-                question_match = question_re.match(line)
-                answer_match = answer_re.match(line)
-
-                if question_match:
-                    # New question found
-                    q_number, q_text = question_match.groups()
-                    current_question = f"Q{q_number}"
-                    data[current_question] = {"question": q_text, "answers": {}}
-                elif answer_match and current_question:
-                    # Answer found for the current question
-                    answer_text = answer_match.groups()[0]
-                    # Assuming FlowNo starts at 2 for the first question and increments for each answer within a question
-                    flow_no = len(data[current_question]["answers"]) + 1
-                    # Adjusting FlowNo to start from 2 for the first question and increment accordingly for each answer
-                    flow_no_key = f"FlowNo_{int(q_number)+1}={flow_no}"
-                    data[current_question]["answers"][flow_no_key] = answer_text
-
-            return data
+            """Runs _parse_text_to_json in the worker pool, as long scripts take a while to scan."""
+            return await run_blocking(_parse_text_to_json, text_content)
+
+# Matches keypress values and column names such as 'FlowNo_3=2' or 'FlowNo_3'.
+FLOW_NO_RE = re.compile(r"FlowNo_(\d+)=*(\d*)")
+# Number of parsed FlowNo values kept; a survey has a few hundred at most.
+FLOW_NO_CACHE_SIZE = 1 << 16
+
+@lru_cache(maxsize=FLOW_NO_CACHE_SIZE)
+def parse_flow_no(value):
+    """
+    Parses a keypress value or column name such as 'FlowNo_3=2' into integers.
+
+    Parameters:
+    - value: The value to parse.
+
+    Returns:
+    - tuple: (question, answer); answer is None when the value has no answer number,
+             and both are None when the value is not a FlowNo.
+    """
+    match = FLOW_NO_RE.match(value) if isinstance(value, str) else None
+    if not match:
+        return None, None
+    return int(match.group(1)), int(match.group(2)) if match.group(2) else None
+
+def _custom_sort(col):
+    # Orders FlowNo columns and values by question then answer, anything else last
+    question_num, flow_no = parse_flow_no(col)
+    if question_num is None:
+        return (float('inf'), 0)
+    return (question_num, flow_no or 0)
 
 async def custom_sort(col):
-            # Improved regex to capture question and flow numbers accurately
-            match = re.match(r"FlowNo_(\d+)=*(\d*)", col)
-            if match:
-                question_num = int(match.group(1))  # Question number
-                flow_no = int(match.group(2)) if match.group(2) else 0  # Flow number, default to 0 if not present
-                return (question_num, flow_no) 
-            else:
-                return (float('inf'), 0)
+            """Returns the sort key of a FlowNo column name or keypress value."""
+            return _custom_sort(col)
 
-async def classify_income(income):
-            if income == 'RM4,850 & below':
-                return 'B40'
-            elif income == 'RM4,851 to RM10,960':
-                return 'M40'
-            elif income in ['RM15,040 & above', 'RM10,961 to RM15,039']:
-                return 'T20'
+def _answer_sort_key(value):
+    _, flow_no = parse_flow_no(value)
+    return float('inf') if flow_no is None else flow_no
 
+def build_flow_no_index(df):
+    """
+    Scans renamed data once for what a decoder needs to lay out its questions.
+
+    Parameters:
+    - df (pd.DataFrame): Renamed data, with 'phonenum' first, one column per question and 'Set' last.
+
+    Returns:
+    - dict: 'columns', the columns ordered by custom_sort; 'question_columns', the
+            question columns among them; 'values', {column: its distinct non-null
+            keypress values ordered by answer number}; and 'flow_nos', {value:
+            (question, answer)} for every one of those values.
+    """
+    with stage('flow no index', len(df)):
+        columns = sorted(df.columns, key=_custom_sort)
+        question_columns = columns[1:-1]
+        values = {}
+        flow_nos = {}
+        for col in question_columns:
+            unique_values = df[col].dropna().unique()
+            values[col] = sorted(unique_values, key=_answer_sort_key)
+            flow_nos.update((value, parse_flow_no(value)) for value in unique_values)
+    return {'columns': columns, 'question_columns': question_columns, 'values': values, 'flow_nos': flow_nos}
+
+async def classify_income(income):
+            """Classifies a single income answer; whole columns are classified by add_derived_columns."""
+            return load_derived_columns()['IncomeRange']['values'].get(income)
 
 async def process_file_content(uploaded_file):
-            """Process the content of the uploaded file."""
+            """Process the content of the uploaded file (a FastAPI UploadFile)."""
             try:
-                if uploaded_file and uploaded_file.type == "application/json":
+                file_content = (await uploaded_file.read()).decode("utf-8")
+                if uploaded_file.content_type == "application/json":
                     # Handle JSON file
-                    flow_no_mappings = json.loads(uploaded_file.getvalue().decode("utf-8"))
+                    flow_no_mappings = await run_blocking(json.loads, file_content)
                 else:
                     # Handle plain text file
-                    flow_no_mappings = parse_text_to_json(uploaded_file.getvalue().decode("utf-8"))
+                    flow_no_mappings = await parse_text_to_json(file_content)
                 return flow_no_mappings, "Questions and answers parsed successfully.✨", None
+            except HTTPException:
+                # Overload and timeout answers from the worker pool go back to the client as they are
+                raise
             except Exception as e:
                 return None, None, f"Error processing file: {e}"
 
@@ -72,3 +100,63 @@ async def flatten_json_structure(flow_no_mappings):
             if not flow_no_mappings:
                 return {}
             return {k: v for question in flow_no_mappings.values() for k, v in question["answers"].items()}
+
+def decode_keypresses(df, keypress_mappings, excluded_flow_nos=None, drop_cols=None):
+    """
+    Decodes keypress values into readable answers, one pass per question column.
+
+    Each question column is converted to a Categorical once, so renaming its
+    answers only touches the categories, and the rows holding excluded values
+    of every column are removed with a single combined mask.
+
+    Parameters:
+    - df (pd.DataFrame): Renamed data with one column per question.
+    - keypress_mappings (dict): {column: {keypress value: readable answer}}.
+    - excluded_flow_nos (dict, optional): {column: [keypress values whose rows are dropped]}.
+    - drop_cols (list, optional): Question columns to drop entirely.
+
+    Returns:
+    - pd.DataFrame: The decoded data, with the decoded question columns as categoricals.
+    """
+    with stage('decode', len(df)) as record:
+        excluded_flow_nos = excluded_flow_nos or {}
+        df = df.drop(columns=drop_cols or [])
+
+        exclude_mask = np.zeros(len(df), dtype=bool)
+        for col in df.columns:
+            col_mappings = keypress_mappings.get(col)
+            excluded = excluded_flow_nos.get(col)
+            if not col_mappings and not excluded:
+                continue
+
+            values = pd.Categorical(df[col])
+            if excluded:
+                exclude_mask |= values.isin(excluded)
+
+            if col_mappings and len(values.categories):
+                # Several keypresses may map to the same answer, so re-factorize the renamed categories
+                labels = [col_mappings.get(category, category) for category in values.categories]
+                label_codes, label_categories = pd.factorize(np.array(labels, dtype=object))
+                codes = np.where(values.codes >= 0, label_codes[values.codes], -1)
+                values = pd.Categorical.from_codes(codes, categories=label_categories)
+
+            df[col] = values
+
+        if exclude_mask.any():
+            df = df[~exclude_mask]
+        for col in df.select_dtypes('category').columns:
+            df[col] = df[col].cat.remove_unused_categories()
+        record['rows_out'] = len(df)
+    return df
+
+def decode_and_deduplicate(df, keypress_mappings, excluded_flow_nos=None, drop_cols=None):
+    """
+    Decodes keypresses (see decode_keypresses), adds the derived columns such as
+    IncomeGroup (see add_derived_columns) and keeps the unique complete rows,
+    as the decoder page does before offering the download.
+
+    Returns:
+    - pd.DataFrame: The decoded data without duplicate or incomplete rows.
+    """
+    decoded = add_derived_columns(decode_keypresses(df, keypress_mappings, excluded_flow_nos, drop_cols))
+    return decoded.drop_duplicates().dropna()
@@ -0,0 +1,193 @@
+import contextvars
+import os
+import re
+import sys
+import threading
+import time
+from contextlib import contextmanager
+
+try:
+    import resource
+except ImportError:  # Windows
+    resource = None
+
+# Stage records collected by the innermost active recording() block, if any.
+_current_records = contextvars.ContextVar('perf_records', default=None)
+
+# Totals per stage since the server started: runs, seconds, rows in and rows out.
+_stage_totals = {}
+_totals_lock = threading.Lock()
+
+def current_rss_mb():
+    """Returns the resident memory of this process in MB, or None where it cannot be read."""
+    try:
+        with open('/proc/self/statm') as statm:
+            return int(statm.read().split()[1]) * os.sysconf('SC_PAGE_SIZE') / 2**20
+    except (OSError, ValueError, AttributeError):
+        return None
+
+def peak_rss_mb():
+    """Returns the highest resident memory of this process so far in MB, or None where it is not available."""
+    if resource is None:
+        return None
+    # ru_maxrss is in KB on Linux and in bytes on macOS
+    return resource.getrusage(resource.RUSAGE_SELF).ru_maxrss / (2**20 if sys.platform == 'darwin' else 2**10)
+
+@contextmanager
+def recording():
+    """
+    Collects the records of the stages run inside the block, in this task or thread.
+
+    Yields:
+    - list of dict: The stage records, filled as the stages finish.
+    """
+    records = []
+    token = _current_records.set(records)
+    try:
+        yield records
+    finally:
+        _current_records.reset(token)
+
+def _add_to_totals(record):
+    with _totals_lock:
+        totals = _stage_totals.setdefault(record['stage'], [0, 0.0, 0, 0])
+        totals[0] += 1
+        totals[1] += record['seconds']
+        totals[2] += record['rows_in'] or 0
+        totals[3] += record['rows_out'] or 0
+
+@contextmanager
+def stage(name, rows_in=None):
+    """
+    Times a pipeline stage, adds it to the server totals and to the active recording.
+
+    Parameters:
+    - name (str): The name of the stage, e.g. 'read' or 'decode'.
+    - rows_in (int, optional): Number of rows the stage receives.
+
+    Yields:
+    - dict: The record of the stage; set its 'rows_out' inside the block.
+    """
+    record = {'stage': name, 'rows_in': rows_in, 'rows_out': None}
+    start = time.perf_counter()
+    try:
+        yield record
+    finally:
+        _finish_record(record, time.perf_counter() - start)
+
+def _finish_record(record, seconds):
+    record['seconds'] = seconds
+    record['rss_mb'] = current_rss_mb()
+    record['peak_rss_mb'] = peak_rss_mb()
+    _add_to_totals(record)
+    records = _current_records.get()
+    if records is not None:
+        records.append(record)
+
+def timed_pieces(name, pieces, rows_in=None):
+    """
+    Times a stage that produces its output piece by piece, e.g. a streamed response body.
+
+    Only the time spent producing the pieces is counted, not the time the
+    consumer takes between them, e.g. to send a piece to a slow client.
+
+    Parameters:
+    - name (str): The name of the stage.
+    - pieces (iterator): The pieces produced by the stage.
+    - rows_in (int, optional): Number of rows the stage receives.
+
+    Yields:
+    - The pieces of the iterator, unchanged.
+    """
+    record = {'stage': name, 'rows_in': rows_in, 'rows_out': rows_in}
+    seconds = 0.0
+    pieces = iter(pieces)
+    try:
+        while True:
+            start = time.perf_counter()
+            try:
+                piece = next(pieces)
+            except StopIteration:
+                return
+            finally:
+                seconds += time.perf_counter() - start
+            yield piece
+    finally:
+        _finish_record(record, seconds)
+
+def add_records(records):
+    """
+    Adds stage records collected in a worker process to the server totals and the active recording.
+
+    Parameters:
+    - records (list of dict): Stage records returned by the worker.
+    """
+    for record in records:
+        _add_to_totals(record)
+    current = _current_records.get()
+    if current is not None:
+        current.extend(records)
+
+def call_recorded(func, *args, **kwargs):
+    """
+    Calls a function while recording its stages, for use in worker processes.
+
+    Returns:
+    - tuple: The return value of func and its stage records.
+    """
+    with recording() as records:
+        result = func(*args, **kwargs)
+    return result, records
+
+def server_timing_header(records):
+    """
+    Formats stage records as a Server-Timing header, summing stages that ran several times.
+
+    Parameters:
+    - records (list of dict): Stage records collected by recording().
+
+    Returns:
+    - str: e.g. 'header-detection;dur=1.2, read;dur=35.0', with durations in milliseconds.
+    """
+    durations = {}
+    for record in records:
+        durations[record['stage']] = durations.get(record['stage'], 0.0) + record['seconds']
+    return ", ".join(
+        f"{re.sub(r'[^A-Za-z0-9_-]', '-', name)};dur={seconds * 1000:.1f}" for name, seconds in durations.items()
+    )
+
+def render_metrics(extra_gauges=None):
+    """
+    Renders the stage totals and memory of the server in the Prometheus text format.
+
+    Parameters:
+    - extra_gauges (dict, optional): {metric name: (help text, value)} to add, e.g. the pool queue length.
+
+    Returns:
+    - str: The metrics page.
+    """
+    with _totals_lock:
+        totals = {name: list(values) for name, values in _stage_totals.items()}
+
+    lines = []
+    counters = [
+        ('ivr_stage_runs_total', "Number of times each pipeline stage ran.", 0),
+        ('ivr_stage_seconds_total', "Wall time spent in each pipeline stage.", 1),
+        ('ivr_stage_rows_in_total', "Rows received by each pipeline stage.", 2),
+        ('ivr_stage_rows_out_total', "Rows produced by each pipeline stage.", 3),
+    ]
+    for metric, help_text, idx in counters:
+        lines.append(f"# HELP {metric} {help_text}")
+        lines.append(f"# TYPE {metric} counter")
+        lines.extend(f'{metric}{{stage="{name}"}} {values[idx]}' for name, values in totals.items())
+
+    gauges = {
+        'ivr_process_resident_memory_bytes': ("Resident memory of the server process.", current_rss_mb()),
+        'ivr_process_peak_resident_memory_bytes': ("Highest resident memory of the server process.", peak_rss_mb()),
+    }
+    for metric, (help_text, value_mb) in gauges.items():
+        if value_mb is not None:
+            lines += [f"# HELP {metric} {help_text}", f"# TYPE {metric} gauge", f"{metric} {round(value_mb * 2**20)}"]
+    for metric, (help_text, value) in (extra_gauges or {}).items():
+        lines += [f"# HELP {metric} {help_text}", f"# TYPE {metric} gauge", f"{metric} {value}"]
+    return "\n".join(lines) + "\n"
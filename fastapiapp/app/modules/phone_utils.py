@@ -0,0 +1,32 @@
+import pandas as pd
+
+# Lengths of a Malaysian number including the 60 country code (8 to 10 digit national numbers).
+MIN_PHONE_DIGITS = 10
+MAX_PHONE_DIGITS = 12
+
+def normalize_phone_strings(phones):
+    """
+    Normalizes Malaysian phone numbers to digit strings in the 60XXXXXXXXX format.
+
+    Spaces, dashes and a leading '+' or '00' are removed. Numbers with a
+    leading trunk '0' (e.g. '012-345 6789') get the '6' prepended and numbers
+    without any prefix (e.g. '123456789') get '60' prepended. The string
+    operations run on Arrow-backed strings.
+
+    Parameters:
+    - phones (pd.Series or array-like): Phone numbers as strings or numbers.
+
+    Returns:
+    - pd.Series: Arrow-backed strings, missing where a value is missing or does not
+      have the length of a Malaysian number.
+    """
+    digits = pd.Series(phones, copy=False).astype('string[pyarrow]').str.replace(r'\D', '', regex=True)
+    digits = digits.str.replace(r'^00', '', regex=True)
+
+    has_country_code = (digits.str.startswith('60') & (digits.str.len() >= MIN_PHONE_DIGITS)).fillna(False)
+    has_trunk_zero = digits.str.startswith('0').fillna(False)
+    digits = digits.mask(~has_country_code & has_trunk_zero, '6' + digits)
+    digits = digits.mask(~has_country_code & ~has_trunk_zero, '60' + digits)
+
+    lengths = digits.str.len()
+    return digits.where(((lengths >= MIN_PHONE_DIGITS) & (lengths <= MAX_PHONE_DIGITS)).fillna(False))
@@ -1,4 +1,6 @@
-import re
+from app.modules.dispatch_utils import run_blocking
+from app.modules.perf_utils import stage
+from app.modules.script_parser_utils import parse_text_to_json as _parse_text_to_json
 
 async def parse_questions_and_answers(json_data):
             """
@@ -18,35 +20,8 @@ async def parse_questions_and_answers(json_data):
             return questions_and_answers
 
 async def parse_text_to_json(text_content):
-            """
-            Converts structured text content into a JSON-like dictionary, parsing questions and their answers.
-
-            Parameters:
-            - text_content (str): Text content containing questions and answers in a structured format.
-
-            Returns:
-            - dict: A dictionary representing the parsed content with questions as keys and their details (question text and answers) as values.
-            """
-            data = {}
-            question_re = re.compile(r'^(\d+)\.\s+(.*)')
-            answer_re = re.compile(r'^\s+-\s+(.*)')
-            current_question = ""
-
-            for line in text_content.splitlines():
-                question_match = question_re.match(line)
-                answer_match = answer_re.match(line)
-
-                if question_match:
-                    q_number, q_text = question_match.groups()
-                    current_question = f"Q{q_number}"
-                    data[current_question] = {"question": q_text, "answers": {}}
-                elif answer_match and current_question:
-                    answer_text = answer_match.groups()[0]
-                    flow_no = len(data[current_question]["answers"]) + 1
-                    flow_no_key = f"FlowNo_{int(q_number)+1}={flow_no}"
-                    data[current_question]["answers"][flow_no_key] = answer_text
-
-            return data
+            """Runs _parse_text_to_json in the worker pool, as long scripts take a while to scan."""
+            return await run_blocking(_parse_text_to_json, text_content)
 
 async def rename_columns(df, new_column_names):
             """
@@ -59,5 +34,8 @@ async def rename_columns(df, new_column_names):
             Returns:
             - pd.DataFrame: A DataFrame with updated column names.
             """
-            mapping = {old: new for old, new in zip(df.columns, new_column_names) if new}
-            return df.rename(columns=mapping, inplace=False)
\ No newline at end of file
+            with stage('rename', len(df)) as record:
+                mapping = {old: new for old, new in zip(df.columns, new_column_names) if new}
+                renamed_df = df.rename(columns=mapping, inplace=False)
+                record['rows_out'] = len(renamed_df)
+            return renamed_df
\ No newline at end of file
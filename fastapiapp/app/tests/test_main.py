@@ -1,23 +1,78 @@
 from fastapi.testclient import TestClient
 from io import BytesIO
-from modules.data_cleaner_utils_page1 import process_file
-from modules.questionnaire_utils_page2 import parse_questions_and_answers, rename_columns
-from modules.keypress_decoder_utils_page3 import parse_text_to_json, custom_sort, classify_income, process_file_content, flatten_json_structure
-from streamlit_ivr_survey_automation.fastapiapp.main import app
+from main import app
+import pandas as pd
 import json
 
 client = TestClient(app)
 
+# A small dialer export: a report title on the first line, the header on the second,
+# and one field per answered FlowNo after UserKeyPress.
+SAMPLE_CSV = (
+    "Broadcast List Report for PETALING JAYA MANDARIN EVENING,,,,\n"
+    "No,PhoneNo,CallDate,Status,UserKeyPress\n"
+    "1,60123456789,2024-01-01,Answered,FlowNo_2=1,FlowNo_3=2\n"
+    "2,60123456780,2024-01-01,NoAnswer,\n"
+    "3,60123456781,2024-01-01,Answered,FlowNo_2=2,FlowNo_3=1\n"
+    "4,60123456782,2024-01-01,Answered,FlowNo_2=1\n"
+).encode()
+
+SAMPLE_SCRIPT = (
+    "1. What is your gender?\n"
+    "   - Male\n"
+    "   - Female\n"
+    "2. Which age group are you in?\n"
+    "   - 18-30\n"
+    "   - 31 and above\n"
+).encode()
+
 # Sample test for `process_file_content` - Adjust as needed for actual implementation
 def test_process_file():
-    with open("C:\Users\User\Desktop\Invoke Project\Invoke_Streamlit_Survey\streamlit_ivr_survey_automation\fastapiapp\app\csv_files\Broadcast_List_Report_for_PETALING JAYA MANDARIN EVENING.csv", "rb") as file:
-        response = client.post(
-            "/utilities/",
-            data={"action": "process_file"},
-            files={"uploaded_file": file}
-        )
+    response = client.post(
+        "/utilities/",
+        data={"action": "process_file"},
+        files={"uploaded_file": ("Broadcast_List_Report.csv", BytesIO(SAMPLE_CSV), "text/csv")}
+    )
+    assert response.status_code == 200
+    result = response.json()
+    assert result["total_calls"] == 4
+    assert result["total_pickup"] == 2
+    assert len(result["phonenum_list"]["PhoneNo"]) == 3
+    assert result["rejections"] == {"no_keypress": 1, "incomplete": 1, "invalid_keypress": 0, "invalid_phone": 0}
+
+def test_upload_rejects_invalid_calls():
+    csv = SAMPLE_CSV + (
+        "5,0123456783,2024-01-01,Answered,FlowNo_2=1,FlowNo_3=1\n"
+        "6,60123456784,2024-01-01,Answered,FlowNo_2=1,Hello\n"
+        "7,12345,2024-01-01,Answered,FlowNo_2=1,FlowNo_3=2\n"
+    ).encode()
+    response = client.post(
+        "/upload/",
+        files={"files": ("first.csv", BytesIO(csv), "text/csv")}
+    )
     assert response.status_code == 200
-    # Add specific assertions based on expected response structure
+    assert response.headers["X-Total-Pickups"] == "5"
+    assert response.headers["X-Rejected-Calls"] == "no_keypress=1, incomplete=1, invalid_keypress=1, invalid_phone=1"
+    df = pd.read_csv(BytesIO(response.content), dtype=str)
+    # The local number is normalized, and the malformed and invalid ones are left out
+    assert sorted(df.iloc[:, 0]) == ["60123456781", "60123456783", "60123456789"]
+
+def test_process_file_with_quoted_commas():
+    csv = (
+        "Broadcast List Report,,,,\n"
+        "No,PhoneNo,Status,UserKeyPress\n"
+        '1,60123456789,"Answered, ok",FlowNo_2=1,FlowNo_3=2\n'
+        "2,60123456780,NoAnswer,\n"
+    ).encode()
+    response = client.post(
+        "/utilities/",
+        data={"action": "process_file"},
+        files={"uploaded_file": ("Broadcast_List_Report.csv", BytesIO(csv), "text/csv")}
+    )
+    assert response.status_code == 200
+    result = response.json()
+    assert result["total_pickup"] == 1
+    assert result["df_complete"]["2"] == {"0": "FlowNo_3=2"}
 
 def test_parse_questions_and_answers():
     sample_json_data = '{"question1": {"question": "What is FastAPI?", "answers": {"1": "A web framework"}}}'
@@ -29,7 +84,7 @@ def test_parse_questions_and_answers():
         }
     )
     assert response.status_code == 200
-    # Assert expected parsed structure
+    assert response.json() == {"question1": {"question": "What is FastAPI?", "answers": ["A web framework"]}}
 
 def test_rename_columns():
     sample_df_json = '[{"oldName1": "value1", "oldName2": "value2"}]'
@@ -43,7 +98,7 @@ def test_rename_columns():
         }
     )
     assert response.status_code == 200
-    # Assert new column names in response
+    assert response.json() == [{"newName1": "value1", "newName2": "value2"}]
 
 def test_parse_text_to_json():
     text_content = "1. Question one\n- Answer 1\n2. Question two\n- Answer 2"
@@ -55,11 +110,26 @@ def test_parse_text_to_json():
         }
     )
     assert response.status_code == 200
-    # Assert JSON structure of parsed text
+    assert list(response.json()) == ["Q1", "Q2"]
+
+def test_parse_text_to_json_numbers_flow_nos_by_position():
+    text_content = "4. Question four\n   - Yes\n4a. Follow-up\n(Often)\n( Rarely (monthly) )\n"
+    response = client.post(
+        "/utilities/",
+        data={
+            "action": "parse_text_to_json",
+            "text_content": text_content
+        }
+    )
+    assert response.status_code == 200
+    assert response.json() == {
+        "Q4": {"question": "Question four", "answers": {"FlowNo_2=1": "Yes"}},
+        "Q4a": {"question": "Follow-up", "answers": {"FlowNo_3=1": "Often", "FlowNo_3=2": "Rarely (monthly)"}},
+    }
 
 def test_custom_sort():
     # Example assuming a specific input and output for custom_sort, adjust as needed
-    sort_keys = '["FlowNo_2=1", "FlowNo_3=2"]'
+    sort_keys = '["FlowNo_10=1", "FlowNo_3=2", "phonenum", "FlowNo_3=1"]'
     response = client.post(
         "/utilities/",
         data={
@@ -68,7 +138,24 @@ def test_custom_sort():
         }
     )
     assert response.status_code == 200
-    # Assert sorted order
+    assert response.json() == {"sorted_keys": ["FlowNo_3=1", "FlowNo_3=2", "FlowNo_10=1", "phonenum"]}
+
+def test_flow_no_index():
+    renamed = (
+        "phonenum,Gender,Age,Set\n"
+        "60123456789,FlowNo_2=1,FlowNo_3=10,IVR\n"
+        "60123456781,,FlowNo_3=2,IVR\n"
+    ).encode()
+    response = client.post(
+        "/utilities/",
+        data={"action": "flow_no_index"},
+        files={"uploaded_file": ("renamed.csv", BytesIO(renamed), "text/csv")}
+    )
+    assert response.status_code == 200
+    index = response.json()
+    assert index["question_columns"] == ["Gender", "Age"]
+    assert index["values"] == {"Gender": ["FlowNo_2=1"], "Age": ["FlowNo_3=2", "FlowNo_3=10"]}
+    assert index["flow_nos"]["FlowNo_3=10"] == [3, 10]
 
 def test_classify_income():
     income = "RM4,850 & below"
@@ -82,6 +169,20 @@ def test_classify_income():
     assert response.status_code == 200
     assert response.json() == {"income_category": "B40"}
 
+def test_add_derived_columns():
+    records = [
+        {"phonenum": "60123456789", "IncomeRange": "RM4,851 to RM10,960", "State": "Johor", "Set": "IVR"},
+        {"phonenum": "60123456781", "IncomeRange": "Refused", "State": "Atlantis", "Set": "IVR"},
+    ]
+    response = client.post(
+        "/utilities/",
+        data={"action": "add_derived_columns", "json_data": json.dumps(records)}
+    )
+    assert response.status_code == 200
+    result = response.json()
+    assert list(result[0]) == ["phonenum", "IncomeRange", "IncomeGroup", "State", "Region", "Set"]
+    assert [(row["IncomeGroup"], row["Region"]) for row in result] == [("M40", "Southern"), (None, "Other")]
+
 def test_flatten_json_structure():
     sample_json_data = '{"Q1": {"question": "What is FastAPI?", "answers": {"FlowNo_2=1": "A web framework"}}}'
     response = client.post(
@@ -92,19 +193,18 @@ def test_flatten_json_structure():
         }
     )
     assert response.status_code == 200
-    # Assert flattened structure
-
-client = TestClient(app)
+    assert response.json() == {"FlowNo_2=1": "A web framework"}
 
 def test_process_file_content_with_text():
-    file_content = BytesIO(b"Sample text content")
     response = client.post(
         "/utilities/",
         data={"action": "process_file_content"},
-        files={"uploaded_file": ("C:\Users\User\Desktop\Invoke Project\Invoke_Streamlit_Survey\streamlit_ivr_survey_automation\fastapiapp\app\script_json_files\PJ Scripts with Formatting.txt", file_content, "text/plain")}
+        files={"uploaded_file": ("PJ Scripts with Formatting.txt", BytesIO(SAMPLE_SCRIPT), "text/plain")}
     )
     assert response.status_code == 200
-    # Add assertions based on expected behavior of process_file_content with text input
+    result = response.json()
+    assert result["error"] is None
+    assert result["flow_no_mappings"]["Q1"]["answers"] == {"FlowNo_2=1": "Male", "FlowNo_2=2": "Female"}
 
 def test_process_file_content_with_json():
     # Preparing JSON content for upload
@@ -112,7 +212,218 @@ def test_process_file_content_with_json():
     response = client.post(
         "/utilities/",
         data={"action": "process_file_content"},
-        files={"uploaded_file": ("C:\Users\User\Desktop\Invoke Project\Invoke_Streamlit_Survey\streamlit_ivr_survey_automation\fastapiapp\app\script_json_files\PJ Script JSON Format.json", BytesIO(json_content.encode()), "application/json")}
+        files={"uploaded_file": ("PJ Script JSON Format.json", BytesIO(json_content.encode()), "application/json")}
+    )
+    assert response.status_code == 200
+    assert response.json()["flow_no_mappings"] == {"key": "value"}
+
+def test_unknown_action():
+    response = client.post("/utilities/", data={"action": "does_not_exist"})
+    assert response.status_code == 400
+
+def test_upload_streams_cleaned_csv():
+    response = client.post(
+        "/upload/",
+        files=[
+            ("files", ("first.csv", BytesIO(SAMPLE_CSV), "text/csv")),
+            ("files", ("second.csv", BytesIO(SAMPLE_CSV), "text/csv")),
+        ]
+    )
+    assert response.status_code == 200
+    assert response.headers["X-Total-Calls"] == "8"
+    assert response.headers["X-Total-Pickups"] == "4"
+    assert response.headers["X-Total-CRs"] == "4"
+    df = pd.read_csv(BytesIO(response.content), dtype=str)
+    assert len(df) == 4
+    assert list(df["Set"].unique()) == ["IVR"]
+
+def test_upload_phonenum_parquet():
+    response = client.post(
+        "/upload/",
+        data={"output": "phonenum", "response_format": "parquet"},
+        files={"files": ("first.csv", BytesIO(SAMPLE_CSV), "text/csv")}
     )
     assert response.status_code == 200
-    # Add assertions based on expected behavior of process_file_content with JSON input
+    df = pd.read_parquet(BytesIO(response.content))
+    assert list(df.columns) == ["phonenum"]
+    assert len(df) == 3
+
+def test_upload_rejects_unknown_format():
+    response = client.post(
+        "/upload/",
+        data={"response_format": "xlsx"},
+        files={"files": ("first.csv", BytesIO(SAMPLE_CSV), "text/csv")}
+    )
+    assert response.status_code == 400
+
+def test_questionnaire():
+    response = client.post(
+        "/questionnaire/",
+        files={"script_file": ("script.txt", BytesIO(SAMPLE_SCRIPT), "text/plain")}
+    )
+    assert response.status_code == 200
+    assert response.json()["simple_mappings"]["FlowNo_3=2"] == "31 and above"
+
+def test_decode_with_script():
+    renamed = (
+        "phonenum,Gender,Age,Set\n"
+        "60123456789,FlowNo_2=1,FlowNo_3=2,IVR\n"
+        "60123456781,FlowNo_2=2,FlowNo_3=1,IVR\n"
+    ).encode()
+    response = client.post(
+        "/decode/",
+        data={"excluded_flow_nos": json.dumps({"Age": ["FlowNo_3=1"]})},
+        files={
+            "data_file": ("renamed.csv", BytesIO(renamed), "text/csv"),
+            "script_file": ("script.txt", BytesIO(SAMPLE_SCRIPT), "text/plain"),
+        }
+    )
+    assert response.status_code == 200
+    df = pd.read_csv(BytesIO(response.content), dtype=str)
+    assert df.to_dict(orient="records") == [
+        {"phonenum": "60123456789", "Gender": "Male", "Age": "31 and above", "Set": "IVR"}
+    ]
+
+def test_decode_rejects_invalid_fields():
+    renamed = (
+        "phonenum,Gender,Age,Set\n"
+        "60123456789,FlowNo_2=1,FlowNo_3=2,IVR\n"
+    ).encode()
+    for field, value in [
+        ("drop_cols", ["Nope"]),
+        ("drop_cols", {"Gender": True}),
+        ("keypress_mappings", {"Gender": "Male"}),
+        ("keypress_mappings", {"Nope": {"FlowNo_2=1": "Male"}}),
+        ("excluded_flow_nos", {"Age": "FlowNo_3=1"}),
+    ]:
+        response = client.post(
+            "/decode/",
+            data={field: json.dumps(value)},
+            files={"data_file": ("renamed.csv", BytesIO(renamed), "text/csv")}
+        )
+        assert response.status_code == 400, (field, value)
+        assert field in response.json()["detail"]
+
+def test_overloaded_pool_answers_429(monkeypatch):
+    from app.modules import dispatch_utils
+    monkeypatch.setattr(dispatch_utils, "MAX_PENDING", 0)
+    response = client.post(
+        "/upload/",
+        files={"files": ("first.csv", BytesIO(SAMPLE_CSV), "text/csv")}
+    )
+    assert response.status_code == 429
+    assert "Retry-After" in response.headers
+
+def test_slow_job_answers_504(monkeypatch):
+    import time
+    from app.modules import dispatch_utils
+    from app.modules import keypress_decoder_utils_page3
+    monkeypatch.setattr(dispatch_utils, "REQUEST_TIMEOUT", 0.05)
+    monkeypatch.setattr(keypress_decoder_utils_page3, "_parse_text_to_json", lambda text: time.sleep(0.5))
+    response = client.post(
+        "/utilities/",
+        data={"action": "parse_text_to_json", "text_content": "1. Question one"}
+    )
+    assert response.status_code == 504
+
+def wait_for_job(job_client, job_id):
+    import time
+    for _ in range(200):
+        job = job_client.get(f"/jobs/{job_id}").json()
+        if job["status"] in ("completed", "failed"):
+            return job
+        time.sleep(0.05)
+    raise AssertionError(f"Job {job_id} did not finish")
+
+def use_temporary_job_store(monkeypatch, tmp_path):
+    from app.modules import job_utils
+    monkeypatch.setattr(job_utils, "JOB_DIR", str(tmp_path))
+    monkeypatch.setattr(job_utils, "JOB_DB_PATH", str(tmp_path / "jobs.db"))
+    return job_utils
+
+def test_background_job(monkeypatch, tmp_path):
+    use_temporary_job_store(monkeypatch, tmp_path)
+    with TestClient(app) as job_client:
+        response = job_client.post(
+            "/jobs/",
+            files=[
+                ("files", ("first.csv", BytesIO(SAMPLE_CSV), "text/csv")),
+                ("files", ("broken.csv", BytesIO(b"not a dialer export\n"), "text/csv")),
+                ("files", ("second.csv", BytesIO(SAMPLE_CSV), "text/csv")),
+            ]
+        )
+        assert response.status_code == 202
+        job_id = response.json()["job_id"]
+
+        job = wait_for_job(job_client, job_id)
+        assert job["status"] == "completed"
+        assert [f["status"] for f in job["files"]] == ["completed", "failed", "completed"]
+        assert (job["total_calls"], job["total_pickup"]) == (8, 4)
+
+        cleaned = job_client.get(job["artifacts"][0])
+        assert len(pd.read_csv(BytesIO(cleaned.content))) == 4
+
+        events = job_client.get(f"/jobs/{job_id}/events")
+        assert '"status": "completed"' in events.text
+
+def test_background_job_resumes_after_restart(monkeypatch, tmp_path):
+    job_utils = use_temporary_job_store(monkeypatch, tmp_path)
+    # A job left running by a previous server, with its first file already done
+    job_id = job_utils.create_job(["first.csv", "second.csv"])
+    for position in range(2):
+        with open(job_utils.job_path(job_id, "inputs", f"{position}.csv"), "wb") as stored:
+            stored.write(SAMPLE_CSV)
+    job_utils.clean_job_file(job_utils.job_path(job_id), 0)
+    job_utils._set_file_result(job_id, 0, "completed", 4, 2)
+    job_utils._set_job_status(job_id, "running")
+
+    with TestClient(app) as job_client:
+        job = wait_for_job(job_client, job_id)
+    assert job["status"] == "completed"
+    assert job["files_done"] == 2
+    assert job["total_calls"] == 8
+
+def test_unknown_job(monkeypatch, tmp_path):
+    use_temporary_job_store(monkeypatch, tmp_path)
+    assert client.get("/jobs/does-not-exist").status_code == 404
+
+def test_upload_streams_arrow_from_accept_header():
+    import pyarrow as pa
+    response = client.post(
+        "/upload/",
+        headers={"Accept": "application/json;q=0.5, application/vnd.apache.arrow.stream"},
+        files={"files": ("first.csv", BytesIO(SAMPLE_CSV), "text/csv")}
+    )
+    assert response.status_code == 200
+    assert response.headers["content-type"] == "application/vnd.apache.arrow.stream"
+    df = pa.ipc.open_stream(response.content).read_pandas()
+    assert len(df) == 2
+    assert list(df["Set"].astype(str).unique()) == ["IVR"]
+
+def test_process_file_streams_ndjson():
+    response = client.post(
+        "/utilities/",
+        headers={"Accept": "application/x-ndjson"},
+        data={"action": "process_file"},
+        files={"uploaded_file": ("Broadcast_List_Report.csv", BytesIO(SAMPLE_CSV), "text/csv")}
+    )
+    assert response.status_code == 200
+    assert response.headers["X-Total-Calls"] == "4"
+    rows = [json.loads(line) for line in response.text.splitlines()]
+    assert len(rows) == 2
+    assert rows[0]["0"] == "60123456789"
+
+def test_upload_reports_server_timing_and_metrics():
+    response = client.post(
+        "/upload/",
+        files={"files": ("first.csv", BytesIO(SAMPLE_CSV), "text/csv")}
+    )
+    assert response.status_code == 200
+    stages = [entry.split(";")[0] for entry in response.headers["Server-Timing"].split(", ")]
+    assert stages[:3] == ["header-detection", "read", "validate"]
+    assert "merge" in stages
+
+    metrics = client.get("/metrics").text
+    assert 'ivr_stage_runs_total{stage="read"}' in metrics
+    assert 'ivr_stage_runs_total{stage="export"}' in metrics
+    assert "ivr_worker_pending_jobs 0" in metrics
@@ -1,9 +1,329 @@
 # # #
-from fastapi import FastAPI, HTTPException, UploadFile, File, Form
-from app.modules.data_cleaner_utils_page1 import process_file
+import asyncio
+from contextlib import asynccontextmanager
+from typing import List, Optional
+from fastapi import FastAPI, HTTPException, UploadFile, File, Form, Header
+from fastapi.concurrency import run_in_threadpool
+from fastapi.responses import FileResponse, PlainTextResponse, StreamingResponse
+from app.modules.data_cleaner_utils_page1 import process_file, clean_file, merger
 from app.modules.questionnaire_utils_page2 import parse_questions_and_answers, rename_columns
-from app.modules.keypress_decoder_utils_page3 import parse_text_to_json, custom_sort, classify_income, process_file_content, flatten_json_structure
+from app.modules.derived_column_utils import add_derived_columns
+from app.modules.keypress_decoder_utils_page3 import parse_text_to_json, custom_sort, classify_income, process_file_content, flatten_json_structure, build_flow_no_index, decode_and_deduplicate
+from app.modules.dispatch_utils import run_blocking, run_blocking_on_file, shutdown_executor, pending_jobs
+from app.modules.perf_utils import recording, server_timing_header, render_metrics
+from app.modules.job_utils import submit_job, get_job, resume_jobs, job_path, CLEANED_ARTIFACT, PHONENUM_ARTIFACT, FINISHED_STATES
+from app.modules.export_utils import dataframe_response, format_from_accept
+from app.modules.validation_utils import add_rejections
 import pandas as pd
 import json
 
-app = FastAPI()
+@asynccontextmanager
+async def lifespan(app):
+    resume_jobs()
+    yield
+    shutdown_executor()
+
+app = FastAPI(lifespan=lifespan)
+
+# Seconds between two progress checks of a job event stream.
+JOB_EVENTS_INTERVAL = 1.0
+
+def parse_json_field(value, field_name):
+    """Decodes a JSON form field, answering 400 when it is not valid JSON."""
+    try:
+        return json.loads(value)
+    except (TypeError, json.JSONDecodeError):
+        raise HTTPException(status_code=400, detail=f"Field '{field_name}' must be valid JSON.")
+
+def check_decode_fields(columns, keypress_mappings, excluded_flow_nos, drop_cols):
+    """Checks the decoding fields of /decode/ against the columns of the data, answering 400 when they do not fit."""
+    if not isinstance(keypress_mappings, dict) or not all(
+            isinstance(mappings, dict) and all(isinstance(answer, str) for answer in mappings.values())
+            for mappings in keypress_mappings.values()):
+        raise HTTPException(status_code=400, detail="Field 'keypress_mappings' must map columns to {keypress value: answer} objects.")
+    if not isinstance(excluded_flow_nos, dict) or not all(
+            isinstance(values, list) and all(isinstance(value, str) for value in values)
+            for values in excluded_flow_nos.values()):
+        raise HTTPException(status_code=400, detail="Field 'excluded_flow_nos' must map columns to lists of keypress values.")
+    if not isinstance(drop_cols, list) or not all(isinstance(col, str) for col in drop_cols):
+        raise HTTPException(status_code=400, detail="Field 'drop_cols' must be a list of column names.")
+
+    for field_name, field_columns in (('keypress_mappings', keypress_mappings), ('excluded_flow_nos', excluded_flow_nos), ('drop_cols', drop_cols)):
+        unknown = [col for col in field_columns if col not in columns]
+        if unknown:
+            raise HTTPException(status_code=400, detail=f"Field '{field_name}' names columns that are not in the data: {', '.join(unknown)}.")
+
+def format_rejections(rejections):
+    """Formats rejection counts, as returned by count_rejections, for the X-Rejected-Calls header."""
+    return ', '.join(f'{reason}={count}' for reason, count in rejections.items())
+
+@app.middleware("http")
+async def add_server_timing(request, call_next):
+    """
+    Reports the pipeline stages run for a request in a Server-Timing header.
+
+    Stages of a streamed response body run after the headers are sent, so
+    they only show up in /metrics.
+    """
+    with recording() as records:
+        response = await call_next(request)
+    if records:
+        response.headers['Server-Timing'] = server_timing_header(records)
+    return response
+
+@app.get("/metrics")
+async def metrics():
+    """Exposes the pipeline stage totals and memory use of the server in the Prometheus text format."""
+    return PlainTextResponse(
+        render_metrics({'ivr_worker_pending_jobs': ("Jobs running or waiting in the worker pool.", pending_jobs())}),
+        media_type="text/plain; version=0.0.4",
+    )
+
+@app.post("/upload/")
+async def upload(
+    files: List[UploadFile] = File(...),
+    output: str = Form('cleaned'),
+    response_format: Optional[str] = Form(None),
+    accept: Optional[str] = Header(None),
+):
+    """
+    Cleans one or more dialer CSV exports and streams the merged result.
+
+    Uploads are spooled to temporary files by the multipart parser and read
+    from there, and the cleaning runs in the worker pool. The counters are
+    returned as X-Total-Calls, X-Total-Pickups and X-Total-CRs headers, and the
+    calls left out per rejection reason as X-Rejected-Calls, e.g.
+    'no_keypress=120, incomplete=35, invalid_keypress=0, invalid_phone=2'.
+
+    The format is taken from the response_format field, else from the Accept
+    header (e.g. application/vnd.apache.arrow.stream or application/x-ndjson),
+    else CSV.
+
+    Form fields:
+    - files: The dialer CSV exports.
+    - output: 'cleaned' for the cleaned data or 'phonenum' for the dialed phone numbers.
+    - response_format: 'csv', 'parquet', 'arrow' or 'ndjson'.
+    """
+    if output not in ('cleaned', 'phonenum'):
+        raise HTTPException(status_code=400, detail="Field 'output' must be 'cleaned' or 'phonenum'.")
+
+    results = []
+    for upload_file in files:
+        try:
+            results.append(await run_blocking_on_file(clean_file, upload_file.file))
+        except (KeyError, ValueError) as e:
+            raise HTTPException(status_code=400, detail=f"Error processing {upload_file.filename}: {e}")
+
+    df_merge, phonenum_combined = merger([result[0] for result in results], [result[1] for result in results])
+    headers = {
+        'X-Total-Calls': str(sum(result[2] for result in results)),
+        'X-Total-Pickups': str(sum(result[3] for result in results)),
+        'X-Total-CRs': str(len(df_merge)),
+        'X-Rejected-Calls': format_rejections(add_rejections(*(result[4] for result in results))),
+    }
+    response_format = response_format or format_from_accept(accept) or 'csv'
+    if output == 'phonenum':
+        return dataframe_response(phonenum_combined.drop_duplicates(), response_format, 'IVR_Dialed_Phonenum', headers)
+    return dataframe_response(df_merge, response_format, 'IVR_Cleaned_Data', headers)
+
+@app.post("/jobs/", status_code=202)
+async def submit_batch(files: List[UploadFile] = File(...)):
+    """
+    Submits a batch of dialer CSV exports to be cleaned in the background.
+
+    The uploads are stored with the job, so a job that is interrupted by a
+    restart resumes from its first unfinished file.
+
+    Returns:
+    - The job id and the URLs to follow its progress.
+    """
+    job_id = await submit_job(files)
+    return {"job_id": job_id, "status_url": f"/jobs/{job_id}", "events_url": f"/jobs/{job_id}/events"}
+
+async def get_job_or_404(job_id):
+    # The job store is SQLite, so it is read off the event loop
+    job = await run_in_threadpool(get_job, job_id)
+    if job is None:
+        raise HTTPException(status_code=404, detail=f"Unknown job: {job_id}")
+    return job
+
+@app.get("/jobs/{job_id}")
+async def job_status(job_id: str):
+    """Returns the state, per-file progress, counters and artifact URLs of a job."""
+    return await get_job_or_404(job_id)
+
+@app.get("/jobs/{job_id}/events")
+async def job_events(job_id: str):
+    """
+    Streams the progress of a job as server-sent events.
+
+    An event carrying the job description is sent whenever it changes; the
+    stream ends once the job is completed or failed.
+    """
+    job = await get_job_or_404(job_id)
+
+    async def events(job):
+        last_sent = None
+        while True:
+            if job != last_sent:
+                yield f"data: {json.dumps(job)}\n\n"
+                last_sent = job
+            if job['status'] in FINISHED_STATES:
+                return
+            await asyncio.sleep(JOB_EVENTS_INTERVAL)
+            job = await run_in_threadpool(get_job, job_id)
+
+    return StreamingResponse(events(job), media_type="text/event-stream", headers={"Cache-Control": "no-cache"})
+
+@app.get("/jobs/{job_id}/artifacts/{name}")
+async def job_artifact(job_id: str, name: str):
+    """Downloads an artifact of a completed job."""
+    job = await get_job_or_404(job_id)
+    if name not in (CLEANED_ARTIFACT, PHONENUM_ARTIFACT) or f"/jobs/{job_id}/artifacts/{name}" not in job['artifacts']:
+        raise HTTPException(status_code=404, detail=f"Unknown artifact: {name}")
+    return FileResponse(job_path(job_id, name), media_type="text/csv", filename=name)
+
+@app.post("/questionnaire/")
+async def questionnaire(script_file: UploadFile = File(...)):
+    """
+    Parses a questionnaire script (.txt with formatting or .json flow mapping).
+
+    Returns the FlowNo mappings used by the decoder and the flattened
+    FlowNo-to-answer mapping used to autofill decoded values.
+    """
+    flow_no_mappings, message, error = await process_file_content(script_file)
+    if error:
+        raise HTTPException(status_code=400, detail=error)
+    return {
+        "flow_no_mappings": flow_no_mappings,
+        "simple_mappings": await flatten_json_structure(flow_no_mappings),
+        "message": message,
+    }
+
+@app.post("/decode/")
+async def decode(
+    data_file: UploadFile = File(...),
+    script_file: Optional[UploadFile] = File(None),
+    keypress_mappings: str = Form('{}'),
+    excluded_flow_nos: str = Form('{}'),
+    drop_cols: str = Form('[]'),
+    response_format: Optional[str] = Form(None),
+    accept: Optional[str] = Header(None),
+):
+    """
+    Decodes the keypresses of renamed IVR data and streams the decoded data.
+
+    Form fields:
+    - data_file: Renamed data as CSV, with 'phonenum' first, one column per question and 'Set' last.
+    - script_file: Optional questionnaire script; its answers decode every question column
+      that has no explicit mapping.
+    - keypress_mappings: JSON {column: {keypress value: readable answer}}.
+    - excluded_flow_nos: JSON {column: [keypress values whose rows are dropped]}.
+    - drop_cols: JSON list of question columns to drop.
+    - response_format: 'csv', 'parquet', 'arrow' or 'ndjson'; by default chosen from the Accept header as in /upload/.
+    """
+    keypress_mappings = parse_json_field(keypress_mappings, 'keypress_mappings')
+    excluded_flow_nos = parse_json_field(excluded_flow_nos, 'excluded_flow_nos')
+    drop_cols = parse_json_field(drop_cols, 'drop_cols')
+
+    renamed_data = await run_blocking_on_file(pd.read_csv, data_file.file, dtype=str)
+    check_decode_fields(renamed_data.columns, keypress_mappings, excluded_flow_nos, drop_cols)
+
+    if script_file is not None:
+        flow_no_mappings, _, error = await process_file_content(script_file)
+        if error:
+            raise HTTPException(status_code=400, detail=error)
+        simple_mappings = await flatten_json_structure(flow_no_mappings)
+        for col in renamed_data.columns[1:-1]:
+            keypress_mappings.setdefault(col, simple_mappings)
+
+    decoded_data = await run_blocking(decode_and_deduplicate, renamed_data, keypress_mappings, excluded_flow_nos, drop_cols)
+    return dataframe_response(decoded_data, response_format or format_from_accept(accept) or 'csv', 'IVR_Decoded_Data')
+
+@app.post("/utilities/")
+async def utilities(
+    action: str = Form(...),
+    uploaded_file: Optional[UploadFile] = File(None),
+    json_data: Optional[str] = Form(None),
+    new_column_names: Optional[str] = Form(None),
+    text_content: Optional[str] = Form(None),
+    sort_keys: Optional[str] = Form(None),
+    income: Optional[str] = Form(None),
+    accept: Optional[str] = Header(None),
+):
+    """
+    Exposes the individual helper functions, selected by the 'action' form field.
+
+    For 'process_file', an Accept header naming CSV, Parquet, Arrow or NDJSON
+    streams df_complete in that format, with the counters as X-Total-Calls,
+    X-Total-Pickups and X-Rejected-Calls headers, instead of returning every frame as a JSON dict.
+
+    'flow_no_index' scans renamed data uploaded as CSV once and returns its
+    columns in FlowNo order with the sorted keypress values of every question
+    (see build_flow_no_index), so clients need not sort and split them again.
+
+    'add_derived_columns' takes decoded records as json_data and returns them
+    with IncomeGroup, Region and the other configured derived columns.
+    """
+    if action == "process_file":
+        if uploaded_file is None:
+            raise HTTPException(status_code=400, detail="Field 'uploaded_file' is required.")
+        response_format = format_from_accept(accept)
+        try:
+            if response_format is None:
+                return await process_file(uploaded_file.file)
+            df_complete, _, total_calls, total_pickup, rejections = await run_blocking_on_file(clean_file, uploaded_file.file)
+        except (KeyError, ValueError) as e:
+            raise HTTPException(status_code=400, detail=f"Error processing file: {e}")
+        headers = {
+            'X-Total-Calls': str(total_calls),
+            'X-Total-Pickups': str(total_pickup),
+            'X-Rejected-Calls': format_rejections(rejections),
+        }
+        return dataframe_response(df_complete, response_format, 'IVR_Cleaned_Data', headers)
+
+    if action == "process_file_content":
+        if uploaded_file is None:
+            raise HTTPException(status_code=400, detail="Field 'uploaded_file' is required.")
+        flow_no_mappings, message, error = await process_file_content(uploaded_file)
+        return {"flow_no_mappings": flow_no_mappings, "message": message, "error": error}
+
+    if action == "parse_questions_and_answers":
+        return await parse_questions_and_answers(parse_json_field(json_data, 'json_data'))
+
+    if action == "parse_text_to_json":
+        return await parse_text_to_json(text_content or "")
+
+    if action == "flatten_json_structure":
+        return await flatten_json_structure(parse_json_field(json_data, 'json_data'))
+
+    if action == "rename_columns":
+        df = pd.DataFrame(parse_json_field(json_data, 'json_data'))
+        names = parse_json_field(new_column_names, 'new_column_names')
+        if isinstance(names, dict):
+            # Accept {old: new} as well as a list of new names in column order
+            names = [names.get(col, "") for col in df.columns]
+        renamed_df = await rename_columns(df, names)
+        return renamed_df.to_dict(orient='records')
+
+    if action == "custom_sort":
+        keys = parse_json_field(sort_keys, 'sort_keys')
+        sort_values = [await custom_sort(key) for key in keys]
+        return {"sorted_keys": [key for _, key in sorted(zip(sort_values, keys))]}
+
+    if action == "flow_no_index":
+        if uploaded_file is None:
+            raise HTTPException(status_code=400, detail="Field 'uploaded_file' is required.")
+        renamed_data = await run_blocking_on_file(pd.read_csv, uploaded_file.file, dtype=str)
+        return await run_blocking(build_flow_no_index, renamed_data)
+
+    if action == "add_derived_columns":
+        df = pd.DataFrame(parse_json_field(json_data, 'json_data'))
+        derived_df = await run_blocking(add_derived_columns, df)
+        # Answers without a derived value are returned as null
+        return derived_df.astype(object).where(derived_df.notna(), None).to_dict(orient='records')
+
+    if action == "classify_income":
+        return {"income_category": await classify_income(income)}
+
+    raise HTTPException(status_code=400, detail=f"Unknown action: {action}")
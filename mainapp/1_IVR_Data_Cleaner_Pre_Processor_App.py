@@ -2,7 +2,12 @@ import streamlit as st
 import pandas as pd
 from datetime import datetime
 from modules.security_utils import check_password
-from modules.data_cleaner_utils_page1 import process_file
+from modules.data_cleaner_utils_page1 import process_files_cached, combine_results
+from modules.exclusion_utils import add_dialed_numbers, exclusion_store_stats, exclude_dialed_numbers
+from modules.export_utils import EXPORT_FORMATS, with_extension, bump_data_version, lazy_download_button
+from modules.validation_utils import rejection_report
+from modules.session_data_utils import compact_dataframe, store_dataset
+from modules.perf_utils import recording, store_performance, render_performance_panel
 from PIL import Image
 import numpy as np
 
@@ -48,21 +53,13 @@ def run():
         st.session_state['total_calls_made'] = 0
         st.session_state['total_pickups'] = 0
         st.session_state['total_CRs'] = 0
+        st.session_state['file_count'] = 0
 
-    if 'df_merge' not in st.session_state:
-        st.session_state['df_merge'] = pd.DataFrame()
+    if 'cleaned_data' not in st.session_state:
+        st.session_state['cleaned_data'] = pd.DataFrame()
         
     if 'phonenum_combined' not in st.session_state:
         st.session_state['phonenum_combined'] = pd.DataFrame()
-        
-    # Check if data is already processed and available in session state
-    if 'processed' not in st.session_state:
-        st.session_state['processed'] = False
-        st.session_state['all_data'] = []
-        st.session_state['all_phonenum'] = []
-        st.session_state['total_calls_made'] = 0
-        st.session_state['total_pickups'] = 0
-        st.session_state['file_count'] = 0
 
     if check_password():
         st.title('IVR Data Cleaner🏹')
@@ -77,50 +74,31 @@ def run():
             st.write(f"Number of files uploaded: {len(uploaded_files)}")
 
         if st.button('Process'):
-            with st.spinner("Processing the files..."):
-                # Reset counters and lists
-                st.session_state['all_data'] = []
-                st.session_state['all_phonenum'] = []
-                st.session_state['total_calls_made'] = 0
-                st.session_state['total_pickups'] = 0
-                st.session_state['file_count'] = 0
-                st.session_state['processed'] = True
-
-                # Correctly unpack returned values from process_file
-                for uploaded_file in uploaded_files:
-                    df_complete, phonenum_list, total_calls_made, total_of_pickups, df_merge = process_file(uploaded_file)
-
-                    # Append or aggregate the results as needed
-                    st.session_state['all_data'].append(df_complete)
-                    st.session_state['all_phonenum'].append(phonenum_list)
-                    st.session_state['total_calls_made'] += total_calls_made
-                    st.session_state['total_pickups'] += total_of_pickups
-                    st.session_state['file_count'] += 1
-                    st.session_state['total_CRs'] += len(df_complete)
-                     # Aggregate the results
-                    st.session_state['df_merge'] = pd.concat([st.session_state['df_merge'], df_complete], ignore_index=True)
-                    st.session_state['phonenum_combined'] = pd.concat([st.session_state['phonenum_combined']], ignore_index=True).drop_duplicates()
-                    
-                # After processing all files:
-                # Aggregate df_complete DataFrames
-                if st.session_state['all_data']:
-                    st.session_state['df_merge'] = pd.concat(st.session_state['all_data'], ignore_index=True)
-                else:
-                    st.session_state['df_merge'] = pd.DataFrame()
-
-                # Aggregate phonenum_df DataFrames
-                if st.session_state['all_phonenum']:
-                    st.session_state['phonenum_combined'] = pd.concat(st.session_state['all_phonenum'], ignore_index=True).drop_duplicates()
-                else:
-                    st.session_state['phonenum_combined'] = pd.DataFrame()
-                                
+            with st.spinner("Processing the files..."), recording() as records:
+                # Clean all files concurrently, keeping the results in upload order
+                results = [None] * len(uploaded_files)
+                cache_hits = 0
+                progress_bar = st.progress(0.0, text="Cleaning files...")
+                for done, (position, result, cache_hit) in enumerate(process_files_cached(uploaded_files), start=1):
+                    results[position] = result
+                    cache_hits += cache_hit
+                    source = "from cache" if cache_hit else "cleaned"
+                    progress_bar.progress(done / len(uploaded_files), text=f"Done {done} of {len(uploaded_files)} files ({uploaded_files[position].name}, {source})")
+
+                if cache_hits:
+                    st.info(f"{cache_hits} of {len(uploaded_files)} files were loaded from the cache of previously cleaned uploads.")
+
+                # Merge the per-file results once and keep a single compact copy for later reruns and pages
+                combined = combine_results(results)
+                store_dataset('cleaned', compact_dataframe(combined.pop('df_merge')))
+                st.session_state.update(combined)
                 st.session_state['processed'] = True
+                bump_data_version('dialed')
+            store_performance("Clean files", records)
 
         if st.session_state['processed']:
-            # Use data from session state
-            combined_data = pd.concat(st.session_state['all_data'], axis='index', ignore_index=True)
-            combined_phonenum = pd.concat(st.session_state['all_phonenum'], axis=0).drop_duplicates()
-            combined_phonenum.rename(columns={'PhoneNo': 'phonenum'}, inplace=True)
+            # Use the merged data cached in session state
+            combined_data = st.session_state['cleaned_data']
 
             # Save statistics in session state
             st.session_state['total_CRs'] = combined_data.shape[0]
@@ -153,6 +131,12 @@ def run():
             # Display the DataFrame as a table in Streamlit
             st.table(df_stats)
 
+            # Calls left out of the cleaned data, by the first check they failed
+            st.markdown("### Rejected Calls:")
+            rejections = rejection_report(st.session_state.get('rejections', {}), st.session_state['total_calls_made'])
+            st.dataframe(rejections, hide_index=True, use_container_width=True,
+                         column_config={'Share': st.column_config.NumberColumn(format="%.3f")})
+
             # Display a snippet of the cleaned data
             st.markdown("### Cleaned Data Preview:")
             st.dataframe(combined_data.head())  # Show the first 5 rows as a preview
@@ -166,31 +150,20 @@ def run():
             # Use the default filename in the text input, allowing the user to edit it
             output_filename = st.text_input("Edit the filename for download", value=default_filename)
 
-            # Check if the output filename ends with '.csv', if not append '.csv'
-            if not output_filename.lower().endswith('.csv'):
-                output_filename += '.csv'
+            # Columnar formats are smaller and much faster to reload in the analytics notebooks
+            export_format = st.radio("Download format", list(EXPORT_FORMATS), horizontal=True, key='cleaned_export_format')
+
+            # Make sure the output filename carries the extension of the chosen format
+            output_filename = with_extension(output_filename, export_format)
             
-            # After data processing
-            st.session_state['cleaned_data'] = combined_data
-
-            # Download button
-            data_as_csv = combined_data.to_csv(index=False).encode('utf-8')
-            st.download_button(
-                label="Download Cleaned Data as CSV",
-                data=data_as_csv,
-                file_name=output_filename,
-                mime='text/csv'
-            )
+            # Download button, serialized only on request and reused until the data changes
+            lazy_download_button('cleaned', combined_data, export_format, f"Download Cleaned Data as {export_format}", output_filename)
         
             if st.session_state['processed']:
-                # Concatenate all phone numbers from processed data
-                phonenum_combined = pd.concat(st.session_state['all_phonenum'], axis=0)
-                
-                # Check and report duplicated numbers before dropping them to correctly report total and duplicated counts
-                dup = phonenum_combined.duplicated().sum()
-                
-                # Drop duplicated numbers for the updated total
-                phonenum_combined_cleaned = phonenum_combined.drop_duplicates()
+                # All dialed phone numbers (normalized to 60XXXXXXXXX), and the duplicates counted when the files were merged
+                phonenum_combined = st.session_state['phonenum_dialed']
+                dup = st.session_state['phonenum_duplicates']
+                phonenum_combined_cleaned = st.session_state['phonenum_combined']
 
                 # Display a preview of these used phone numbers
                 st.markdown("### Preview of Phone Numbers to be Excluded in the Next Sampling:")
@@ -201,12 +174,14 @@ def run():
                     "Metric": [
                         "Total count of phone numbers that need to be excluded in the next sampling", 
                         "Total duplicated numbers", 
-                        "Total numbers after dropping duplicate numbers"
+                        "Total numbers after dropping duplicate numbers",
+                        "Total invalid numbers left out"
                     ],
                     "Count": [
                         f"{phonenum_combined.shape[0]}",
                         f"{dup}",
-                        f"{phonenum_combined_cleaned.shape[0]}"
+                        f"{phonenum_combined_cleaned.shape[0]}",
+                        f"{st.session_state['phonenum_invalid']}"
                     ]
                 }
 
@@ -229,19 +204,61 @@ def run():
                 if not output_filename_phonenum.lower().endswith('.csv'):
                     output_filename_phonenum += '.csv'
 
-                # Convert the unique phone numbers dataframe to CSV for download
-                phonenum_data_as_csv = phonenum_combined.to_csv(index=False).encode('utf-8')
-                st.download_button(
-                    label="Download Dialed Phone Numbers as CSV",
-                    data=phonenum_data_as_csv,
-                    file_name=output_filename_phonenum,
-                    mime='text/csv'
-                )
+                # Convert the dialed phone numbers dataframe to CSV only when the download is requested
+                lazy_download_button('dialed', phonenum_combined, 'CSV', "Download Dialed Phone Numbers as CSV", output_filename_phonenum)
+
+                # Keep the dialed numbers across campaigns so later samples can be filtered without re-uploading old files
+                st.markdown("### Dialed Number History Across Campaigns:")
+                campaign_name = st.text_input("Campaign name for these dialed numbers", value=f"IVR_Campaign_v{formatted_date}")
+                if st.button("Save Dialed Numbers to History"):
+                    added = add_dialed_numbers(phonenum_combined_cleaned['phonenum'].to_numpy(), campaign_name)
+                    st.success(f"{added:,} new phone numbers were added to the history.✨")
+
+                total_history, total_campaigns = exclusion_store_stats()
+                st.write(f"The history holds {total_history:,} phone numbers from {total_campaigns:,} campaigns.")
+
+                sample_file = st.file_uploader("Upload a candidate sample (.csv) to exclude previously dialed numbers", type=['csv'])
+                if sample_file is not None:
+                    sample_df = pd.read_csv(sample_file, dtype=str)
+                    phone_columns = list(sample_df.columns)
+                    default_column = next((idx for idx, col in enumerate(phone_columns) if 'phone' in col.lower()), 0)
+                    phone_column = st.selectbox("Column holding the phone numbers", phone_columns, index=default_column)
+
+                    # Filter on request only; loading the whole history on every rerun is expensive
+                    if st.button("Exclude Previously Dialed Numbers"):
+                        kept_df, excluded_count, invalid_count = exclude_dialed_numbers(sample_df, phone_column)
+                        st.session_state['filtered_sample'] = (kept_df, len(sample_df), excluded_count, invalid_count)
+                        bump_data_version('filtered_sample')
+
+                if sample_file is not None and 'filtered_sample' in st.session_state:
+                    kept_df, sample_count, excluded_count, invalid_count = st.session_state['filtered_sample']
+
+                    sample_data = {
+                        "Metric": [
+                            "Total numbers in the candidate sample",
+                            "Numbers excluded as previously dialed",
+                            "Numbers remaining for the next sampling",
+                            "Invalid numbers kept in the sample"
+                        ],
+                        "Count": [
+                            f"{sample_count}",
+                            f"{excluded_count}",
+                            f"{len(kept_df)}",
+                            f"{invalid_count}"
+                        ]
+                    }
+                    df_sample_stats = pd.DataFrame(sample_data)
+                    df_sample_stats.index = df_sample_stats.index + 1
+                    st.table(df_sample_stats)
+
+                    lazy_download_button('filtered_sample', kept_df, 'CSV', "Download Filtered Sample as CSV", f'Filtered_Sample_v{formatted_date}.csv')
 
         
             # Add instructions for navigating to the next page
             st.write("To continue to the Questionnaire Definition, please navigate to the 'Questionairre-Definer & Keypresses-Decoder🎉' app.")
 
+        render_performance_panel()
+
         
 if __name__ == "__main__":
     run()
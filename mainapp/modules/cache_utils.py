@@ -0,0 +1,147 @@
+import hashlib
+import json
+import os
+import shutil
+import tempfile
+import uuid
+
+import pandas as pd
+
+# Where cleaned results are cached and how much disk space the cache may use.
+CACHE_DIR = os.environ.get('IVR_CACHE_DIR', os.path.join(tempfile.gettempdir(), 'ivr_cleaner_cache'))
+CACHE_MAX_BYTES = int(os.environ.get('IVR_CACHE_MAX_BYTES', 2 * 1024 ** 3))
+
+# Version of the cleaning pipeline the cached results were produced by. Bump it
+# whenever process_file returns different results for the same upload; entries
+# of other versions are then treated as misses and removed.
+CACHE_VERSION = 3
+
+# Block size used when hashing uploads.
+HASH_BLOCK_SIZE = 1 << 20
+
+def file_digest(uploaded_file):
+    """
+    Computes the SHA-256 of an uploaded file's bytes.
+
+    Parameters:
+    - uploaded_file: A seekable binary file-like object or a path.
+
+    Returns:
+    - str: The hex digest of the file content.
+    """
+    digest = hashlib.sha256()
+    if hasattr(uploaded_file, 'read'):
+        uploaded_file.seek(0)
+        for block in iter(lambda: uploaded_file.read(HASH_BLOCK_SIZE), b''):
+            digest.update(block)
+        uploaded_file.seek(0)
+    else:
+        with open(uploaded_file, 'rb') as handle:
+            for block in iter(lambda: handle.read(HASH_BLOCK_SIZE), b''):
+                digest.update(block)
+    return digest.hexdigest()
+
+def _to_parquet(df, path):
+    """Writes a DataFrame to Parquet, which only accepts string column names."""
+    df = df.set_axis([str(col) for col in df.columns], axis='columns')
+    df.to_parquet(path)
+
+def _from_parquet(path):
+    """Reads a DataFrame written by _to_parquet, restoring positional column names."""
+    df = pd.read_parquet(path)
+    df.columns = [int(col) if col.isdigit() else col for col in df.columns]
+    return df
+
+def load_cached_result(digest, cache_dir=None):
+    """
+    Loads a cached process_file result.
+
+    A hit refreshes the entry's modification time, which is what the LRU
+    eviction in evict_cache orders by. Entries stored by another CACHE_VERSION
+    are misses.
+
+    Parameters:
+    - digest (str): The SHA-256 of the uploaded file.
+    - cache_dir (str, optional): The cache directory, CACHE_DIR by default.
+
+    Returns:
+    - tuple or None: The same tuple process_file returns, or None on a miss.
+    """
+    entry = os.path.join(cache_dir or CACHE_DIR, digest)
+    if not os.path.isdir(entry):
+        return None
+    try:
+        df_complete = _from_parquet(os.path.join(entry, 'df_complete.parquet'))
+        phonenum_list = _from_parquet(os.path.join(entry, 'phonenum.parquet'))
+        with open(os.path.join(entry, 'counts.json')) as handle:
+            counts = json.load(handle)
+        if counts.get('version') != CACHE_VERSION:
+            raise ValueError(f"Cache entry {digest} is from another version of the cleaner.")
+        rejections = counts['rejections']
+        os.utime(entry)
+    except Exception:
+        # A partial, corrupt or outdated entry is treated as a miss and removed
+        shutil.rmtree(entry, ignore_errors=True)
+        return None
+
+    # df_merge of a single file is the cleaned data itself
+    return df_complete, phonenum_list, counts['total_calls_made'], counts['total_of_pickups'], df_complete, rejections
+
+def store_cached_result(digest, result, cache_dir=None, max_bytes=None):
+    """
+    Stores a process_file result in the cache and evicts old entries if needed.
+
+    The entry is written to a temporary directory first and then renamed, so
+    readers never see a half-written entry. Failures to write are ignored;
+    the cache is only an optimization.
+
+    Parameters:
+    - digest (str): The SHA-256 of the uploaded file.
+    - result (tuple): The tuple returned by process_file.
+    - cache_dir (str, optional): The cache directory, CACHE_DIR by default.
+    - max_bytes (int, optional): The size the cache is trimmed to after storing, CACHE_MAX_BYTES by default.
+    """
+    df_complete, phonenum_list, total_calls_made, total_of_pickups, _, rejections = result
+    cache_dir = cache_dir or CACHE_DIR
+    entry = os.path.join(cache_dir, digest)
+    staging = os.path.join(cache_dir, f'.{digest}.{uuid.uuid4().hex}')
+    try:
+        os.makedirs(staging)
+        _to_parquet(df_complete, os.path.join(staging, 'df_complete.parquet'))
+        _to_parquet(phonenum_list, os.path.join(staging, 'phonenum.parquet'))
+        with open(os.path.join(staging, 'counts.json'), 'w') as handle:
+            json.dump({'version': CACHE_VERSION, 'total_calls_made': int(total_calls_made), 'total_of_pickups': int(total_of_pickups),
+                       'rejections': rejections}, handle)
+        os.rename(staging, entry)
+    except Exception:
+        # Another session may have stored the same file first
+        shutil.rmtree(staging, ignore_errors=True)
+        return
+    evict_cache(cache_dir, max_bytes)
+
+def _entry_size(entry):
+    """Returns the total size in bytes of the files in a cache entry."""
+    return sum(entry_file.stat().st_size for entry_file in os.scandir(entry) if entry_file.is_file())
+
+def evict_cache(cache_dir=None, max_bytes=None):
+    """
+    Removes the least recently used cache entries until the cache fits in max_bytes.
+
+    Parameters:
+    - cache_dir (str, optional): The cache directory, CACHE_DIR by default.
+    - max_bytes (int, optional): The maximum total size of the cache, CACHE_MAX_BYTES by default.
+    """
+    cache_dir = cache_dir or CACHE_DIR
+    max_bytes = CACHE_MAX_BYTES if max_bytes is None else max_bytes
+    try:
+        entries = [entry for entry in os.scandir(cache_dir) if entry.is_dir() and not entry.name.startswith('.')]
+        sized = sorted(((entry.stat().st_mtime, _entry_size(entry.path), entry.path) for entry in entries))
+    except OSError:
+        return
+
+    total = sum(size for _, size, _ in sized)
+    for _, size, path in sized:
+        if total <= max_bytes:
+            break
+        shutil.rmtree(path, ignore_errors=True)
+        total -= size
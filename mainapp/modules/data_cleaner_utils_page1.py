@@ -1,8 +1,308 @@
 import pandas as pd ##
 import numpy as np
+import csv
+import os
+import shutil
+import tempfile
+import multiprocessing
+import contextvars
+from concurrent.futures import ProcessPoolExecutor, ThreadPoolExecutor, as_completed
+from contextlib import contextmanager
+from operator import methodcaller
+from modules.cache_utils import file_digest, load_cached_result, store_cached_result
+from modules.phone_utils import INVALID_PHONE, normalize_phone_numbers, normalize_phone_strings, build_phone_index
+from modules.perf_utils import add_records, recording, stage
+from modules.validation_utils import validate_ivr_results, count_rejections, add_rejections
 
 import pandas as pd
 
+# Block size used when scanning an upload for its widest row.
+SNIFF_BLOCK_SIZE = 1 << 20
+# Rows per chunk when cleaning in chunked mode, and the upload size above which the app switches to it.
+CHUNK_SIZE = 100_000
+LARGE_FILE_BYTES = 50 * 1024 * 1024
+# Directory uploads are spooled to before cleaning, the system temporary directory by default.
+SPOOL_DIR = os.environ.get('IVR_SPOOL_DIR')
+# Block size used when copying an upload to its spool file.
+SPOOL_BLOCK_SIZE = 1 << 20
+
+def _open_binary(uploaded_file):
+    """
+    Returns a binary file handle for the upload and whether the caller owns it.
+
+    Streamlit's UploadedFile and FastAPI's spooled files are used as-is; plain
+    paths are opened here and must be closed by the caller.
+    """
+    if hasattr(uploaded_file, 'read'):
+        return uploaded_file, False
+    return open(uploaded_file, 'rb'), True
+
+def _field_count(line):
+    """Counts the fields of a raw CSV line, ignoring trailing empty ones."""
+    line = line.rstrip(b'\r\n,')
+    if b'"' not in line:
+        return line.count(b',') + 1
+    # A quoted field may hold commas, which only the csv module skips
+    fields = next(csv.reader([line.decode('utf-8', errors='replace')]), [])
+    while fields and not fields[-1].strip():
+        fields.pop()
+    return max(len(fields), 1)
+
+def sniff_ivr_layout(uploaded_file):
+    """
+    Sniffs the layout of an IVR export without parsing it into a DataFrame.
+
+    The first line of a dialer export is junk and the real header sits on the
+    second line. Answered calls carry one extra field per question after
+    'UserKeyPress', so data rows are usually wider than the header; the whole
+    file is scanned once to find the widest row. Trailing empty fields are
+    ignored so that every column within the width holds data somewhere.
+    Commas are counted on the raw bytes, except on lines with quoted fields,
+    which are split by the csv module.
+
+    Parameters:
+    - uploaded_file: A path or a seekable binary file-like object.
+
+    Returns:
+    - header (list of str): The column names found on the second line.
+    - width (int): The number of fields in the widest line of the file.
+    """
+    handle, owned = _open_binary(uploaded_file)
+    try:
+        handle.seek(0)
+        handle.readline()  # Skip the junk first line
+        header_line = handle.readline().decode('utf-8-sig', errors='replace')
+        header = next(csv.reader([header_line]), [])
+        while header and not header[-1].strip():
+            header.pop()
+
+        width = len(header)
+        strip_trailing = methodcaller('rstrip', b'\r\n,')
+        tail = b''
+        while True:
+            block = handle.read(SNIFF_BLOCK_SIZE)
+            if not block:
+                break
+            lines = (tail + block).split(b'\n')
+            tail = lines.pop()  # The last line may continue in the next block
+            if not lines:
+                continue
+            if b'"' in block:
+                width = max(width, max(map(_field_count, lines)))
+            else:
+                width = max(width, max(line.count(b',') for line in map(strip_trailing, lines)) + 1)
+        if tail:
+            width = max(width, _field_count(tail))
+
+        handle.seek(0)
+    finally:
+        if owned:
+            handle.close()
+
+    return header, width
+
+def _name_ivr_columns(df, header):
+    """Names columns from the header; the extra keypress fields keep their position."""
+    df.columns = [header[idx] if idx < len(header) and header[idx] else idx for idx in df.columns]
+    return df
+
+def _is_unnamed(idx, header):
+    """Tests whether a column position has no name on the header line."""
+    return idx >= len(header) or not header[idx]
+
+def _read_ivr_chunks(uploaded_file, width, chunksize, memory_map):
+    """
+    Opens a chunked reader over every field of an IVR export.
+
+    No usecols are given, since the C parser rejects a chunk whose rows are all
+    narrower than the columns asked for; short rows are padded to width instead.
+    """
+    if hasattr(uploaded_file, 'seek'):
+        uploaded_file.seek(0)
+    return pd.read_csv(uploaded_file, skiprows=2, header=None, names=range(width),
+                       dtype=str, engine='c', chunksize=chunksize, memory_map=memory_map)
+
+def _empty_unnamed_columns(uploaded_file, header, width, columns, chunksize, memory_map):
+    """
+    Finds the unnamed columns among columns that hold no data in any row.
+
+    A whole-file read drops them once it has the data; a chunked read needs
+    them before its first chunk, so the file is scanned once more in chunks.
+    The last column always holds data (see sniff_ivr_layout) and is not scanned.
+    """
+    candidates = {idx for idx in columns if _is_unnamed(idx, header) and idx < width - 1}
+    if not candidates:
+        return set()
+    # Closing the reader explicitly keeps it from closing the upload when it is collected
+    with stage('empty column scan'), _read_ivr_chunks(uploaded_file, width, chunksize, memory_map) as reader:
+        for chunk in reader:
+            candidates -= {idx for idx in candidates if chunk[idx].notna().any()}
+            if not candidates:
+                break
+    if hasattr(uploaded_file, 'seek'):
+        uploaded_file.seek(0)
+    return candidates
+
+def read_ivr_csv(uploaded_file, chunksize=None):
+    """
+    Reads only the columns of an IVR export that the cleaner needs.
+
+    The header on the second line is sniffed first so that only 'PhoneNo' and
+    the 'UserKeyPress' onward columns are loaded, using the C engine and string
+    dtypes. Files given by path are memory-mapped rather than read into a
+    buffer. Columns that have neither a header name nor any data are dropped,
+    mirroring the all-NA column drop of the original reader; chunked reads
+    drop the same columns from every chunk.
+
+    Parameters:
+    - uploaded_file: A path or a seekable binary file-like object.
+    - chunksize (int, optional): Number of rows per chunk. When given, an iterator
+      of DataFrames is returned instead of a single DataFrame.
+
+    Returns:
+    - pd.DataFrame, or an iterator of DataFrames in chunked mode: 'PhoneNo',
+      'UserKeyPress' and the keypress columns that follow it.
+    """
+    with stage('header detection'):
+        header, width = sniff_ivr_layout(uploaded_file)
+
+    for required in ('PhoneNo', 'UserKeyPress'):
+        if required not in header:
+            raise ValueError(f"Column '{required}' was not found on the second line of the file.")
+    phone_idx = header.index('PhoneNo')
+    keypress_idx = header.index('UserKeyPress')
+    usecols = [phone_idx] + list(range(keypress_idx, width))
+    memory_map = isinstance(uploaded_file, (str, os.PathLike))
+
+    if chunksize:
+        empty = _empty_unnamed_columns(uploaded_file, header, width, usecols, chunksize, memory_map)
+        usecols = [idx for idx in usecols if idx not in empty]
+        return _read_chunks(_read_ivr_chunks(uploaded_file, width, chunksize, memory_map), header, usecols)
+
+    with stage('read') as record:
+        df = pd.read_csv(
+            uploaded_file,
+            skiprows=2,
+            header=None,
+            names=range(width),
+            usecols=usecols,
+            dtype=str,
+            engine='c',
+            memory_map=memory_map,
+        )
+        record['rows_out'] = len(df)
+
+    df = _name_ivr_columns(df, header)
+    unnamed_empty = [col for col in df.columns if isinstance(col, int) and df[col].isna().all()]
+    return df.drop(columns=unnamed_empty)
+
+def _read_chunks(reader, header, usecols):
+    """Yields the used columns of each chunk of a chunked reader, named, timing the read of each one."""
+    with reader:
+        while True:
+            with stage('read') as record:
+                chunk = next(reader, None)
+                record['rows_out'] = 0 if chunk is None else len(chunk)
+            if chunk is None:
+                return
+            yield _name_ivr_columns(chunk.reindex(columns=usecols), header)
+
+def _phone_keys(phones):
+    """
+    Normalizes phone numbers and returns them with the key calls are deduplicated on.
+
+    The key is the normalized number, so '0123456789' and '123456789' are one
+    respondent, or the raw PhoneNo where the number cannot be normalized.
+
+    Parameters:
+    - phones (pd.Series): The 'PhoneNo' column.
+
+    Returns:
+    - normalized (pd.Series): The numbers as returned by normalize_phone_strings.
+    - keys (pd.Series): The deduplication key of every call.
+    """
+    normalized = normalize_phone_strings(phones)
+    return normalized, normalized.fillna(phones.astype('string[pyarrow]'))
+
+def _first_seen_mask(phones, seen):
+    """
+    Flags the first occurrence of each phone number across chunks.
+
+    Phone numbers are hashed to uint64 and the numbers seen in earlier chunks
+    are kept as a sorted array, which costs 8 bytes per number.
+
+    Parameters:
+    - phones (pd.Series): The 'PhoneNo' column of the current chunk.
+    - seen (np.ndarray): Sorted uint64 hashes of the phone numbers seen so far.
+
+    Returns:
+    - mask (np.ndarray): True for rows whose phone number has not been seen before.
+    - seen (np.ndarray): The updated sorted array of hashes.
+    """
+    hashes = pd.util.hash_pandas_object(phones, index=False).to_numpy()
+    mask = ~pd.Index(hashes).duplicated()
+    if len(seen):
+        positions = np.minimum(np.searchsorted(seen, hashes), len(seen) - 1)
+        mask &= seen[positions] != hashes
+    # Both inputs are sorted runs, which the stable sort merges in linear time
+    seen = np.sort(np.concatenate([seen, np.sort(hashes[mask])]), kind='stable')
+    return mask, seen
+
+def clean_ivr_results(df_results, phones=None):
+    """
+    Splits deduplicated IVR results into cleaned responses and dialed phone numbers.
+
+    Calls are checked by validate_ivr_results; only the valid ones are kept,
+    with their phone numbers normalized to the 60XXXXXXXXX format.
+
+    Parameters:
+    - df_results (pd.DataFrame): 'PhoneNo', 'UserKeyPress' and keypress columns, one row per phone number.
+    - phones (pd.Series, optional): PhoneNo already normalized (see validate_ivr_results).
+
+    Returns:
+    - df_complete (pd.DataFrame): Complete responses with positional columns and a 'Set' column.
+    - phonenum_list (pd.DataFrame): Phone numbers that have at least one user key press.
+    - total_calls_made (int): Number of calls in df_results.
+    - total_of_pickups (int): Number of calls with a complete response.
+    - rejections (dict): Number of calls left out per rejection reason (see count_rejections).
+    """
+    total_calls_made = len(df_results)
+    reasons, phones = validate_ivr_results(df_results, phones)
+
+    phonenum_list = df_results.loc[reasons != 'no_keypress', ['PhoneNo']]
+    total_of_pickups = int((~reasons.isin(['no_keypress', 'incomplete'])).sum())
+
+    valid = reasons.isna().to_numpy()
+    df_complete = df_results[valid].set_axis(np.arange(len(df_results.columns)), axis='columns')
+    df_complete[0] = phones[valid].astype(object)
+    df_complete['Set'] = 'IVR'
+
+    return df_complete, phonenum_list, total_calls_made, total_of_pickups, count_rejections(reasons)
+
+def iter_process_file(uploaded_file, chunksize=CHUNK_SIZE):
+    """
+    Cleans an IVR export chunk by chunk so that peak memory is bounded by the chunk size.
+
+    Duplicate phone numbers are dropped across chunks, once normalized, keeping
+    the first occurrence, exactly as process_file does for a whole file.
+
+    Parameters:
+    - uploaded_file: A path or a seekable binary file-like object.
+    - chunksize (int): Number of rows read per chunk.
+
+    Yields:
+    - A tuple of (df_complete, phonenum_list, total_calls_made, total_of_pickups, rejections)
+      for each chunk, where the counts cover that chunk only.
+    """
+    seen = np.empty(0, dtype=np.uint64)
+    for chunk in read_ivr_csv(uploaded_file, chunksize=chunksize):
+        with stage('dedup', len(chunk)) as record:
+            phones, keys = _phone_keys(chunk['PhoneNo'])
+            mask, seen = _first_seen_mask(keys, seen)
+            chunk, phones = chunk[mask], phones[mask]
+            record['rows_out'] = len(chunk)
+        yield clean_ivr_results(chunk, phones)
+
 def merger(df_list, phonenum_list):
     """
     Concatenates lists of DataFrames and renames a column.
@@ -31,23 +331,23 @@ def merger(df_list, phonenum_list):
 
 
 
-def process_file(uploaded_file):
+def process_file(uploaded_file, chunksize=None):
     """
     Process the uploaded CSV file to extract and transform phone number data
     and user response data for analysis.
     
     The function performs several steps:
-    - Reads the CSV, skipping the first row and setting column names dynamically.
-    - Drops columns that are entirely NA.
-    - Extracts columns for phone numbers and user responses.
+    - Reads only the phone number and user response columns, using the header on the second line.
     - Identifies total number of calls and total pickups.
-    - Filters data to complete responses where a user key press is recorded.
+    - Validates every call (see validate_ivr_results), keeping complete responses with
+      well-formed keypresses and a valid phone number, normalized to 60XXXXXXXXX.
     - Adds a 'Set' column to indicate data belonging to the IVR set.
-    - Filters for records where the user key press response is exactly 10 characters long.
 
     Parameters:
     - uploaded_file: A file-like object representing the uploaded CSV file.
                      This object must support file-like operations such as read.
+    - chunksize (int, optional): When given, the file is cleaned in chunks of this many rows
+                     (see iter_process_file) and only the cleaned rows are kept in memory.
 
     Returns:
     - A tuple containing:
@@ -55,53 +355,223 @@ def process_file(uploaded_file):
         - phonenum_list: A pandas DataFrame containing the list of phone numbers that have at least one user key press.
         - total_calls: The total number of calls (rows) in the uploaded file.
         - total_pickup: The total number of calls where a user key press was recorded.
+        - df_merge: The same cleaned data, as merged by merger.
+        - rejections: The number of calls left out per rejection reason (see count_rejections).
 
     Note:
     - The function assumes the uploaded CSV has specific columns of interest, notably 'PhoneNo' and 'UserKeyPress'.
     - It is assumed that the second row of the CSV provides the column names for the data.
     """
-    df_list = []
-    phonenum_list = []
-    total_calls = []
-    total_calls_made = []
-    total_pickup = []
-    total_of_pickups = []
+    if chunksize:
+        df_list = []
+        phonenum_list = []
+        total_calls_made = 0
+        total_of_pickups = 0
+        rejections = add_rejections()
+        for chunk_complete, chunk_phonenum, chunk_calls, chunk_pickups, chunk_rejections in iter_process_file(uploaded_file, chunksize):
+            df_list.append(chunk_complete)
+            phonenum_list.append(chunk_phonenum)
+            total_calls_made += chunk_calls
+            total_of_pickups += chunk_pickups
+            rejections = add_rejections(rejections, chunk_rejections)
+        if not df_list:
+            raise ValueError("The uploaded file has no data rows.")
+        df_complete = pd.concat(df_list, axis='index')
+        phonenum_list = pd.concat(phonenum_list, axis='index')
+    else:
+        df_results = read_ivr_csv(uploaded_file)
+        with stage('dedup', len(df_results)) as record:
+            # Deduplicate on the normalized numbers, so one respondent dialed in two formats counts once
+            phones, keys = _phone_keys(df_results['PhoneNo'])
+            first_seen = ~keys.duplicated().to_numpy()
+            df_results, phones = df_results[first_seen], phones[first_seen]
+            record['rows_out'] = len(df_results)
+        df_complete, phonenum_list, total_calls_made, total_of_pickups, rejections = clean_ivr_results(df_results, phones)
 
-    df = pd.read_csv(uploaded_file, skiprows=1, names=range(100), engine='python')
+    # Call the merger function at the end of process_file to merge df_list and phonenum_list
+    df_merge, phonenum_combined = merger([df_complete], [phonenum_list])  # Adjusted to pass lists of DataFrames
 
-    df.dropna(axis='columns', how='all', inplace=True)
+    # Correct the return statement to include all expected return values
+    return df_complete, phonenum_combined, total_calls_made, total_of_pickups, df_merge, rejections
 
-    df.columns = df.iloc[0]  # Set columns from first row
-    df = df[1:]  # Drop the first row, which is now the header
+def _chunksize_for(uploaded_file):
+    """Picks chunked mode for uploads larger than LARGE_FILE_BYTES."""
+    if isinstance(uploaded_file, (str, os.PathLike)):
+        size = os.path.getsize(uploaded_file)
+    else:
+        size = getattr(uploaded_file, 'size', 0)
+    return CHUNK_SIZE if size > LARGE_FILE_BYTES else None
 
-    df_phonenum = df[['PhoneNo']]
-    df_response = df.loc[:, 'UserKeyPress':]
-    df_results = pd.concat([df_phonenum, df_response], axis='columns')
-    
-    df_results.drop_duplicates(subset=['PhoneNo'], inplace=True)
-    total_calls_made = len(df_results)
-    total_calls.append(total_calls_made)
-    
-    phonenum_recycle = df_results.dropna(subset=['UserKeyPress'])
+@contextmanager
+def spooled_uploads(uploaded_files):
+    """
+    Copies in-memory uploads to temporary files for the time of the block.
 
-    phonenum_list = phonenum_recycle[['PhoneNo']]
-    
-    df_complete = df_results.dropna(axis='index')
+    Uploads are streamed to disk block by block and closed as soon as they are
+    copied, which drops the upload's own reference to its bytes, so the cleaner
+    reads every file from a memory-mapped spool file. Workers then get a path
+    instead of a pickled copy of the bytes. Paths are passed through as they are.
 
-    total_of_pickups = len(df_complete)
-    total_pickup.append(total_of_pickups)
+    Parameters:
+    - uploaded_files (list): Paths or seekable binary file-like objects.
 
-    df_complete.columns = np.arange(len(df_complete.columns))
+    Yields:
+    - list: The path of every upload, in the same order.
+    """
+    paths = []
+    spooled = []
+    try:
+        for uploaded_file in uploaded_files:
+            if not hasattr(uploaded_file, 'read'):
+                paths.append(uploaded_file)
+                continue
+            with stage('spool'):
+                uploaded_file.seek(0)
+                with tempfile.NamedTemporaryFile(suffix='.csv', dir=SPOOL_DIR, delete=False) as spool_file:
+                    spooled.append(spool_file.name)
+                    shutil.copyfileobj(uploaded_file, spool_file, SPOOL_BLOCK_SIZE)
+                uploaded_file.close()
+            paths.append(spool_file.name)
+        yield paths
+    finally:
+        for path in spooled:
+            try:
+                os.remove(path)
+            except OSError:
+                pass
 
-    df_complete['Set'] = 'IVR'
-    df_complete = df_complete.loc[:, :'Set']
+def _process_upload(path, chunksize):
+    """
+    Runs process_file inside a worker process on the path of an upload.
 
-    df_complete = df_complete.loc[(df_complete.iloc[:, 2].str.len() == 10)]
+    Returns the result with the stage records of the worker, which the parent adds to its own recording.
+    """
+    with recording() as records:
+        result = process_file(path, chunksize=chunksize)
+    return result, records
 
-    df_list.append(df_complete)
-    
-    # Call the merger function at the end of process_file to merge df_list and phonenum_list
-    df_merge, phonenum_combined = merger([df_complete], [phonenum_list])  # Adjusted to pass lists of DataFrames
+def process_files(uploaded_files, max_workers=None, use_processes=True):
+    """
+    Cleans several uploaded CSV files concurrently.
 
-    # Correct the return statement to include all expected return values
-    return df_complete, phonenum_combined, total_calls_made, total_of_pickups, df_merge
+    Uploads are spooled to temporary files first (see spooled_uploads), and
+    worker processes get the path of each file, since the parsing and
+    filtering are CPU-bound. With use_processes=False a thread pool is used
+    instead, which only overlaps the parts where pandas releases the GIL.
+
+    Parameters:
+    - uploaded_files (list): File-like objects as accepted by process_file; they are closed once spooled.
+    - max_workers (int, optional): Number of workers, defaults to one per CPU up to the number of files.
+    - use_processes (bool): Whether to use a process pool rather than a thread pool.
+
+    Yields:
+    - A tuple of (position, result) as each file finishes, where position is the index of the file
+      in uploaded_files and result is the tuple returned by process_file.
+    """
+    if max_workers is None:
+        max_workers = min(len(uploaded_files), os.cpu_count() or 1)
+
+    with spooled_uploads(uploaded_files) as paths:
+        if max_workers <= 1:
+            for position, path in enumerate(paths):
+                yield position, process_file(path, chunksize=_chunksize_for(path))
+            return
+
+        if use_processes:
+            # Spawned workers avoid forking the threaded Streamlit/uvicorn server
+            executor = ProcessPoolExecutor(max_workers=max_workers, mp_context=multiprocessing.get_context('spawn'))
+        else:
+            executor = ThreadPoolExecutor(max_workers=max_workers)
+
+        with executor:
+            futures = {}
+            for position, path in enumerate(paths):
+                chunksize = _chunksize_for(path)
+                if use_processes:
+                    future = executor.submit(_process_upload, path, chunksize)
+                else:
+                    # Run in a copy of the caller's context so the stages land in its recording
+                    future = executor.submit(contextvars.copy_context().run, process_file, path, chunksize)
+                futures[future] = position
+
+            for future in as_completed(futures):
+                result = future.result()
+                if use_processes:
+                    result, records = result
+                    add_records(records)
+                yield futures[future], result
+
+def process_files_cached(uploaded_files, **kwargs):
+    """
+    Cleans several uploaded CSV files, reusing cached results for files seen before.
+
+    Files are identified by the SHA-256 of their bytes, so a re-upload of the
+    same export skips parsing entirely. Files that miss the cache are cleaned
+    concurrently by process_files and then stored in the cache.
+
+    Parameters:
+    - uploaded_files (list): File-like objects as accepted by process_file.
+    - **kwargs: Passed on to process_files.
+
+    Yields:
+    - A tuple of (position, result, cache_hit) for each file, where cache hits come first.
+    """
+    digests = [file_digest(uploaded_file) for uploaded_file in uploaded_files]
+
+    misses = []
+    for position, digest in enumerate(digests):
+        with stage('cache load') as record:
+            result = load_cached_result(digest)
+            record['rows_out'] = None if result is None else len(result[0])
+        if result is None:
+            misses.append(position)
+        else:
+            yield position, result, True
+
+    for miss_idx, result in process_files([uploaded_files[position] for position in misses], **kwargs):
+        position = misses[miss_idx]
+        store_cached_result(digests[position], result)
+        yield position, result, False
+
+def combine_results(results):
+    """
+    Combines the per-file results of process_file in a single pass.
+
+    Every frame is concatenated exactly once, so the cost grows linearly with
+    the number of files instead of re-copying the merged data per file. Phone
+    numbers are normalized to int64 per file and deduplicated through a
+    sorted phone index rather than as strings.
+
+    Parameters:
+    - results (list of tuple): process_file results, in the order the files were uploaded.
+
+    Returns:
+    - dict: The merged cleaned data ('df_merge'), every valid dialed phone number
+      ('phonenum_dialed'), the deduplicated phone numbers ('phonenum_combined'), the number
+      of duplicated and invalid phone numbers ('phonenum_duplicates', 'phonenum_invalid'),
+      the summed counters ('total_calls_made', 'total_pickups', 'total_CRs', 'file_count')
+      and the calls left out per rejection reason ('rejections').
+    """
+    df_list = [result[0] for result in results]
+    with stage('merge', sum(len(df) for df in df_list)) as record:
+        df_merge = pd.concat(df_list, ignore_index=True) if df_list else pd.DataFrame()
+        record['rows_out'] = len(df_merge)
+
+    numbers = np.concatenate([normalize_phone_numbers(result[1]['phonenum']) for result in results] or [np.empty(0, dtype=np.int64)])
+    with stage('phone dedup', len(numbers)) as record:
+        dialed = numbers[numbers != INVALID_PHONE]
+        phone_index = build_phone_index(dialed)
+        record['rows_out'] = len(phone_index)
+
+    return {
+        'df_merge': df_merge,
+        'phonenum_dialed': pd.DataFrame({'phonenum': dialed}),
+        'phonenum_combined': pd.DataFrame({'phonenum': phone_index}),
+        'phonenum_duplicates': len(dialed) - len(phone_index),
+        'phonenum_invalid': len(numbers) - len(dialed),
+        'total_calls_made': sum(result[2] for result in results),
+        'total_pickups': sum(result[3] for result in results),
+        'total_CRs': len(df_merge),
+        'file_count': len(results),
+        'rejections': add_rejections(*(result[5] for result in results)),
+    }
@@ -0,0 +1,127 @@
+import os
+import sqlite3
+from datetime import datetime
+
+import numpy as np
+
+from modules.phone_utils import INVALID_PHONE, normalize_phone_numbers, phone_index_contains
+
+# Location of the history of dialed numbers shared by every cleaning run.
+EXCLUSION_DB_PATH = os.environ.get(
+    'IVR_EXCLUSION_DB',
+    os.path.join(os.path.expanduser('~'), '.ivr_survey_automation', 'dialed_numbers.db'),
+)
+
+def connect_exclusion_store(db_path=EXCLUSION_DB_PATH):
+    """
+    Opens the exclusion store, creating it if needed.
+
+    Numbers are stored as the INTEGER PRIMARY KEY, i.e. as the SQLite rowid,
+    so the table is kept sorted by phone number and costs one B-tree. The
+    number of phone numbers of each campaign is kept in a small table of its
+    own, so the store can be summarized without scanning every number; a
+    store created before that table existed has it filled once here.
+
+    Parameters:
+    - db_path (str): Path of the SQLite database.
+
+    Returns:
+    - sqlite3.Connection: An open connection to the store.
+    """
+    os.makedirs(os.path.dirname(os.path.abspath(db_path)), exist_ok=True)
+    conn = sqlite3.connect(db_path)
+    conn.execute(
+        "CREATE TABLE IF NOT EXISTS dialed_numbers ("
+        "phonenum INTEGER PRIMARY KEY, campaign TEXT, added_on TEXT)"
+    )
+    if conn.execute("SELECT 1 FROM sqlite_master WHERE type = 'table' AND name = 'campaign_counts'").fetchone() is None:
+        with conn:
+            conn.execute("CREATE TABLE campaign_counts (campaign TEXT PRIMARY KEY, numbers INTEGER NOT NULL)")
+            conn.execute(
+                "INSERT INTO campaign_counts (campaign, numbers) "
+                "SELECT campaign, COUNT(*) FROM dialed_numbers GROUP BY campaign"
+            )
+    return conn
+
+def add_dialed_numbers(phone_index, campaign, db_path=EXCLUSION_DB_PATH):
+    """
+    Bulk inserts the numbers dialed in a cleaning run into the exclusion store.
+
+    Numbers already in the store keep the campaign they were first dialed in.
+
+    Parameters:
+    - phone_index (np.ndarray): A phone index built by build_phone_index.
+    - campaign (str): Name of the campaign the numbers were dialed in.
+    - db_path (str): Path of the SQLite database.
+
+    Returns:
+    - int: The number of phone numbers that were not in the store yet.
+    """
+    added_on = datetime.now().strftime("%Y-%m-%d")
+    with connect_exclusion_store(db_path) as conn:
+        before = conn.total_changes
+        conn.executemany(
+            "INSERT OR IGNORE INTO dialed_numbers (phonenum, campaign, added_on) VALUES (?, ?, ?)",
+            ((int(number), campaign, added_on) for number in phone_index),
+        )
+        added = conn.total_changes - before
+        if added:
+            conn.execute(
+                "INSERT INTO campaign_counts (campaign, numbers) VALUES (?, ?) "
+                "ON CONFLICT (campaign) DO UPDATE SET numbers = numbers + excluded.numbers",
+                (campaign, added),
+            )
+    conn.close()
+    return added
+
+def load_exclusion_index(db_path=EXCLUSION_DB_PATH):
+    """
+    Loads every number in the exclusion store as a phone index.
+
+    Parameters:
+    - db_path (str): Path of the SQLite database.
+
+    Returns:
+    - np.ndarray: Sorted unique int64 phone numbers.
+    """
+    conn = connect_exclusion_store(db_path)
+    try:
+        # Rows come back in rowid order, which is already sorted
+        cursor = conn.execute("SELECT phonenum FROM dialed_numbers ORDER BY phonenum")
+        return np.fromiter((row[0] for row in cursor), dtype=np.int64)
+    finally:
+        conn.close()
+
+def exclusion_store_stats(db_path=EXCLUSION_DB_PATH):
+    """
+    Summarizes the exclusion store from its campaign counts, without scanning the numbers.
+
+    Parameters:
+    - db_path (str): Path of the SQLite database.
+
+    Returns:
+    - tuple: The total number of stored phone numbers and the number of campaigns they come from.
+    """
+    conn = connect_exclusion_store(db_path)
+    try:
+        return conn.execute("SELECT COALESCE(SUM(numbers), 0), COUNT(campaign) FROM campaign_counts").fetchone()
+    finally:
+        conn.close()
+
+def exclude_dialed_numbers(sample_df, phone_column, db_path=EXCLUSION_DB_PATH):
+    """
+    Anti-joins a candidate sample against every number in the exclusion store.
+
+    Parameters:
+    - sample_df (pd.DataFrame): The candidate sample.
+    - phone_column (str): The column of sample_df holding phone numbers.
+    - db_path (str): Path of the SQLite database.
+
+    Returns:
+    - kept_df (pd.DataFrame): The rows of sample_df whose number was never dialed before.
+    - excluded_count (int): The number of rows dropped because their number was dialed before.
+    - invalid_count (int): The number of rows kept although their number could not be normalized.
+    """
+    numbers = normalize_phone_numbers(sample_df[phone_column])
+    dialed = phone_index_contains(load_exclusion_index(db_path), numbers)
+    return sample_df[~dialed], int(dialed.sum()), int((numbers == INVALID_PHONE).sum())
@@ -0,0 +1,111 @@
+import io
+import os
+
+import streamlit as st
+
+from modules.perf_utils import recording, stage, store_performance
+
+# Download formats offered by the pages: file extension and MIME type.
+EXPORT_FORMATS = {
+    'CSV': ('.csv', 'text/csv'),
+    'Parquet': ('.parquet', 'application/vnd.apache.parquet'),
+    'Feather': ('.feather', 'application/vnd.apache.arrow.file'),
+}
+
+def with_extension(filename, export_format):
+    """
+    Gives a filename the extension of the chosen export format.
+
+    Parameters:
+    - filename (str): The filename typed by the user, with or without an extension.
+    - export_format (str): A key of EXPORT_FORMATS.
+
+    Returns:
+    - str: The filename with any known export extension replaced by the chosen one.
+    """
+    root, extension = os.path.splitext(filename)
+    if extension.lower() in {ext for ext, _ in EXPORT_FORMATS.values()}:
+        filename = root
+    return filename + EXPORT_FORMATS[export_format][0]
+
+def encode_answer_columns(df):
+    """
+    Prepares a DataFrame for columnar export.
+
+    Column names become strings, as Parquet and Feather require, and every
+    text column except the first (the phone numbers) is stored as a
+    categorical, so each distinct answer is written once per column chunk.
+
+    Parameters:
+    - df (pd.DataFrame): Cleaned, renamed or decoded data.
+
+    Returns:
+    - pd.DataFrame: A copy with string column names and categorical answer columns.
+    """
+    df = df.set_axis([str(col) for col in df.columns], axis='columns').reset_index(drop=True)
+    answer_columns = [col for col in df.columns[1:] if df[col].dtype == object]
+    return df.astype({col: 'category' for col in answer_columns})
+
+def export_dataframe(df, export_format):
+    """
+    Serializes a DataFrame for st.download_button.
+
+    Parameters:
+    - df (pd.DataFrame): The data to export.
+    - export_format (str): A key of EXPORT_FORMATS.
+
+    Returns:
+    - bytes: The file content.
+    """
+    with stage('export', len(df)) as record:
+        record['rows_out'] = len(df)
+        if export_format == 'CSV':
+            return df.to_csv(index=False).encode('utf-8')
+
+        buffer = io.BytesIO()
+        if export_format == 'Parquet':
+            encode_answer_columns(df).to_parquet(buffer, index=False)
+        elif export_format == 'Feather':
+            encode_answer_columns(df).to_feather(buffer)
+        else:
+            raise ValueError(f"Unknown export format: {export_format}")
+        return buffer.getvalue()
+
+def bump_data_version(name):
+    """
+    Marks a session dataset as changed, so its cached download payload is rebuilt.
+
+    Parameters:
+    - name (str): The name of the dataset, e.g. 'cleaned' or 'decoded'.
+    """
+    st.session_state[f'{name}_version'] = st.session_state.get(f'{name}_version', 0) + 1
+
+def lazy_download_button(name, df, export_format, label, file_name):
+    """
+    Renders a download button whose payload is only serialized when asked for.
+
+    Until the user clicks "Prepare", only that button is shown. The prepared
+    payload is kept in session state under the dataset's version token and
+    format, so reruns caused by other widgets (e.g. editing the filename) reuse
+    it, and only the latest payload per dataset is kept.
+
+    Parameters:
+    - name (str): The name of the dataset, as passed to bump_data_version.
+    - df (pd.DataFrame): The data to export.
+    - export_format (str): A key of EXPORT_FORMATS.
+    - label (str): The label of the download button.
+    - file_name (str): The name of the downloaded file.
+    """
+    token = (st.session_state.get(f'{name}_version', 0), export_format)
+    payload_key = f'{name}_download_payload'
+    payload = st.session_state.get(payload_key)
+
+    if payload is None or payload[0] != token:
+        if not st.button(f"Prepare {export_format} file for download", key=f'{name}_prepare_download'):
+            return
+        with st.spinner("Preparing the file..."), recording() as records:
+            payload = (token, export_dataframe(df, export_format))
+        store_performance(f"Export {name} data", records)
+        st.session_state[payload_key] = payload
+
+    st.download_button(label, data=payload[1], file_name=file_name, mime=EXPORT_FORMATS[export_format][1], key=f'{name}_download')
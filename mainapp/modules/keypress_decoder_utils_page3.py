@@ -1,59 +1,270 @@
 import re
+from functools import lru_cache
 import streamlit as st
 import json
+import numpy as np
+import pandas as pd
+from modules.perf_utils import stage
+from modules.script_parser_utils import parse_text_to_json
+from modules.derived_column_utils import load_derived_columns
 
-import re
+# Matches keypress values and column names such as 'FlowNo_3=2' or 'FlowNo_3'.
+FLOW_NO_RE = re.compile(r"FlowNo_(\d+)=*(\d*)")
+# Number of parsed FlowNo values kept; a survey has a few hundred at most.
+FLOW_NO_CACHE_SIZE = 1 << 16
 
-def parse_text_to_json(text_content):
+@lru_cache(maxsize=FLOW_NO_CACHE_SIZE)
+def parse_flow_no(value):
     """
-    Parses structured text containing survey questions and answers into a JSON-like dictionary.
-    Adjusts FlowNo to start from 1 for each question's first answer and increments sequentially.
+    Parses a keypress value or column name such as 'FlowNo_3=2' into integers.
+
+    Parameters:
+    - value: The value to parse.
+
+    Returns:
+    - tuple: (question, answer); answer is None when the value has no answer number,
+             and both are None when the value is not a FlowNo.
+    """
+    match = FLOW_NO_RE.match(value) if isinstance(value, str) else None
+    if not match:
+        return None, None
+    return int(match.group(1)), int(match.group(2)) if match.group(2) else None
+
+def custom_sort(col):
+    # Orders FlowNo columns and values by question then answer, anything else last
+    question_num, flow_no = parse_flow_no(col)
+    if question_num is None:
+        return (float('inf'), 0)
+    return (question_num, flow_no or 0)
+
+def _answer_sort_key(value):
+    _, flow_no = parse_flow_no(value)
+    return float('inf') if flow_no is None else flow_no
+
+def build_flow_no_index(df):
     """
-    data = {}
-    current_question = None
-    global_flow_no = 2  # Start FlowNo from 2 as specified
+    Scans renamed data once for what the decoder needs to lay out its questions.
 
-    # Regular expressions for identifying questions and answers
-    question_re = re.compile(r'^(\d+[a-zA-Z]?)\.\s*(.*)')  # Matches question numbers with optional alpha suffix
-    answer_re = re.compile(r'^\s*[-(]\s*(.*)')  # Matches answers with leading dash or parenthesis
+    Parameters:
+    - df (pd.DataFrame): Renamed data, with 'phonenum' first, one column per question and 'Set' last.
 
-    for line in text_content.splitlines():
-        question_match = question_re.match(line)
-        answer_match = answer_re.match(line)
+    Returns:
+    - dict: 'columns', the columns ordered by custom_sort; 'question_columns', the
+            question columns among them; 'values', {column: its distinct non-null
+            keypress values ordered by answer number}; and 'flow_nos', {value:
+            (question, answer)} for every one of those values.
+    """
+    with stage('flow no index', len(df)):
+        columns = sorted(df.columns, key=custom_sort)
+        question_columns = columns[1:-1]
+        values = {}
+        flow_nos = {}
+        for col in question_columns:
+            unique_values = df[col].dropna().unique()
+            values[col] = sorted(unique_values, key=_answer_sort_key)
+            flow_nos.update((value, parse_flow_no(value)) for value in unique_values)
+    return {'columns': columns, 'question_columns': question_columns, 'values': values, 'flow_nos': flow_nos}
 
-        if question_match:
-            # New question found
-            q_number, q_text = question_match.groups()
-            current_question = f"Q{q_number}"  # Handles identifiers like 'Q5', 'Q5a', etc.
-            data[current_question] = {"question": q_text, "answers": {}}
-            # Increment global_flow_no only for questions
-            global_flow_no += 1
-        elif answer_match and current_question:
-            # Answer found for the current question
-            answer_text = answer_match.groups()[0].strip('() ')
-            answer_flow_no = len(data[current_question]["answers"]) + 1  # FlowNo starts at 1 for each question's answers
-            flow_no_key = f"FlowNo_{global_flow_no - 1}={answer_flow_no}"  # Use global_flow_no - 1 to align numbering
-            data[current_question]["answers"][flow_no_key] = answer_text
+def session_flow_no_index(df):
+    """
+    Returns the FlowNo index of the renamed data in session state, building it
+    only when the data changed since the index was built (see bump_data_version).
 
-    return data
+    Parameters:
+    - df (pd.DataFrame): The renamed data held in st.session_state['renamed_data'].
 
-def custom_sort(col):
-    # Improved regex to capture question and flow numbers accurately
-    match = re.match(r"FlowNo_(\d+)=*(\d*)", col)
-    if match:
-        question_num = int(match.group(1))  # Question number
-        flow_no = int(match.group(2)) if match.group(2) else 0  # Flow number, default to 0 if not present
-        return (question_num, flow_no) 
-    else:
-        return (float('inf'), 0)
+    Returns:
+    - dict: The index described in build_flow_no_index.
+    """
+    version = st.session_state.get('renamed_version', 0)
+    cached = st.session_state.get('flow_no_index')
+    if cached is None or cached['version'] != version:
+        cached = {'version': version, 'index': build_flow_no_index(df)}
+        st.session_state['flow_no_index'] = cached
+    return cached['index']
+
+# Question columns shown per page of the decoder.
+QUESTIONS_PER_PAGE = 10
+
+def session_decoder_state(flow_no_index, simple_mappings, autofill_keypress=True):
+    """
+    Returns the decoder settings of every question, kept in session state so
+    edits survive switching pages, and reset when the data or script change.
+
+    Parameters:
+    - flow_no_index (dict): The index of the renamed data (see build_flow_no_index).
+    - simple_mappings (dict): {keypress value: readable answer} from the script.
+    - autofill_keypress (bool): Whether values the script does not name default to
+                                the keypress itself rather than to an empty answer.
+
+    Returns:
+    - dict: 'drop_cols', the set of questions dropped entirely; 'base', {column:
+            DataFrame with one Keypress, Answer and Drop row per value}, the data
+            each grid is shown with; and 'edited', the same tables with the edits.
+    """
+    version = st.session_state.get('renamed_version', 0)
+    state = st.session_state.get('decoder_state')
+    if state is None or state['version'] != version or state['simple_mappings'] != simple_mappings:
+        tables = {}
+        for col in flow_no_index['question_columns']:
+            values = flow_no_index['values'][col]
+            tables[col] = pd.DataFrame({
+                'Keypress': values,
+                'Answer': [simple_mappings.get(val, val if autofill_keypress else "") for val in values],
+                'Drop': False,
+            })
+        state = {
+            'version': version,
+            'simple_mappings': simple_mappings,
+            # Part of the editor keys, so edits made to older tables are not replayed on new ones
+            'generation': st.session_state.get('decoder_state', {}).get('generation', 0) + 1,
+            'drop_cols': set(),
+            'base': tables,
+            'edited': dict(tables),
+        }
+        st.session_state['decoder_state'] = state
+    return state
+
+def render_decoder_page(flow_no_index, state):
+    """
+    Renders the questions of the selected decoder page, one editable grid per question.
+
+    Only QUESTIONS_PER_PAGE questions are rendered per run; the edits of each
+    rendered grid are kept as its 'edited' table. The grids are always shown
+    with their 'base' table, since st.data_editor is identified by its data
+    and would start over, losing the next edit, if the edited table were
+    passed back in.
+
+    Parameters:
+    - flow_no_index (dict): The index of the renamed data (see build_flow_no_index).
+    - state (dict): The decoder state (see session_decoder_state).
+    """
+    question_columns = flow_no_index['question_columns']
+    page_count = max(1, -(-len(question_columns) // QUESTIONS_PER_PAGE))
+    page = 1
+    if page_count > 1:
+        page = st.number_input(f"Questions page (of {page_count})", min_value=1, max_value=page_count, value=1, key='decoder_page')
+    start = (page - 1) * QUESTIONS_PER_PAGE
+
+    for i, col in enumerate(question_columns[start:start + QUESTIONS_PER_PAGE], start=start + 1):
+        st.subheader(f"Q{i}: {col}")
+        if st.checkbox(f"Drop entire Question {i}", value=col in state['drop_cols'], key=f"exclude_{col}"):
+            state['drop_cols'].add(col)
+            continue
+        state['drop_cols'].discard(col)
+
+        key = f"decoder_{state['generation']}_{col}"
+        if key not in st.session_state:
+            # The grid was not shown in the last run, so Streamlit dropped its edits; start it from the edited table
+            state['base'][col] = state['edited'][col]
+        state['edited'][col] = st.data_editor(
+            state['base'][col],
+            key=key,
+            disabled=['Keypress'],
+            hide_index=True,
+            use_container_width=True,
+            column_config={
+                'Answer': st.column_config.TextColumn("Rename to"),
+                'Drop': st.column_config.CheckboxColumn("Drop rows"),
+            },
+        )
+
+def decoder_settings(flow_no_index, state):
+    """
+    Collects the decoder state of every question, rendered or not, into decode_keypresses arguments.
+
+    Parameters:
+    - flow_no_index (dict): The index of the renamed data (see build_flow_no_index).
+    - state (dict): The decoder state (see session_decoder_state).
+
+    Returns:
+    - tuple: keypress_mappings, excluded_flow_nos and drop_cols.
+    """
+    keypress_mappings = {}
+    excluded_flow_nos = {}
+    drop_cols = []
+    for col in flow_no_index['question_columns']:
+        if col in state['drop_cols']:
+            drop_cols.append(col)
+            continue
+        table = state['edited'][col]
+        rows = list(zip(table['Keypress'], table['Answer'], table['Drop']))
+        excluded_flow_nos[col] = [val for val, _, drop in rows if drop]
+        all_mappings = {val: answer for val, answer, drop in rows if not drop and answer}
+        if all_mappings:
+            keypress_mappings[col] = all_mappings
+    return keypress_mappings, excluded_flow_nos, drop_cols
+
+def profile_columns(df, skip_cols=('phonenum',)):
+    """
+    Computes the value distribution, null count and cardinality of every column in one pass each.
+
+    Categorical columns, which decode_keypresses produces, are counted from
+    their codes with a single np.bincount whose first slot collects the nulls;
+    other columns go through one hashed value count, nulls being the rest.
+
+    Parameters:
+    - df (pd.DataFrame): The decoded data.
+    - skip_cols (tuple): Columns not profiled, e.g. the phone numbers.
+
+    Returns:
+    - dict: 'rows', the number of rows; 'summary', a DataFrame with the distinct
+            values, nulls and most common value of every column; and
+            'distributions', {column: DataFrame of Value, Count and Share, most common first}.
+    """
+    with stage('profile', len(df)):
+        rows = len(df)
+        summary = []
+        distributions = {}
+        for col in df.columns:
+            if col in skip_cols:
+                continue
+            values = df[col]
+            if isinstance(values.dtype, pd.CategoricalDtype):
+                counts = np.bincount(values.cat.codes.to_numpy() + 1, minlength=len(values.cat.categories) + 1)
+                nulls, counts = int(counts[0]), counts[1:]
+                present = np.flatnonzero(counts)
+                labels, counts = np.asarray(values.cat.categories, dtype=object)[present], counts[present]
+            else:
+                value_counts = values.value_counts(sort=False)
+                labels, counts = value_counts.index.to_numpy(dtype=object), value_counts.to_numpy()
+                nulls = rows - int(counts.sum())
+
+            distinct = len(labels)
+            if nulls:
+                labels, counts = np.append(labels, None), np.append(counts, nulls)
+            order = np.argsort(-counts, kind='stable')
+            labels, counts = labels[order], counts[order]
+            shares = counts / rows if rows else counts.astype(float)
+            distributions[col] = pd.DataFrame({'Value': labels, 'Count': counts, 'Share': shares})
+            summary.append({
+                'Column': col,
+                'Distinct': distinct,
+                'Nulls': nulls,
+                'Top value': labels[0] if len(labels) else None,
+                'Top share': shares[0] if len(labels) else None,
+            })
+    return {'rows': rows, 'summary': pd.DataFrame(summary), 'distributions': distributions}
+
+def render_column_profile(profile):
+    """
+    Renders a column profile compactly: one summary row per column, and the
+    full distribution of the column picked in a select box.
+
+    Parameters:
+    - profile (dict): The profile returned by profile_columns.
+    """
+    st.dataframe(profile['summary'], hide_index=True, use_container_width=True,
+                 column_config={'Top share': st.column_config.NumberColumn(format="%.3f")})
+    columns = list(profile['distributions'])
+    if columns:
+        col = st.selectbox("Distribution of column", columns, key='profile_column')
+        st.dataframe(profile['distributions'][col], hide_index=True, use_container_width=True,
+                     column_config={'Share': st.column_config.NumberColumn(format="%.3f")})
 
 def classify_income(income):
-    if income == 'RM4,850 & below':
-        return 'B40'
-    elif income == 'RM4,851 to RM10,960':
-        return 'M40'
-    elif income in ['RM15,040 & above', 'RM10,961 to RM15,039']:
-        return 'T20'
+    # Single answers only; whole columns are classified by add_derived_columns
+    return load_derived_columns()['IncomeRange']['values'].get(income)
 import json
 
 def process_file_content(uploaded_file):
@@ -76,6 +287,54 @@ def flatten_json_structure(flow_no_mappings):
     # Flattening the JSON structure to a single dictionary with FlowNo as keys
     return {k: v for question in flow_no_mappings.values() for k, v in question["answers"].items()}
 
+def decode_keypresses(df, keypress_mappings, excluded_flow_nos=None, drop_cols=None):
+    """
+    Decodes keypress values into readable answers, one pass per question column.
+
+    Each question column is converted to a Categorical once, so renaming its
+    answers only touches the categories, and the rows holding excluded values
+    of every column are removed with a single combined mask.
+
+    Parameters:
+    - df (pd.DataFrame): Renamed data with one column per question.
+    - keypress_mappings (dict): {column: {keypress value: readable answer}}.
+    - excluded_flow_nos (dict, optional): {column: [keypress values whose rows are dropped]}.
+    - drop_cols (list, optional): Question columns to drop entirely.
+
+    Returns:
+    - pd.DataFrame: The decoded data, with the decoded question columns as categoricals.
+    """
+    with stage('decode', len(df)) as record:
+        excluded_flow_nos = excluded_flow_nos or {}
+        df = df.drop(columns=drop_cols or [])
+
+        exclude_mask = np.zeros(len(df), dtype=bool)
+        for col in df.columns:
+            col_mappings = keypress_mappings.get(col)
+            excluded = excluded_flow_nos.get(col)
+            if not col_mappings and not excluded:
+                continue
+
+            values = pd.Categorical(df[col])
+            if excluded:
+                exclude_mask |= values.isin(excluded)
+
+            if col_mappings and len(values.categories):
+                # Several keypresses may map to the same answer, so re-factorize the renamed categories
+                labels = [col_mappings.get(category, category) for category in values.categories]
+                label_codes, label_categories = pd.factorize(np.array(labels, dtype=object))
+                codes = np.where(values.codes >= 0, label_codes[values.codes], -1)
+                values = pd.Categorical.from_codes(codes, categories=label_categories)
+
+            df[col] = values
+
+        if exclude_mask.any():
+            df = df[~exclude_mask]
+        for col in df.select_dtypes('category').columns:
+            df[col] = df[col].cat.remove_unused_categories()
+        record['rows_out'] = len(df)
+    return df
+
 def drop_duplicates_from_dataframe(df):
     """
     Drops duplicate rows from the DataFrame.
@@ -0,0 +1,130 @@
+import contextvars
+import os
+import sys
+import time
+from contextlib import contextmanager
+
+import pandas as pd
+
+try:
+    import resource
+except ImportError:  # Windows
+    resource = None
+
+# Stage records collected by the innermost active recording() block, if any.
+_current_records = contextvars.ContextVar('perf_records', default=None)
+
+def current_rss_mb():
+    """Returns the resident memory of this process in MB, or None where it cannot be read."""
+    try:
+        with open('/proc/self/statm') as statm:
+            return int(statm.read().split()[1]) * os.sysconf('SC_PAGE_SIZE') / 2**20
+    except (OSError, ValueError, AttributeError):
+        return None
+
+def peak_rss_mb():
+    """Returns the highest resident memory of this process so far in MB, or None where it is not available."""
+    if resource is None:
+        return None
+    # ru_maxrss is in KB on Linux and in bytes on macOS
+    return resource.getrusage(resource.RUSAGE_SELF).ru_maxrss / (2**20 if sys.platform == 'darwin' else 2**10)
+
+@contextmanager
+def recording():
+    """
+    Collects the records of the stages run inside the block, in this thread or task.
+
+    Yields:
+    - list of dict: The stage records, filled as the stages finish.
+    """
+    records = []
+    token = _current_records.set(records)
+    try:
+        yield records
+    finally:
+        _current_records.reset(token)
+
+@contextmanager
+def stage(name, rows_in=None):
+    """
+    Times a pipeline stage and adds its record to the active recording.
+
+    Nothing is measured when no recording is active, so instrumented code
+    costs nothing outside of the pages that show the Performance panel.
+
+    Parameters:
+    - name (str): The name of the stage, e.g. 'read' or 'dedup'.
+    - rows_in (int, optional): Number of rows the stage receives.
+
+    Yields:
+    - dict: The record of the stage; set its 'rows_out' inside the block.
+    """
+    record = {'stage': name, 'rows_in': rows_in, 'rows_out': None}
+    records = _current_records.get()
+    if records is None:
+        yield record
+        return
+
+    start = time.perf_counter()
+    try:
+        yield record
+    finally:
+        record['seconds'] = time.perf_counter() - start
+        record['rss_mb'] = current_rss_mb()
+        record['peak_rss_mb'] = peak_rss_mb()
+        records.append(record)
+
+def add_records(records):
+    """Adds stage records collected elsewhere, e.g. in a worker process, to the active recording."""
+    current = _current_records.get()
+    if current is not None:
+        current.extend(records)
+
+def summarize_records(records):
+    """
+    Sums the records of repeated stages, e.g. one per file or per chunk.
+
+    Parameters:
+    - records (list of dict): Stage records collected by recording().
+
+    Returns:
+    - pd.DataFrame: One row per stage in the order they first ran, with the number of
+      runs, the total wall time, rows in and out, and the highest memory readings.
+    """
+    columns = ['stage', 'runs', 'seconds', 'rows_in', 'rows_out', 'rss_mb', 'peak_rss_mb']
+    if not records:
+        return pd.DataFrame(columns=columns)
+    df = pd.DataFrame(records)
+    df['runs'] = 1
+    summary = df.groupby('stage', sort=False).agg(
+        runs=('runs', 'sum'),
+        seconds=('seconds', 'sum'),
+        rows_in=('rows_in', lambda rows: rows.sum(min_count=1)),
+        rows_out=('rows_out', lambda rows: rows.sum(min_count=1)),
+        rss_mb=('rss_mb', 'max'),
+        peak_rss_mb=('peak_rss_mb', 'max'),
+    ).reset_index()
+    return summary[columns]
+
+def store_performance(action, records):
+    """
+    Keeps the stage records of the latest run of an action for the Performance panel.
+
+    Parameters:
+    - action (str): What the user ran, e.g. 'Clean files' or 'Decode keypresses'.
+    - records (list of dict): Stage records collected by recording().
+    """
+    # Imported here so worker processes that only record stages do not load Streamlit
+    import streamlit as st
+    st.session_state.setdefault('performance', {})[action] = summarize_records(records)
+
+def render_performance_panel():
+    """Renders a collapsible panel with the stage timings of the latest run of every action."""
+    import streamlit as st
+    performance = st.session_state.get('performance')
+    if not performance:
+        return
+    with st.expander("Performance"):
+        for action, summary in performance.items():
+            st.markdown(f"**{action}**: {summary['seconds'].sum():.3f} s")
+            st.dataframe(summary.round(3), hide_index=True, use_container_width=True)
@@ -1,4 +1,4 @@
-import re
+from modules.perf_utils import stage
 
 def parse_questions_and_answers(json_data):
     """
@@ -17,55 +17,24 @@ def parse_questions_and_answers(json_data):
         questions_and_answers[q_key] = {'question': question_text, 'answers': answers}
     return questions_and_answers
 
-import re
-
-def parse_text_to_json(text_content):
-    """
-    Converts structured text content into a JSON-like dictionary, parsing questions and their answers.
-    
-    Parameters:
-    - text_content (str): Text content containing questions and answers in a structured format.
-    
-    Returns:
-    - dict: A dictionary representing the parsed content with questions as keys and their details 
-            (question text and answers) as values.
-    """
-    data = {}
-    # Updated regex pattern to match questions with numbers followed by optional alphabet characters
-    # (e.g., 1., 4a., 5b.), allowing spaces around the period.
-    question_re = re.compile(r'^\s*(\d+[a-zA-Z]?)\s*\.\s*(.*)')
-    answer_re = re.compile(r'^\s*-\s*(.*)')  # Adjusted to allow optional spaces around the dash
-
-    current_question = ""
-
-    for line in text_content.splitlines():
-        question_match = question_re.match(line)
-        answer_match = answer_re.match(line)
-
-        if question_match:
-            q_number, q_text = question_match.groups()
-            current_question = f"Q{q_number}"
-            data[current_question] = {"question": q_text, "answers": {}}
-        elif answer_match and current_question:
-            answer_text = answer_match.groups()[0]
-            flow_no = len(data[current_question]["answers"]) + 1
-            flow_no_key = f"FlowNo_{current_question}={flow_no}"
-            data[current_question]["answers"][flow_no_key] = answer_text
-
-    return data
-
 def rename_columns(df, new_column_names):
     """
     Renames dataframe columns based on a list of new column names.
+
+    The renamed DataFrame shares its columns with df instead of copying them,
+    so the renamed data costs no memory beyond the cleaned data it comes from.
     
     Parameters:
     - df (pd.DataFrame): The original DataFrame.
     - new_column_names (list): A list of new column names corresponding to the DataFrame's columns.
     
     Returns:
-    - pd.DataFrame: A DataFrame with updated column names.
+    - pd.DataFrame: A view of df with updated column names.
     """
-    mapping = {old: new for old, new in zip(df.columns, new_column_names) if new}
-    return df.rename(columns=mapping, inplace=False)
+    with stage('rename', len(df)) as record:
+        mapping = {old: new for old, new in zip(df.columns, new_column_names) if new}
+        renamed_df = df.rename(columns=mapping, copy=False)
+        record['rows_out'] = len(renamed_df)
+    return renamed_df
 
 #
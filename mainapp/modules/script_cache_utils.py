@@ -0,0 +1,90 @@
+import json
+import os
+
+import streamlit as st
+
+from modules.keypress_decoder_utils_page3 import flatten_json_structure
+from modules.questionnaire_utils_page2 import parse_questions_and_answers
+from modules.script_parser_utils import parse_text_to_json, script_digest
+
+# How many scripts the cache shared by all sessions holds, and for how many seconds.
+SCRIPT_CACHE_ENTRIES = int(os.environ.get('IVR_SCRIPT_CACHE_ENTRIES', 64))
+SCRIPT_CACHE_TTL = int(os.environ.get('IVR_SCRIPT_CACHE_TTL', 12 * 60 * 60))
+
+@st.cache_resource(max_entries=SCRIPT_CACHE_ENTRIES, ttl=SCRIPT_CACHE_TTL, show_spinner=False)
+def _load_script(digest, is_json, _file_content):
+    # Keyed by the content hash; the leading underscore keeps Streamlit from hashing the text itself
+    if is_json:
+        flow_no_mappings = json.loads(_file_content)
+        qa_dict = parse_questions_and_answers(flow_no_mappings)
+    else:
+        flow_no_mappings = parse_text_to_json(_file_content)
+        qa_dict = flow_no_mappings
+    return {
+        'digest': digest,
+        'flow_no_mappings': flow_no_mappings,
+        'qa_dict': qa_dict,
+        'simple_mappings': flatten_json_structure(flow_no_mappings),
+    }
+
+def load_script(file_content, is_json=False):
+    """
+    Parses a questionnaire script, or loads its FlowNo mappings from JSON, through
+    a cache shared by every session of the app.
+
+    Scripts are cached by the hash of their content, so analysts working on the
+    same campaign share one parsed copy. Entries expire after SCRIPT_CACHE_TTL
+    seconds and the least recently used ones are dropped beyond SCRIPT_CACHE_ENTRIES.
+    The returned objects are shared and must not be modified.
+
+    Parameters:
+    - file_content (str): The uploaded script or JSON file.
+    - is_json (bool): Whether file_content holds FlowNo mappings as JSON.
+
+    Returns:
+    - dict: 'digest', the hash of the content; 'flow_no_mappings', {question key:
+            {'question', 'answers': {FlowNo key: answer}}}; 'qa_dict', the questions
+            shown by the renaming section; and 'simple_mappings', {FlowNo key: answer}.
+
+    Raises:
+    - json.JSONDecodeError: When is_json is set and the content is not valid JSON.
+    """
+    return _load_script(script_digest(file_content), is_json, file_content)
+
+@st.cache_resource(max_entries=SCRIPT_CACHE_ENTRIES * 4, ttl=SCRIPT_CACHE_TTL, show_spinner=False)
+def _default_column_names(digest, columns, _qa_dict):
+    question_keys = list(_qa_dict)
+    names = []
+    for idx, default_name in enumerate(columns):
+        if idx == 0:
+            # First column reserved for "phonenum"
+            names.append("phonenum")
+        elif idx == len(columns) - 1:
+            # Last column reserved for "Set"
+            names.append("Set")
+        elif idx <= len(question_keys):
+            # Column idx holds the answers of the idx-th question, e.g. "1. Did you vote in Miri Parliament?"
+            question_key = question_keys[idx - 1]
+            question_text = _qa_dict[question_key].get('question', default_name)
+            names.append(f"{question_key.lstrip('Q')}. {question_text}")
+        else:
+            names.append(str(default_name))
+    return tuple(names)
+
+def default_column_names(columns, script=None):
+    """
+    Proposes names for the columns of the cleaned data: 'phonenum' first, 'Set'
+    last and the questions of the script in between. The proposals are cached
+    with the script, per set of columns.
+
+    Parameters:
+    - columns (list): The columns of the cleaned data.
+    - script (dict, optional): A script returned by load_script; without one the
+                               question columns keep their names.
+
+    Returns:
+    - tuple of str: One proposed name per column.
+    """
+    if script is None:
+        return _default_column_names(None, tuple(columns), {})
+    return _default_column_names(script['digest'], tuple(columns), script['qa_dict'])
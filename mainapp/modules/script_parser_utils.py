@@ -0,0 +1,122 @@
+import hashlib
+import re
+import threading
+from collections import OrderedDict
+
+# How many parsed scripts and question blocks are kept in memory.
+SCRIPT_CACHE_SIZE = 32
+BLOCK_CACHE_SIZE = 4096
+
+# A question line: a number with an optional letter and a period, e.g. '1.', '4a.' or ' 5b . '.
+QUESTION_START_RE = re.compile(r'^[^\S\n]*\d+[a-zA-Z]?[^\S\n]*\.', re.MULTILINE)
+# Any line of a question block: the question itself, or an answer led by a dash or wrapped in parentheses.
+# Whitespace is matched with [^\S\n] so a match never runs into the next line, and only the
+# closing parenthesis of a wrapped answer is dropped, e.g. '(31 and above (inclusive))'.
+SCRIPT_LINE_RE = re.compile(
+    r'^[^\S\n]*(?:'
+    r'(?P<number>\d+[a-zA-Z]?)[^\S\n]*\.[^\S\n]*(?P<question>(?:.*\S)?)'
+    r'|-[^\S\n]*(?P<answer>(?:.*\S)?)'
+    r'|\([^\S\n]*(?P<wrapped_answer>.*?)[^\S\n]*\)?'
+    r')[^\S\n]*$',
+    re.MULTILINE,
+)
+
+# The first question of a script is FlowNo_2; the dialer's FlowNo_1 is the greeting.
+FIRST_FLOW_NO = 2
+
+_script_cache = OrderedDict()
+_mappings_cache = OrderedDict()
+_block_cache = OrderedDict()
+_cache_lock = threading.Lock()
+
+def _cache_get(cache, key):
+    with _cache_lock:
+        value = cache.get(key)
+        if value is not None:
+            cache.move_to_end(key)
+        return value
+
+def _cache_put(cache, key, value, max_size):
+    with _cache_lock:
+        cache[key] = value
+        cache.move_to_end(key)
+        while len(cache) > max_size:
+            cache.popitem(last=False)
+
+def script_digest(text_content):
+    """Returns the SHA-256 of a script's text, the key its parse results are cached under."""
+    return hashlib.sha256(text_content.encode('utf-8')).hexdigest()
+
+def _parse_block(block):
+    """Parses the text of one question and its answers into (number, question text, answers)."""
+    # A block holds a single question line, the first one; every other match is an answer
+    (q_number, q_text, _, _), *answer_lines = SCRIPT_LINE_RE.findall(block)
+    return q_number, q_text, tuple(answer or wrapped_answer for _, _, answer, wrapped_answer in answer_lines)
+
+def parse_script(text_content):
+    """
+    Parses a questionnaire script into its questions, reusing earlier work where possible.
+
+    The script is split into blocks, one per question and its answers. Whole
+    scripts are cached by content hash, and blocks by their text, so a script
+    in which a few lines were edited only has the edited questions parsed again.
+    Lines before the first question and lines that are neither a question nor
+    an answer are ignored.
+
+    Parameters:
+    - text_content (str): The script, one question or answer per line.
+
+    Returns:
+    - tuple: One (question number, question text, tuple of answers) per question, in script order.
+    """
+    digest = script_digest(text_content)
+    questions = _cache_get(_script_cache, digest)
+    if questions is not None:
+        return questions
+
+    starts = [match.start() for match in QUESTION_START_RE.finditer(text_content)]
+    parsed = []
+    for start, end in zip(starts, starts[1:] + [len(text_content)]):
+        block = text_content[start:end]
+        question = _cache_get(_block_cache, block)
+        if question is None:
+            question = _parse_block(block)
+            _cache_put(_block_cache, block, question, BLOCK_CACHE_SIZE)
+        parsed.append(question)
+
+    questions = tuple(parsed)
+    _cache_put(_script_cache, digest, questions, SCRIPT_CACHE_SIZE)
+    return questions
+
+def parse_text_to_json(text_content):
+    """
+    Converts a questionnaire script into the FlowNo mappings used to decode keypresses.
+
+    Questions are numbered by their position in the script: the answers of
+    the first question are FlowNo_2=1, FlowNo_2=2, ..., those of the second
+    FlowNo_3=1, and so on, whatever numbers the script gives them.
+
+    The mappings are cached with the script and shared by every caller that
+    parses the same text, so they must not be modified.
+
+    Parameters:
+    - text_content (str): Text content containing questions and answers in a structured format.
+
+    Returns:
+    - dict: A dictionary with 'Q<number>' keys and the question text and its
+            {FlowNo key: answer} mappings as values.
+    """
+    digest = script_digest(text_content)
+    data = _cache_get(_mappings_cache, digest)
+    if data is not None:
+        return data
+
+    data = {}
+    for position, (q_number, q_text, answers) in enumerate(parse_script(text_content)):
+        flow_no = FIRST_FLOW_NO + position
+        data[f"Q{q_number}"] = {
+            "question": q_text,
+            "answers": {f"FlowNo_{flow_no}={idx}": answer for idx, answer in enumerate(answers, start=1)},
+        }
+    _cache_put(_mappings_cache, digest, data, SCRIPT_CACHE_SIZE)
+    return data
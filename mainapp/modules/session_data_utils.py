@@ -0,0 +1,78 @@
+import numpy as np
+import streamlit as st
+
+from modules.export_utils import bump_data_version
+from modules.perf_utils import stage
+
+# Datasets computed from each session dataset. Replacing a dataset releases
+# them, so a session never keeps data left over from earlier files or names.
+DEPENDENT_DATASETS = {
+    'cleaned': ('renamed', 'decoded'),
+    'renamed': ('decoded',),
+    'decoded': (),
+}
+
+# Phone numbers that survive a round trip through int64: digits only, no leading zero.
+INT64_PHONE_PATTERN = r'[1-9]\d{0,17}'
+
+def _is_int64_phone_column(values):
+    """Tests whether a column of phone strings can be stored as int64 without changing any number."""
+    return values.notna().all() and values.astype('string').str.fullmatch(INT64_PHONE_PATTERN).all()
+
+def compact_dataframe(df):
+    """
+    Stores cleaned data in its most compact form.
+
+    The first column (the phone numbers) becomes int64 when every number
+    converts back to the same digits, and every other text column (the FlowNo
+    answers and the Set) becomes a categorical, so each distinct answer is
+    held once per column instead of once per row.
+
+    Parameters:
+    - df (pd.DataFrame): Cleaned data, with object columns.
+
+    Returns:
+    - pd.DataFrame: The data with int64 phone numbers and categorical answer columns.
+    """
+    with stage('compact', len(df)) as record:
+        dtypes = {col: 'category' for col in df.columns[1:] if df[col].dtype == object}
+        if len(df.columns) and df[df.columns[0]].dtype == object and _is_int64_phone_column(df[df.columns[0]]):
+            dtypes[df.columns[0]] = np.int64
+        if dtypes:
+            df = df.astype(dtypes)
+        record['rows_out'] = len(df)
+    return df
+
+def release_dataset(name):
+    """
+    Removes a session dataset and its prepared download, freeing their memory.
+
+    Parameters:
+    - name (str): The name of the dataset, e.g. 'renamed'.
+    """
+    st.session_state.pop(f'{name}_data', None)
+    st.session_state.pop(f'{name}_download_payload', None)
+    if name == 'decoded':
+        st.session_state.pop('decoded_profile', None)
+
+def store_dataset(name, df):
+    """
+    Makes a DataFrame the session's copy of a dataset.
+
+    The dataset is kept under '<name>_data' and its version is bumped, so its
+    download is prepared again. The previous download of the dataset and the
+    datasets computed from its previous version are released.
+
+    Parameters:
+    - name (str): A key of DEPENDENT_DATASETS.
+    - df (pd.DataFrame): The new data.
+
+    Returns:
+    - pd.DataFrame: The stored data.
+    """
+    for dependent in DEPENDENT_DATASETS[name]:
+        release_dataset(dependent)
+    st.session_state.pop(f'{name}_download_payload', None)
+    st.session_state[f'{name}_data'] = df
+    bump_data_version(name)
+    return df
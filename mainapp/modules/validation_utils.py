@@ -0,0 +1,102 @@
+import numpy as np
+import pandas as pd
+
+from modules.perf_utils import stage
+from modules.phone_utils import normalize_phone_strings
+
+# Reasons a call is left out of the cleaned data, in the order they are checked;
+# a rejected call is tagged with the first one that applies.
+REJECTION_REASONS = {
+    'no_keypress': "The call was not answered: UserKeyPress is empty.",
+    'incomplete': "The call ended before every question was answered.",
+    'invalid_keypress': "A keypress is not of the form FlowNo_<question>=<answer>.",
+    'invalid_phone': "PhoneNo is not a Malaysian phone number.",
+}
+
+# Every keypress field holds one answer, e.g. 'FlowNo_3=2'.
+KEYPRESS_PATTERN = r'FlowNo_\d+=\d+'
+# The field after UserKeyPress must also be exactly this long, i.e. a single-digit
+# question and answer, as the cleaner's original length filter required.
+FIRST_ANSWER_LENGTH = 10
+
+def validate_ivr_results(df_results, phones=None):
+    """
+    Checks every call of an IVR export in one vectorized pass and tags the
+    calls that cannot be used with a reason code.
+
+    Unanswered and incomplete calls are found from the missing values alone;
+    the string checks then run on the Arrow-backed strings of the complete
+    calls only. PhoneNo is normalized to the 60XXXXXXXXX format on the way,
+    unless it was already, and calls whose number cannot be normalized are rejected.
+
+    Parameters:
+    - df_results (pd.DataFrame): 'PhoneNo', 'UserKeyPress' and keypress columns, one row per phone number.
+    - phones (pd.Series, optional): PhoneNo as returned by normalize_phone_strings, with the index of df_results.
+
+    Returns:
+    - reasons (pd.Series): A categorical of the keys of REJECTION_REASONS, missing for valid calls.
+    - phones (pd.Series): The normalized phone numbers of the complete calls, missing
+      elsewhere and where PhoneNo is invalid.
+    """
+    with stage('validate', len(df_results)) as record:
+        no_keypress = df_results['UserKeyPress'].isna().to_numpy()
+        # A missing PhoneNo also makes a call incomplete, as the original dropna did
+        incomplete = df_results.isna().any(axis='columns').to_numpy()
+        complete = ~incomplete
+
+        keypresses = df_results.iloc[complete, 1:].astype('string[pyarrow]')
+        malformed = np.zeros(len(keypresses), dtype=bool)
+        for col in keypresses.columns:
+            malformed |= ~keypresses[col].str.fullmatch(KEYPRESS_PATTERN).to_numpy(dtype=bool)
+        if keypresses.shape[1] > 1:
+            malformed |= (keypresses.iloc[:, 1].str.len() != FIRST_ANSWER_LENGTH).to_numpy(dtype=bool)
+        invalid_keypress = np.zeros(len(df_results), dtype=bool)
+        invalid_keypress[complete] = malformed
+
+        if phones is None:
+            phones = pd.Series(pd.NA, index=df_results.index, dtype='string[pyarrow]')
+            phones[complete] = normalize_phone_strings(df_results['PhoneNo'][complete])
+        else:
+            phones = phones.where(complete)
+        invalid_phone = phones.isna().to_numpy()
+
+        codes = np.select([no_keypress, incomplete, invalid_keypress, invalid_phone], list(range(len(REJECTION_REASONS))), -1)
+        reasons = pd.Series(pd.Categorical.from_codes(codes, categories=list(REJECTION_REASONS)), index=df_results.index)
+        record['rows_out'] = int((codes == -1).sum())
+    return reasons, phones
+
+def count_rejections(reasons):
+    """
+    Counts the rejected calls per reason.
+
+    Parameters:
+    - reasons (pd.Series): The reasons returned by validate_ivr_results.
+
+    Returns:
+    - dict: {reason: number of calls} for every key of REJECTION_REASONS.
+    """
+    counts = np.bincount(reasons.cat.codes[reasons.cat.codes >= 0], minlength=len(REJECTION_REASONS))
+    return dict(zip(REJECTION_REASONS, counts.tolist()))
+
+def add_rejections(*counts):
+    """Sums rejection counts of several files or chunks, as returned by count_rejections."""
+    return {reason: sum(count.get(reason, 0) for count in counts) for reason in REJECTION_REASONS}
+
+def rejection_report(counts, total_calls):
+    """
+    Summarizes rejection counts as a table.
+
+    Parameters:
+    - counts (dict): {reason: number of calls}, as returned by count_rejections.
+    - total_calls (int): The number of calls checked.
+
+    Returns:
+    - pd.DataFrame: One row per reason: its code, description, number of calls and share of all calls.
+    """
+    rows = [counts.get(reason, 0) for reason in REJECTION_REASONS]
+    return pd.DataFrame({
+        'Reason': list(REJECTION_REASONS),
+        'Description': list(REJECTION_REASONS.values()),
+        'Calls': rows,
+        'Share': [count / total_calls if total_calls else 0.0 for count in rows],
+    })
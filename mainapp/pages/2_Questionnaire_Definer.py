@@ -1,7 +1,12 @@
 import streamlit as st
 from PIL import Image
 import json
-from modules.questionnaire_utils_page2 import parse_questions_and_answers, parse_text_to_json, rename_columns
+from datetime import datetime
+from modules.questionnaire_utils_page2 import rename_columns
+from modules.script_cache_utils import load_script, default_column_names
+from modules.export_utils import EXPORT_FORMATS, with_extension, lazy_download_button
+from modules.session_data_utils import store_dataset
+from modules.perf_utils import recording, store_performance, render_performance_panel
 
 # Configure the default settings of the page.
 icon = Image.open('./images/invoke_logo.png')
@@ -51,18 +56,20 @@ def run1():
     if uploaded_file is not None:
         file_contents = uploaded_file.getvalue().decode("utf-8")
 
+        # Scripts are parsed once per deployment and shared by every session that uploads them
         if uploaded_file.type == "application/json":
             try:
-                json_data = json.loads(file_contents)
-                parsed_data = parse_questions_and_answers(json_data)
-                st.session_state['qa_dict'] = parsed_data
+                script = load_script(file_contents, is_json=True)
+                st.session_state['script'] = script
+                st.session_state['qa_dict'] = script['qa_dict']
                 st.success("JSON questions and answers parsed successfully.✨")
                 file_parsed = True
             except json.JSONDecodeError:
                 st.error("Error decoding JSON. Please ensure the file is a valid JSON format.")
         else:  # For text format
-            parsed_data = parse_text_to_json(file_contents)
-            st.session_state['qa_dict'] = parsed_data
+            script = load_script(file_contents)
+            st.session_state['script'] = script
+            st.session_state['qa_dict'] = script['qa_dict']
             st.success("Text questions and answers parsed successfully.✨")
             file_parsed = True
 
@@ -74,41 +81,34 @@ def run1():
         cleaned_data = st.session_state['cleaned_data']
         column_names_to_display = [col for col in cleaned_data.columns]
 
-        # Directly match column indices with question identifiers
-        question_keys = list(st.session_state['qa_dict'].keys())  # ['Q1', 'Q2', ..., 'Q4a', 'Q4b', ...]
-        question_count = len(question_keys)
-        column_count = len(column_names_to_display)
+        # Directly match column indices with question identifiers: phonenum, the questions in script order, then Set
+        default_names = default_column_names(column_names_to_display, st.session_state.get('script'))
 
-        # Ensure correct alignment between questions and columns
-        # Match columns with questions only if counts are aligned properly
         new_column_names = []
-        for idx, default_name in enumerate(column_names_to_display):
-            if idx == 0:
-                # First column reserved for "phonenum"
-                default_value = "phonenum"
-            elif idx == column_count - 1:
-                # Last column reserved for "Set"
-                default_value = "Set"
-            elif idx < question_count + 1:  # Align to match questions starting from the second column
-                question_key = question_keys[idx - 1]  # Correct index alignment
-                # Remove 'Q' from question_key and format correctly
-                question_identifier = question_key.lstrip('Q')  # Remove the 'Q'
-                question_text = st.session_state['qa_dict'].get(question_key, {}).get('question', default_name)
-                # Format the column name as "1. Did you vote in Miri Parliament?"
-                default_value = f"{question_identifier}. {question_text}"   
-            else:
-                default_value = default_name
-
+        for idx, (default_name, default_value) in enumerate(zip(column_names_to_display, default_names)):
             # Display text input for new names
             new_name = st.text_input(f"Column {idx+1}: {default_name}", value=default_value, key=f"new_name_{idx}")
             new_column_names.append(new_name)
 
         # Apply renaming when user confirms
         if st.button("Apply New Column Names"):
-            updated_df = rename_columns(cleaned_data, new_column_names)
-            st.session_state['renamed_data'] = updated_df
+            with recording() as records:
+                updated_df = rename_columns(cleaned_data, new_column_names)
+            store_performance("Rename columns", records)
+            # Replaces the previous renamed data and releases the data decoded from it
+            store_dataset('renamed', updated_df)
             st.write("DataFrame with Renamed Columns:")
             st.dataframe(updated_df.head())
 
+        # Download the renamed data once it exists
+        if 'renamed_data' in st.session_state and not st.session_state['renamed_data'].empty:
+            formatted_date = datetime.now().strftime("%Y%m%d")
+            export_format = st.radio("Download format", list(EXPORT_FORMATS), horizontal=True, key='renamed_export_format')
+            output_filename = st.text_input("Edit the filename for download", value=f'IVR_Renamed_Data_v{formatted_date}.csv', key='renamed_output_filename')
+            output_filename = with_extension(output_filename, export_format)
+            lazy_download_button('renamed', st.session_state['renamed_data'], export_format, f"Download Renamed Data as {export_format}", output_filename)
+
+        render_performance_panel()
+
 if __name__ == "__main__":
     run1()
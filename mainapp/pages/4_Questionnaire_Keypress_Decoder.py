@@ -3,8 +3,13 @@ from PIL import Image
 from datetime import datetime
 import json
 import pandas as pd
-from modules.questionnaire_utils_page2 import parse_questions_and_answers, parse_text_to_json as parse_text_to_json_qa, rename_columns
-from modules.keypress_decoder_utils_page3 import parse_text_to_json as parse_text_to_json_kd, custom_sort, classify_income, drop_duplicates_from_dataframe
+from modules.questionnaire_utils_page2 import rename_columns
+from modules.script_cache_utils import load_script, default_column_names
+from modules.keypress_decoder_utils_page3 import session_flow_no_index, session_decoder_state, render_decoder_page, decoder_settings, profile_columns, render_column_profile, drop_duplicates_from_dataframe, decode_keypresses
+from modules.derived_column_utils import add_derived_columns
+from modules.export_utils import EXPORT_FORMATS, with_extension, lazy_download_button
+from modules.session_data_utils import store_dataset
+from modules.perf_utils import recording, store_performance, render_performance_panel
 
 # Configure the default settings of the page.
 icon = Image.open('./images/invoke_logo.png')
@@ -49,27 +54,31 @@ if 'qa_dict' not in st.session_state:
 uploaded_file = st.file_uploader("Choose a txt with formatting or json with flow-mapping file", type=['txt', 'json'])
 
 flow_no_mappings = {}
+simple_mappings = {}
 file_parsed = False
 
 if uploaded_file is not None:
     file_content = uploaded_file.getvalue().decode("utf-8")
 
+    # Scripts are parsed once per deployment and shared by every session that uploads them
     if uploaded_file.type == "application/json":
         try:
-            flow_no_mappings = json.loads(file_content)
-            parsed_data = parse_questions_and_answers(flow_no_mappings)
-            st.session_state['qa_dict'] = parsed_data
+            script = load_script(file_content, is_json=True)
             st.success("JSON questions and answers parsed successfully.✨")
             file_parsed = True
         except json.JSONDecodeError:
             st.error("Error decoding JSON. Please ensure the file is a valid JSON format.")
     else:  # For text format
-        flow_no_mappings = parse_text_to_json_kd(file_content)
-        parsed_data = parse_text_to_json_qa(file_content)
-        st.session_state['qa_dict'] = parsed_data
+        script = load_script(file_content)
         st.success("Text questions and answers parsed successfully.✨")
         file_parsed = True
 
+    if file_parsed:
+        flow_no_mappings = script['flow_no_mappings']
+        simple_mappings = script['simple_mappings']
+        st.session_state['script'] = script
+        st.session_state['qa_dict'] = script['qa_dict']
+
     # Debug information in a dropdown box
     with st.expander("Show FlowNo Mappings"):
         st.write("FlowNo Mappings:", flow_no_mappings)
@@ -81,11 +90,6 @@ if uploaded_file is not None:
 else:
     st.info("Please upload a file to parse questions and their answers.")
 
-simple_mappings = {k: v for question in flow_no_mappings.values() for k, v in question["answers"].items()}
-for q_key, q_data in flow_no_mappings.items():
-    for answer_key, answer_value in q_data["answers"].items():
-        simple_mappings[answer_key] = answer_value
-
 # Section for manual and auto-filled renaming
 st.markdown("## Rename Columns")
 if 'cleaned_data' not in st.session_state:
@@ -97,38 +101,31 @@ if cleaned_data.empty:
 else:
     column_names_to_display = [col for col in cleaned_data.columns]  # Placeholder for actual column names
     
-    # Count matching between columns and questions
-    question_keys = list(st.session_state['qa_dict'].keys())  # ['Q1', 'Q2', ..., 'Q4a', 'Q4b', ...]
-    question_count = len(question_keys)
-    column_count = len(column_names_to_display)
+    # Manual input for renaming columns, with "phonenum" first, "Set" last and the questions of the uploaded script in between
+    default_names = default_column_names(column_names_to_display, script if file_parsed else None)
 
-    # Manual input for renaming columns, with special handling for the first and last columns
     new_column_names = []
-    for idx, default_name in enumerate(column_names_to_display):
-        if idx == 0:
-            # First column reserved for "phonenum"
-            default_value = "phonenum"
-        elif idx == len(column_names_to_display) - 1:
-            # Last column reserved for "Set"
-            default_value = "Set"
-        elif file_parsed and idx <= question_count:
-            # Adjust question numbering to match correctly
-            question_key = question_keys[idx - 1]  # Use correct index for question_keys
-            question_identifier = question_key.lstrip('Q')  # Remove the 'Q'
-            question_text = st.session_state['qa_dict'].get(question_key, {}).get('question', default_name)
-            default_value = f"{question_identifier}. {question_text}" 
-        else:
-            default_value = default_name
-
+    for idx, (default_name, default_value) in enumerate(zip(column_names_to_display, default_names)):
         new_name = st.text_input(f"Column {idx+1}: {default_name}", value=default_value, key=f"new_name_{idx}")
         new_column_names.append(new_name)
 
     if st.button("Apply New Column Names"):
-        updated_df = rename_columns(cleaned_data, new_column_names)
-        st.session_state['renamed_data'] = updated_df
+        with recording() as records:
+            updated_df = rename_columns(cleaned_data, new_column_names)
+        store_performance("Rename columns", records)
+        # Replaces the previous renamed data and releases the data decoded from it
+        store_dataset('renamed', updated_df)
         st.write("DataFrame with Renamed Columns:")
         st.dataframe(updated_df.head())
 
+    # Download the renamed data once it exists
+    if 'renamed_data' in st.session_state and not st.session_state['renamed_data'].empty:
+        formatted_date = datetime.now().strftime("%Y%m%d")
+        export_format = st.radio("Download format", list(EXPORT_FORMATS), horizontal=True, key='renamed_export_format')
+        output_filename = st.text_input("Edit the filename for download", value=f'IVR_Renamed_Data_v{formatted_date}.csv', key='renamed_output_filename')
+        output_filename = with_extension(output_filename, export_format)
+        lazy_download_button('renamed', st.session_state['renamed_data'], export_format, f"Download Renamed Data as {export_format}", output_filename)
+
 # Keypress Decoder Section
 st.markdown("## Keypress Decoder")
 if 'renamed_data' not in st.session_state:
@@ -137,104 +134,69 @@ if 'renamed_data' not in st.session_state:
 def process_data():
     if 'renamed_data' in st.session_state and not st.session_state['renamed_data'].empty:
         renamed_data = st.session_state['renamed_data']
-        
-        sorted_columns = sorted(renamed_data.columns, key=custom_sort)
-        renamed_data = renamed_data[sorted_columns]
-        st.session_state['renamed_data'] = renamed_data
+        flow_no_index = session_flow_no_index(renamed_data)
+
+        if list(renamed_data.columns) != flow_no_index['columns']:
+            renamed_data = renamed_data[flow_no_index['columns']]
+            st.session_state['renamed_data'] = renamed_data
         st.write("Preview of Renamed Column Data:")
         st.dataframe(renamed_data.head())
 
-        keypress_mappings = {}
-        drop_cols = []
-        excluded_flow_nos = {}
-
-        question_columns = renamed_data.columns[1:-1]
-        for i, col in enumerate(question_columns, start=1):
-            st.subheader(f"Q{i}: {col}")
-            unique_values = [val for val in renamed_data[col].unique() if pd.notna(val)]
-            sorted_unique_values = sorted(unique_values, key=lambda x: int(x.split('=')[1]) if '=' in x and x.split('=')[1] else float('inf'))
-
-            if st.checkbox(f"Drop entire Question {i}", key=f"exclude_{col}"):
-                drop_cols.append(col)
-                continue
-
-            ### Decoder ###
-            all_mappings = {}
-            excluded_flow_nos[col] = []
-
-            for idx, val in enumerate(sorted_unique_values):
-                if pd.notna(val):
-                    autofill_value = simple_mappings.get(val, "")
-                    unique_key = f"{col}_{val}_{idx}"
-                    if st.checkbox(f"Drop '{val}'", key=f"exclude_{unique_key}"):
-                        excluded_flow_nos[col].append(val)
-                        continue
-
-                    readable_val = st.text_input(f"Rename '{val}' to:", value=autofill_value, key=unique_key)
-                    if readable_val:
-                        all_mappings[val] = readable_val
-
-            if all_mappings:
-                keypress_mappings[col] = all_mappings
+        decoder_state = session_decoder_state(flow_no_index, simple_mappings, autofill_keypress=False)
+        render_decoder_page(flow_no_index, decoder_state)
+        keypress_mappings, excluded_flow_nos, drop_cols = decoder_settings(flow_no_index, decoder_state)
 
         if st.button("Decode Keypresses"):
-            if drop_cols:
-                renamed_data.drop(columns=drop_cols, inplace=True)
-            for col, col_mappings in keypress_mappings.items():
-                if col in renamed_data.columns:
-                    renamed_data[col] = renamed_data[col].map(col_mappings).fillna(renamed_data[col])
-                    for val_to_exclude in excluded_flow_nos.get(col, []):
-                        renamed_data = renamed_data[renamed_data[col] != val_to_exclude]
-
-            if 'IncomeRange' in renamed_data.columns:
-                income_group = renamed_data['IncomeRange'].apply(classify_income)
-                income_range_index = renamed_data.columns.get_loc('IncomeRange')
-                renamed_data.insert(income_range_index + 1, 'IncomeGroup', income_group)
+            with recording() as records:
+                renamed_data = decode_keypresses(renamed_data, keypress_mappings, excluded_flow_nos, drop_cols)
+                # IncomeGroup, Region and any configured derived columns
+                renamed_data = add_derived_columns(renamed_data)
+            store_performance("Decode keypresses", records)
 
             renamed_data = drop_duplicates_from_dataframe(renamed_data)
-            st.session_state['renamed_data'] = renamed_data
             st.markdown("### Decoded Data")
             st.write("Preview of Decoded Data:")
             st.dataframe(renamed_data)
 
             today = datetime.now()
             st.write(f'IVR count by Set as of {today.strftime("%d-%m-%Y").replace("-0", "-")}')
-            st.write(renamed_data['Set'].value_counts())
+            set_counts = renamed_data['Set'].value_counts()
+            st.dataframe(set_counts[set_counts > 0].rename_axis('Value').reset_index(name='Count'), hide_index=True)
+
+            # Reported on their own, since the sanity check below only covers the rows that are kept
+            null_counts = renamed_data.isna().sum()
+            if null_counts.any():
+                st.write("Null values per column before dropping incomplete rows:")
+                st.dataframe(null_counts[null_counts > 0].rename_axis('Column').reset_index(name='Nulls'), hide_index=True)
 
             renamed_data.dropna(inplace=True)
-            st.session_state['renamed_data'] = renamed_data
             st.write(f'No. of rows after dropping nulls: {len(renamed_data)} rows')
-            st.write(f'Preview of Total of Null Values per Column:')
-            st.write(renamed_data.isnull().sum())
 
+            # Profile the decoded data as stored and downloaded
+            profile = profile_columns(renamed_data)
+
+            # The decoded data replaces the renamed data; both names refer to the same frame
+            store_dataset('renamed', renamed_data)
+            store_dataset('decoded', renamed_data)
+            st.session_state['decoded_profile'] = {'version': st.session_state['decoded_version'], 'profile': profile}
+            st.session_state.setdefault('column_checks', {}).update(dict.fromkeys(profile['distributions'], True))
+
+        # The profile is cached with the decoded data version, so reruns only render it
+        decoded_profile = st.session_state.get('decoded_profile')
+        if 'decoded_data' in st.session_state and decoded_profile and decoded_profile['version'] == st.session_state.get('decoded_version'):
             st.markdown("### Sanity check for values in each column")
-            
-            # Initialize session state to track column checks if not already present
-            if 'column_checks' not in st.session_state:
-                st.session_state['column_checks'] = {}
-
-            # Function to run sanity checks
-            def run_sanity_check(index, col, data):
-                st.write(f"{index}: {col}")
-                value_counts = data[col].value_counts(normalize=True, dropna=False)
-                st.write(value_counts)
-
-            # Iterate through the columns with sequential numbering
-            for index, col in enumerate(renamed_data.columns, start=0):
-                if col != 'phonenum':
-                    run_sanity_check(index, col, renamed_data)
-                    # Update session state for the checked column
-                    st.session_state['column_checks'][col] = True
+            render_column_profile(decoded_profile['profile'])
 
+        # Keep the download section outside the button so changing the filename or format does not hide it
+        if 'decoded_data' in st.session_state:
+            st.markdown("### Download Decoded Data")
             formatted_date = datetime.now().strftime("%Y%m%d")
-            st.session_state['output_filename'] = f'IVR_Decoded_Data_v{formatted_date}.csv'
-            
-            def update_output_filename():
-                st.session_state['output_filename'] = st.session_state['output_filename_input'] + '.csv' if not st.session_state['output_filename_input'].lower().endswith('.csv') else st.session_state['output_filename_input']
-
-            st.text_input("Edit the filename for download", value=st.session_state['output_filename'], key='output_filename_input', on_change=update_output_filename)
-            data_as_csv = renamed_data.to_csv(index=False).encode('utf-8')
-            st.download_button("Download Decoded Data as CSV", data=data_as_csv, file_name=st.session_state['output_filename'], mime='text/csv')
+            export_format = st.radio("Download format", list(EXPORT_FORMATS), horizontal=True, key='decoded_export_format')
+            output_filename = st.text_input("Edit the filename for download", value=f'IVR_Decoded_Data_v{formatted_date}.csv', key='output_filename_input')
+            output_filename = with_extension(output_filename, export_format)
+            lazy_download_button('decoded', st.session_state['decoded_data'], export_format, f"Download Decoded Data as {export_format}", output_filename)
+
+        render_performance_panel()
     else:
         st.error("No renamed data found. Please go back to the previous step and rename your data first.")
 
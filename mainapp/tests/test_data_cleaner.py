@@ -0,0 +1,108 @@
+import os
+from io import BytesIO
+
+from modules import cache_utils, data_cleaner_utils_page1
+from modules.data_cleaner_utils_page1 import process_file, process_files, process_files_cached
+
+# A small dialer export: a report title on the first line, the header on the second,
+# and one field per answered FlowNo after UserKeyPress.
+SAMPLE_CSV = (
+    "Broadcast List Report for PETALING JAYA MANDARIN EVENING,,,,\n"
+    "No,PhoneNo,CallDate,Status,UserKeyPress\n"
+    "1,60123456789,2024-01-01,Answered,FlowNo_2=1,FlowNo_3=2\n"
+    "2,60123456780,2024-01-01,NoAnswer,\n"
+    "3,60123456781,2024-01-01,Answered,FlowNo_2=2,FlowNo_3=1\n"
+    "4,60123456782,2024-01-01,Answered,FlowNo_2=1\n"
+).encode()
+OTHER_CSV = SAMPLE_CSV.replace(b"6012345678", b"6019876543")
+
+def test_process_file_with_quoted_commas():
+    csv = (
+        "Broadcast List Report,,,,\n"
+        "No,PhoneNo,Status,UserKeyPress\n"
+        '1,60123456789,"Answered, ok",FlowNo_2=1,FlowNo_3=2\n'
+        "2,60123456780,NoAnswer,\n"
+        '3,60123456781,"Answered, ok, really",FlowNo_2=2,FlowNo_3=1\n'
+    ).encode()
+    df_complete, phonenum_list, total_calls_made, total_of_pickups, _, _ = process_file(BytesIO(csv))
+    assert (total_calls_made, total_of_pickups) == (3, 2)
+    assert df_complete.values.tolist() == [
+        ['60123456789', 'FlowNo_2=1', 'FlowNo_3=2', 'IVR'],
+        ['60123456781', 'FlowNo_2=2', 'FlowNo_3=1', 'IVR'],
+    ]
+
+def assert_same_results(result, expected):
+    df_complete, phonenum_list, total_calls_made, total_of_pickups, _, rejections = result
+    assert df_complete.reset_index(drop=True).equals(expected[0].reset_index(drop=True))
+    assert phonenum_list.reset_index(drop=True).equals(expected[1].reset_index(drop=True))
+    assert (total_calls_made, total_of_pickups, rejections) == (expected[2], expected[3], expected[5])
+
+def test_chunked_process_file_matches_whole_file():
+    header = "Broadcast List Report,,,,\nNo,PhoneNo,CallDate,Status,UserKeyPress\n"
+    files = [
+        # The only answered call comes first, so later chunks hold narrower rows
+        header + "1,60123456789,d,Answered,FlowNo_2=1,FlowNo_3=2\n2,60123456780,d,NoAnswer,\n3,60123456781,d,NoAnswer,\n",
+        # An unnamed column without any data is dropped from every chunk
+        header + "1,60123456789,d,Answered,FlowNo_2=1,,FlowNo_4=2\n2,60123456780,d,NoAnswer,\n3,60123456781,d,Answered,FlowNo_2=2,,FlowNo_4=1\n",
+    ]
+    for csv in files:
+        for newline in ("\n", "\r\n"):
+            data = csv.replace("\n", newline).encode()
+            expected = process_file(BytesIO(data))
+            for chunksize in (1, 2, 10):
+                assert_same_results(process_file(BytesIO(data), chunksize=chunksize), expected)
+
+def test_process_files_matches_process_file(monkeypatch, tmp_path):
+    monkeypatch.setattr(data_cleaner_utils_page1, 'SPOOL_DIR', str(tmp_path))
+    uploads = [BytesIO(SAMPLE_CSV), BytesIO(OTHER_CSV)]
+    # Spawned worker processes clean the spooled copies of the uploads
+    results = dict(process_files(uploads, max_workers=2))
+
+    assert sorted(results) == [0, 1]
+    for position, csv in enumerate([SAMPLE_CSV, OTHER_CSV]):
+        assert_same_results(results[position], process_file(BytesIO(csv)))
+    # The uploads are closed once spooled and the spool files removed afterwards
+    assert all(upload.closed for upload in uploads)
+    assert os.listdir(tmp_path) == []
+
+def test_process_files_cached_hits_after_a_miss(monkeypatch, tmp_path):
+    monkeypatch.setattr(cache_utils, 'CACHE_DIR', str(tmp_path))
+    expected = process_file(BytesIO(SAMPLE_CSV))
+
+    [(_, result, cache_hit)] = process_files_cached([BytesIO(SAMPLE_CSV)], max_workers=1)
+    assert not cache_hit
+    assert_same_results(result, expected)
+
+    [(_, result, cache_hit)] = process_files_cached([BytesIO(SAMPLE_CSV)], max_workers=1)
+    assert cache_hit
+    assert_same_results(result, expected)
+
+def test_cache_version_bump_invalidates_entries(monkeypatch, tmp_path):
+    monkeypatch.setattr(cache_utils, 'CACHE_DIR', str(tmp_path))
+    list(process_files_cached([BytesIO(SAMPLE_CSV)], max_workers=1))
+    [digest] = os.listdir(tmp_path)
+
+    monkeypatch.setattr(cache_utils, 'CACHE_VERSION', cache_utils.CACHE_VERSION + 1)
+    assert cache_utils.load_cached_result(digest) is None
+    assert os.listdir(tmp_path) == []
+    [(_, _, cache_hit)] = process_files_cached([BytesIO(SAMPLE_CSV)], max_workers=1)
+    assert not cache_hit
+    assert cache_utils.load_cached_result(digest) is not None
+
+def test_process_file_deduplicates_normalized_phone_numbers():
+    csv = (
+        "Broadcast List Report,,,,\n"
+        "No,PhoneNo,CallDate,Status,UserKeyPress\n"
+        "1,0123456789,d,Answered,FlowNo_2=1,FlowNo_3=2\n"
+        "2,123456789,d,Answered,FlowNo_2=2,FlowNo_3=1\n"
+        "3,+60 12-345 6789,d,NoAnswer,\n"
+        "4,60123456780,d,Answered,FlowNo_2=1,FlowNo_3=1\n"
+    ).encode()
+    for chunksize in (None, 1):
+        df_complete, _, total_calls_made, total_of_pickups, _, _ = process_file(BytesIO(csv), chunksize=chunksize)
+        # The first three rows are one respondent; only its first call is kept
+        assert df_complete.values.tolist() == [
+            ['60123456789', 'FlowNo_2=1', 'FlowNo_3=2', 'IVR'],
+            ['60123456780', 'FlowNo_2=1', 'FlowNo_3=1', 'IVR'],
+        ]
+        assert (total_calls_made, total_of_pickups) == (2, 2)
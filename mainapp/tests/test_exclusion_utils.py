@@ -0,0 +1,39 @@
+import sqlite3
+
+import numpy as np
+import pandas as pd
+
+from modules.exclusion_utils import add_dialed_numbers, exclude_dialed_numbers, exclusion_store_stats, load_exclusion_index
+
+def test_add_dialed_numbers(tmp_path):
+    db_path = str(tmp_path / 'dialed_numbers.db')
+    assert add_dialed_numbers(np.array([60123456789, 60123456780]), 'Campaign A', db_path) == 2
+    # Numbers already in the store are skipped and keep their first campaign
+    assert add_dialed_numbers(np.array([60123456780, 60123456781]), 'Campaign B', db_path) == 1
+
+    assert load_exclusion_index(db_path).tolist() == [60123456780, 60123456781, 60123456789]
+    assert exclusion_store_stats(db_path) == (3, 2)
+
+def test_exclude_dialed_numbers(tmp_path):
+    db_path = str(tmp_path / 'dialed_numbers.db')
+    add_dialed_numbers(np.array([60123456789, 60123456780]), 'Campaign A', db_path)
+    sample_df = pd.DataFrame({'Phone': ['0123456789', '+60 12-345 6781', 'unknown', '60123456780']})
+
+    kept_df, excluded_count, invalid_count = exclude_dialed_numbers(sample_df, 'Phone', db_path)
+    assert kept_df['Phone'].tolist() == ['+60 12-345 6781', 'unknown']
+    assert (excluded_count, invalid_count) == (2, 1)
+
+def test_exclusion_store_stats_of_an_older_store(tmp_path):
+    db_path = str(tmp_path / 'dialed_numbers.db')
+    conn = sqlite3.connect(db_path)
+    with conn:
+        conn.execute("CREATE TABLE dialed_numbers (phonenum INTEGER PRIMARY KEY, campaign TEXT, added_on TEXT)")
+        conn.executemany("INSERT INTO dialed_numbers VALUES (?, ?, '2024-01-01')",
+                         [(60123456789, 'Campaign A'), (60123456780, 'Campaign A'), (60123456781, 'Campaign B')])
+    conn.close()
+
+    # The campaign counts are filled from the numbers already stored
+    assert exclusion_store_stats(db_path) == (3, 2)
+    add_dialed_numbers(np.array([60123456782]), 'Campaign B', db_path)
+    assert exclusion_store_stats(db_path) == (4, 2)
+    assert exclusion_store_stats(str(tmp_path / 'empty.db')) == (0, 0)
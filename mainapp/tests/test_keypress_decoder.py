@@ -0,0 +1,72 @@
+import numpy as np
+import pandas as pd
+import streamlit as st
+from streamlit.testing.v1 import AppTest
+
+from modules.keypress_decoder_utils_page3 import decode_keypresses
+
+def recording_editor(data, key, **kwargs):
+    # Stands in for st.data_editor: records the data the grid is shown with and,
+    # like the real widget, returns that data with every edit made so far
+    st.session_state.setdefault('editor_data', []).append(data.copy())
+    edited = data.copy()
+    for row, answer in st.session_state.get('edits', {}).items():
+        edited.loc[row, 'Answer'] = answer
+    st.session_state[key] = {'edited_rows': st.session_state.get('edits', {})}
+    return edited
+
+def decoder_script():
+    import streamlit as st
+    from modules import keypress_decoder_utils_page3 as decoder
+
+    flow_no_index = {'question_columns': ['Gender'], 'values': {'Gender': ['FlowNo_2=1', 'FlowNo_2=2']}}
+    state = decoder.session_decoder_state(flow_no_index, {'FlowNo_2=1': 'Male', 'FlowNo_2=2': 'Female'})
+    decoder.render_decoder_page(flow_no_index, state)
+    st.session_state['settings'] = decoder.decoder_settings(flow_no_index, state)
+
+def test_decoder_keeps_successive_edits(monkeypatch):
+    monkeypatch.setattr(st, 'data_editor', recording_editor)
+    at = AppTest.from_function(decoder_script).run()
+    at.session_state['edits'] = {0: 'Lelaki'}
+    at.run()
+    at.session_state['edits'] = {0: 'Lelaki', 1: 'Perempuan'}
+    at.run()
+    assert not at.exception
+
+    # The grid is shown with the same data on every run, so its edits are not reset
+    editor_data = at.session_state['editor_data']
+    assert len(editor_data) == 3
+    assert all(data.equals(editor_data[0]) for data in editor_data)
+    keypress_mappings, _, _ = at.session_state['settings']
+    assert keypress_mappings == {'Gender': {'FlowNo_2=1': 'Lelaki', 'FlowNo_2=2': 'Perempuan'}}
+
+def legacy_decode(df, keypress_mappings, excluded_flow_nos, drop_cols):
+    # The per-row decoding the decoder pages ran before decode_keypresses
+    df = df.drop(columns=drop_cols)
+    for col, col_mappings in keypress_mappings.items():
+        if col in df.columns:
+            df[col] = df[col].map(col_mappings).fillna(df[col])
+            for val_to_exclude in excluded_flow_nos.get(col, []):
+                df = df[df[col] != val_to_exclude]
+    return df
+
+def test_decode_keypresses_matches_per_row_mapping():
+    df = pd.DataFrame({
+        'phonenum': ['601', '602', '603', '604', '605', '606'],
+        'Gender': ['FlowNo_2=1', 'FlowNo_2=2', 'FlowNo_2=1', 'FlowNo_2=3', 'FlowNo_2=2', np.nan],
+        'Age': ['FlowNo_3=1', 'FlowNo_3=2', 'FlowNo_3=5', 'FlowNo_3=1', 'FlowNo_3=4', 'FlowNo_3=3'],
+        'Race': ['FlowNo_4=1'] * 6,
+        'Set': ['IVR'] * 6,
+    })
+    keypress_mappings = {
+        'Gender': {'FlowNo_2=1': 'Male', 'FlowNo_2=2': 'Female'},
+        # Two keypresses share an answer; FlowNo_3=5 is left unmapped
+        'Age': {'FlowNo_3=1': '18-30', 'FlowNo_3=2': '31 and above', 'FlowNo_3=3': '31 and above'},
+    }
+    excluded_flow_nos = {'Gender': ['FlowNo_2=3'], 'Age': ['FlowNo_3=4']}
+
+    decoded = decode_keypresses(df, keypress_mappings, excluded_flow_nos, ['Race'])
+    expected = legacy_decode(df, keypress_mappings, excluded_flow_nos, ['Race'])
+    assert decoded.astype(object).equals(expected.astype(object))
+    assert decoded['Age'].tolist() == ['18-30', '31 and above', 'FlowNo_3=5', '31 and above']
+    assert list(decoded['Age'].cat.categories) == ['18-30', '31 and above', 'FlowNo_3=5']